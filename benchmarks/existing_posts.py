@@ -0,0 +1,73 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from mdfb.utils.database import check_post_exists, create_db, get_existing_posts
+
+def measure_existing_posts(num_rows: int = 1_000_000, page_size: int = 100) -> dict:
+    """
+    measure_existing_posts: checks a page of records against a database of downloaded posts, as --update does for each page it
+    lists, with one query per record through check_post_exists() and one query per page through get_existing_posts(). Half of the
+    page is already downloaded.
+
+    Args:
+        num_rows (optional, default=1_000_000, int): number of downloaded posts in the database
+        page_size (optional, default=100, int): number of records in the page
+
+    Returns:
+        dict: the settings, and the queries made and time taken for each way of checking the page
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        create_db(directory)
+        con = sqlite3.connect(os.path.join(directory, "mdfb.db"))
+        cur = con.cursor()
+        cur.executemany("INSERT INTO downloaded_posts (user_did, user_post_uri, feed_type, poster_post_uri) VALUES (?, ?, ?, ?)", (
+            ("did:plc:user", f"at://did:plc:user/app.bsky.feed.like/{i}", "like", f"at://did:plc:author/app.bsky.feed.post/{i}") for i in range(num_rows)
+        ))
+        con.commit()
+        page = [f"at://did:plc:user/app.bsky.feed.like/{i}" for i in range(num_rows - page_size // 2, num_rows + page_size - page_size // 2)]
+
+        queries = []
+        con.set_trace_callback(queries.append)
+        start = time.perf_counter()
+        per_record = {uri for uri in page if check_post_exists(cur, "did:plc:user", uri, "like")}
+        per_record_time = time.perf_counter() - start
+        per_record_queries = len(queries)
+
+        queries.clear()
+        start = time.perf_counter()
+        per_page = get_existing_posts(cur, "did:plc:user", page, "like")
+        per_page_time = time.perf_counter() - start
+        per_page_queries = len(queries)
+        con.close()
+
+    assert per_page == per_record
+    return {
+        "rows": num_rows,
+        "page_size": page_size,
+        "existing": len(per_page),
+        "per_record_queries": per_record_queries,
+        "per_record_ms": round(per_record_time * 1000, 2),
+        "per_page_queries": per_page_queries,
+        "per_page_ms": round(per_page_time * 1000, 2)
+    }
+
+def main():
+    parser = ArgumentParser(description="Measure checking a page of records against the downloaded posts, one query per record against one query per page")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of downloaded posts in the database, default of 1000000")
+    parser.add_argument("--page-size", type=int, default=100, help="Number of records in the page, default of 100")
+    parser.add_argument("--output", "-o", help="File the results are written to")
+    args = parser.parse_args()
+
+    result = measure_existing_posts(args.rows, args.page_size)
+    print(f"{result['rows']} rows, per record: {result['per_record_queries']} queries in {result['per_record_ms']:.2f}ms, per page: {result['per_page_queries']} queries in {result['per_page_ms']:.2f}ms")
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(result, file, indent=4)
+        print(f"Results written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
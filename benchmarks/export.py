@@ -0,0 +1,82 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from mdfb.core.export import export_posts, post_row
+
+def _response(index: int) -> dict:
+    uri = f"at://did:plc:author/app.bsky.feed.post/rkey{index}"
+    return {
+        "user_did": "did:plc:user",
+        "user_post_uri": [f"at://did:plc:user/app.bsky.feed.like/{index}"],
+        "feed_type": ["like"],
+        "poster_post_uri": uri,
+        "uri": uri,
+        "author": {"did": "did:plc:author", "handle": "author.bsky.social", "display_name": "Author"},
+        "record": {
+            "text": f"post {index}",
+            "created_at": "2025-01-01T00:00:00.000Z",
+            "embed": {"images": [{"image": {"ref": {"link": f"cid{index}"}, "mime_type": "image/jpeg"}}]} if index % 2 else None
+        }
+    }
+
+def measure_export_query(num_posts: int = 5000) -> dict:
+    """
+    measure_export_query: counts the image posts of an archive of JSON files, once by reading every file and once by querying an
+    SQLite export of the archive. Half of the posts have an image.
+
+    Args:
+        num_posts (optional, default=5000, int): number of posts in the archive
+
+    Returns:
+        dict: the settings, the time taken to export the archive and the time taken by each count
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(num_posts):
+            with open(os.path.join(directory, f"rkey{i}.json"), "wt") as file:
+                json.dump(_response(i), file, indent=4)
+        path = os.path.join(directory, "export.db")
+        start = time.perf_counter()
+        export_posts(directory, path)
+        export_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        from_files = 0
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name)) as file:
+                    from_files += "image" in post_row(json.load(file))["media_type"]
+        files_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        con = sqlite3.connect(path)
+        from_export = con.execute("SELECT COUNT(*) FROM posts WHERE media_type LIKE '%image%'").fetchone()[0]
+        con.close()
+        query_time = time.perf_counter() - start
+
+    assert from_files == from_export
+    return {
+        "posts": num_posts,
+        "export_ms": round(export_time * 1000, 2),
+        "files_ms": round(files_time * 1000, 2),
+        "query_ms": round(query_time * 1000, 2)
+    }
+
+def main():
+    parser = ArgumentParser(description="Measure counting the image posts of an archive, by reading every JSON file against querying its export")
+    parser.add_argument("--posts", type=int, default=5000, help="Number of posts in the archive, default of 5000")
+    parser.add_argument("--output", "-o", help="File the results are written to")
+    args = parser.parse_args()
+
+    result = measure_export_query(args.posts)
+    print(f"{result['posts']} posts, files: {result['files_ms']:.2f}ms, export query: {result['query_ms']:.2f}ms, exported in {result['export_ms']:.2f}ms")
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(result, file, indent=4)
+        print(f"Results written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
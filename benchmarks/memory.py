@@ -0,0 +1,78 @@
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import nullcontext
+
+from benchmarks.mock_server import MockServer
+from benchmarks.run import DID, local_network
+from mdfb import mdfb
+from mdfb.core.get_post_identifiers import get_post_identifiers
+from mdfb.core.post_record import spill_responses
+from mdfb.utils.clients import close_clients
+from mdfb.utils.constants import DEFAULT_HYDRATE_THREADS
+
+def measure_post_details(posts: int = 100_000, images: int = 1, low_memory: bool = False, threads: int = DEFAULT_HYDRATE_THREADS) -> dict:
+    """
+    measure_post_details: fetches the post details of the likes of an account from a local MockServer with process_posts(), as the
+    sequential download does before downloading, and measures the memory they hold once fetched. Memory is traced with tracemalloc
+    from after the listing, so only the post details and what the fetch leaves behind are counted.
+
+    Args:
+        posts (optional, default=100_000, int): number of likes of the account
+        images (optional, default=1, int): number of images in each post
+        low_memory (optional, default=False, bool): fetch as with --low-memory, keeping a PostRecord of each post
+        threads (optional, default=DEFAULT_HYDRATE_THREADS, int): threads fetching post details
+
+    Returns:
+        dict: the settings, the memory held by the post details and the peak traced while fetching them, in MiB and bytes per post
+    """
+    server = MockServer(posts, images).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as directory, local_network(server, data_dir):
+            identifiers = get_post_identifiers(DID, "like", archive=True)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                start = time.perf_counter()
+                with spill_responses(directory) if low_memory else nullcontext():
+                    post_details = mdfb.process_posts(identifiers, threads)
+                    seconds = time.perf_counter() - start
+                    gc.collect()
+                    held, peak = tracemalloc.get_traced_memory()
+                    # the spilled responses still read back whole
+                    assert post_details[-1]["response"]["uri"] == post_details[-1]["poster_post_uri"]
+            finally:
+                tracemalloc.stop()
+    finally:
+        server.stop()
+        close_clients()
+    return {
+        "posts": len(post_details),
+        "images": images,
+        "low_memory": low_memory,
+        "seconds": round(seconds, 2),
+        "held_mb": round(held / (1024 * 1024), 2),
+        "held_bytes_per_post": round(held / len(post_details)) if post_details else 0,
+        "peak_mb": round(peak / (1024 * 1024), 2)
+    }
+
+def main():
+    parser = ArgumentParser(description="Measure the memory held by the post details of an account, with and without --low-memory")
+    parser.add_argument("--posts", type=int, default=100_000, help="Number of likes of the account, default of 100000")
+    parser.add_argument("--images", type=int, default=1, help="Number of images in each post, default of 1")
+    parser.add_argument("--output", "-o", help="File the results are written to")
+    args = parser.parse_args()
+
+    results = [measure_post_details(args.posts, args.images, low_memory) for low_memory in [False, True]]
+    for result in results:
+        print(f"{'--low-memory' if result['low_memory'] else 'default'}: {result['posts']} posts hold {result['held_mb']:.1f} MiB ({result['held_bytes_per_post']} bytes/post), peak {result['peak_mb']:.1f} MiB, fetched in {result['seconds']:.1f}s")
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(results, file, indent=4)
+        print(f"Results written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
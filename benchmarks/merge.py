@@ -0,0 +1,51 @@
+import json
+import time
+from argparse import ArgumentParser
+
+from mdfb.core.fetch_post_details import _merge_uri_chunk_to_records
+
+def measure_merge(num_uris: int = 10_000) -> dict:
+    """
+    measure_merge: merges a getPosts response into its post identifiers, through the exact-URI index of _merge_uri_chunk_to_records()
+    and through the nested scan it replaced. The posts are returned in reverse, so the nested scan is at its worst.
+
+    Args:
+        num_uris (optional, default=10_000, int): number of post identifiers, and posts in the response
+
+    Returns:
+        dict: the settings and the time taken by each merge
+    """
+    # the rkeys are fixed width so the substring match of the nested scan finds the same posts
+    uri_chunk = [{"user_did": "did:plc:user", "user_post_uri": [f"like{i}"], "feed_type": ["like"], "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/{i:06d}"} for i in range(num_uris)]
+    records = {"posts": [{"uri": uris["poster_post_uri"], "record": {}} for uris in reversed(uri_chunk)]}
+
+    start = time.perf_counter()
+    indexed = _merge_uri_chunk_to_records(uri_chunk, records)
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nested = [{**uris, **post} for uris in uri_chunk for post in records["posts"] if uris["poster_post_uri"] in post["uri"]]
+    nested_time = time.perf_counter() - start
+
+    assert indexed == nested
+    return {
+        "uris": num_uris,
+        "indexed_ms": round(indexed_time * 1000, 2),
+        "nested_ms": round(nested_time * 1000, 2)
+    }
+
+def main():
+    parser = ArgumentParser(description="Measure merging a getPosts response into its post identifiers, through an index against a nested scan")
+    parser.add_argument("--uris", type=int, default=10_000, help="Number of post identifiers, default of 10000")
+    parser.add_argument("--output", "-o", help="File the results are written to")
+    args = parser.parse_args()
+
+    result = measure_merge(args.uris)
+    print(f"{result['uris']} URIs, nested: {result['nested_ms']:.2f}ms, indexed: {result['indexed_ms']:.2f}ms")
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(result, file, indent=4)
+        print(f"Results written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_RKEY_WIDTH = 13
+_WRITE_SIZE = 64 * 1024 # in bytes
+AUTHOR_DIDS = [f"did:plc:author{n}" for n in range(10)]
+
+class MockServer:
+    """
+    MockServer: a local stand-in for the XRPC endpoints mdfb downloads from: com.atproto.repo.listRecords, app.bsky.feed.getPosts
+    and com.atproto.sync.getBlob. Every account has `posts` records in each collection, and every post has `images` images of
+    `blob_size` bytes. Latency, server errors and 429s can be added to every response to see how the stages cope with them. Runs
+    on its own threads until stopped, and counts the requests and bytes it serves.
+
+    Args:
+        posts (optional, default=1000, int): number of records listed for each account and collection
+        images (optional, default=1, int): number of images embedded in each post, posts are text only when 0
+        blob_size (optional, default=64 * 1024, int): in bytes, the size of every image
+        latency (optional, default=0, float): in seconds, added before every response
+        error_rate (optional, default=0, float): fraction of requests answered with a 500
+        rate_limit_rate (optional, default=0, float): fraction of requests answered with a 429
+        retry_after (optional, default=0.5, float): in seconds, the Retry-After sent with every 429
+        seed (optional, default=0, int): seed of the random errors, so runs with the same settings fail the same requests
+    """
+    def __init__(self, posts: int = 1000, images: int = 1, blob_size: int = 64 * 1024, latency: float = 0, error_rate: float = 0, rate_limit_rate: float = 0, retry_after: float = 0.5, seed: int = 0):
+        self.posts = posts
+        self.images = images
+        self.blob_size = blob_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.bytes_sent = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mdfb-mock-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def stats(self) -> dict:
+        """
+        stats: the requests and bytes served so far, subtract two of these to get the traffic of a stage
+
+        Returns:
+            dict: requests by endpoint, responses by status code and the number of bytes of response bodies sent
+        """
+        with self.lock:
+            return {"requests": dict(self.requests), "statuses": dict(self.statuses), "bytes": self.bytes_sent}
+
+    def list_records(self, repo: str, collection: str, limit: int, cursor: str = None) -> dict:
+        start = int(cursor) + 1 if cursor else 0
+        records = []
+        for i in range(start, min(start + limit, self.posts)):
+            rkey = f"{i:0{_RKEY_WIDTH}d}"
+            uri = f"at://{repo}/{collection}/{rkey}"
+            if collection == "app.bsky.feed.post":
+                value = self._post_record(rkey)
+            else:
+                value = {
+                    "$type": collection,
+                    "subject": {"uri": f"at://{AUTHOR_DIDS[i % len(AUTHOR_DIDS)]}/app.bsky.feed.post/{rkey}", "cid": _cid("bafyrei", rkey)},
+                    "createdAt": "2025-01-01T00:00:00.000Z"
+                }
+            records.append({"uri": uri, "cid": _cid("bafyrei", rkey), "value": value})
+        response = {"records": records}
+        if records and start + limit < self.posts:
+            response["cursor"] = records[-1]["uri"].rsplit("/", 1)[1]
+        return response
+
+    def get_posts(self, uris: list[str]) -> dict:
+        posts = []
+        for uri in uris:
+            did, rkey = re.match(r"^at://([^/]+)/app\.bsky\.feed\.post/(\w+)$", uri).groups()
+            posts.append({
+                "uri": uri,
+                "cid": _cid("bafyrei", rkey),
+                "author": {"did": did, "handle": f"{did.rsplit(':', 1)[1]}.test", "displayName": "Benchmark"},
+                "record": self._post_record(rkey),
+                "indexedAt": "2025-01-01T00:00:00.000Z"
+            })
+        return {"posts": posts}
+
+    def _post_record(self, rkey: str) -> dict:
+        record = {"$type": "app.bsky.feed.post", "text": f"post {rkey}", "createdAt": "2025-01-01T00:00:00.000Z"}
+        if self.images:
+            record["embed"] = {"$type": "app.bsky.embed.images", "images": [
+                {"alt": "", "image": {"$type": "blob", "ref": {"$link": _cid("bafkrei", f"{rkey}x{n}")}, "mimeType": "image/jpeg", "size": self.blob_size}}
+                for n in range(self.images)
+            ]}
+        return record
+
+    def _record(self, endpoint: str, status: int, size: int):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.statuses[status] += 1
+            self.bytes_sent += size
+
+    def _roll(self) -> int:
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.error_rate:
+            return 500
+        if roll < self.error_rate + self.rate_limit_rate:
+            return 429
+        return 200
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        status = mock._roll()
+        if status == 429:
+            self._send_json(endpoint, 429, {"error": "RateLimitExceeded", "message": "Rate Limit Exceeded"}, {"Retry-After": str(mock.retry_after)})
+            return
+        if status == 500:
+            self._send_json(endpoint, 500, {"error": "InternalServerError", "message": "Internal Server Error"})
+            return
+
+        if endpoint == "com.atproto.repo.listRecords":
+            body = mock.list_records(params["repo"][0], params["collection"][0], int(params.get("limit", ["50"])[0]), params.get("cursor", [None])[0])
+            self._send_json(endpoint, 200, body)
+        elif endpoint == "app.bsky.feed.getPosts":
+            self._send_json(endpoint, 200, mock.get_posts(params.get("uris", [])))
+        elif endpoint == "com.atproto.sync.getBlob":
+            self._send_blob(endpoint, mock.blob_size)
+        else:
+            self._send_json(endpoint, 404, {"error": "MethodNotImplemented", "message": f"Unknown endpoint: {url.path}"})
+
+    def _send_json(self, endpoint: str, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.mock._record(endpoint, status, len(data))
+
+    def _send_blob(self, endpoint: str, size: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        chunk = b"\0" * min(size, _WRITE_SIZE)
+        remaining = size
+        while remaining > 0:
+            self.wfile.write(chunk[:remaining])
+            remaining -= len(chunk)
+        self.server.mock._record(endpoint, 200, size)
+
+    def log_message(self, format, *args):
+        pass
+
+def _cid(prefix: str, key: str) -> str:
+    return f"{prefix}{re.sub(r'[^a-z0-9]', '', key.lower())}"
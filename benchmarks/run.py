@@ -0,0 +1,256 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import psutil
+
+from benchmarks.mock_server import AUTHOR_DIDS, MockServer
+from mdfb import mdfb
+from mdfb.core import download_blobs, fetch_post_details, get_post_identifiers
+from mdfb.core.resolve_pds import clear_pds_cache
+from mdfb.utils.clients import close_clients
+from mdfb.utils.database import close_db, connect_db, insert_pds
+from mdfb.utils.rate_limiter import get_rate_limiter
+from mdfb.utils.report import REPORT_PREFIX
+from mdfb.utils.validation import validate_database, validate_download
+
+DID = "did:plc:benchmark"
+# the sequential path runs one stage after another, so each one is measured on its own
+STAGES = {
+    "fetch_posts": "get_post_identifiers",
+    "process_posts": "fetch_post_details",
+    "download_posts": "download_blobs",
+    "download_posts_async": "download_blobs"
+}
+
+class StageRecorder:
+    """
+    StageRecorder: times each stage of a download and records the traffic the mock server saw and the peak RSS of the process while
+    it ran. RSS is sampled on a background thread every `interval` seconds.
+
+    Args:
+        server (MockServer): the server the download is sent to
+        interval (optional, default=0.01, float): in seconds, time between RSS samples
+    """
+    def __init__(self, server: MockServer, interval: float = 0.01):
+        self.server = server
+        self.interval = interval
+        self.process = psutil.Process()
+        self.stages = {}
+        self.current = None
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name="mdfb-benchmark-rss", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    @contextmanager
+    def stage(self, name: str):
+        start_stats = self.server.stats()
+        self.peak_rss = self.process.memory_info().rss
+        self.current = name
+        start = time.perf_counter()
+        result = {}
+        try:
+            yield result
+        finally:
+            seconds = time.perf_counter() - start
+            self.current = None
+            self.stages[name] = _stage_result(name, seconds, result.get("posts", 0), start_stats, self.server.stats(), self.peak_rss)
+
+    def wrap(self, func, name: str):
+        def wrapped(*args, **kwargs):
+            with self.stage(name) as result:
+                res = func(*args, **kwargs)
+                # the download stages return nothing, they are given the number of posts instead
+                result["posts"] = len(res) if res is not None else args[1]
+                return res
+        return wrapped
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            if self.current:
+                self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+def run_benchmark(directory: str, posts: int = 1000, images: int = 1, blob_size: int = 64 * 1024, latency: float = 0, error_rate: float = 0, rate_limit_rate: float = 0, threads: int = None, pipeline: bool = False, engine: str = "thread", throttle: bool = False, low_memory: bool = False) -> dict:
+    """
+    run_benchmark: archives the likes of an account from a local MockServer through the real handle_download(), and measures each
+    stage. The database is kept in a temporary directory, so the run starts from nothing and leaves the real database untouched.
+
+    Args:
+        directory (str): the download directory
+        posts (optional, default=1000, int): number of likes of the account
+        images (optional, default=1, int): number of images in each post
+        blob_size (optional, default=64 * 1024, int): in bytes, the size of every image
+        latency (optional, default=0, float): in seconds, added to every response
+        error_rate (optional, default=0, float): fraction of requests answered with a 500
+        rate_limit_rate (optional, default=0, float): fraction of requests answered with a 429
+        threads (optional, default=None, int): threads of every stage, the defaults of mdfb when None
+        pipeline (optional, default=False, bool): run the stages at the same time with --pipeline, measured as a single stage
+        engine (optional, default="thread", str): engine used for downloading, thread or async
+        throttle (optional, default=False, bool): keep the default rate limit of mdfb, instead of lifting it to measure mdfb itself
+        low_memory (optional, default=False, bool): download with --low-memory
+
+    Returns:
+        dict: the settings of the run, and the results of each stage and of the whole run
+    """
+    argv = ["download", "--did", DID, "--like", "--archive", "--engine", engine, directory]
+    if threads:
+        argv += ["--threads", str(threads)]
+    if pipeline:
+        argv.append("--pipeline")
+    if low_memory:
+        argv.append("--low-memory")
+    server = MockServer(posts, images, blob_size, latency, error_rate, rate_limit_rate).start()
+    recorder = StageRecorder(server)
+    recorder.start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir, local_network(server, data_dir, throttle), ExitStack() as stack:
+            if not pipeline:
+                for func_name, stage in STAGES.items():
+                    stack.enter_context(patch.object(mdfb, func_name, recorder.wrap(getattr(mdfb, func_name), stage)))
+            parser = mdfb.make_parser()
+            args = parser.parse_args(argv)
+            validate_download(args, parser)
+            with recorder.stage("total") as result:
+                mdfb.handle_download(args, parser)
+                close_db()
+                result["posts"] = _count_downloaded(directory)
+    finally:
+        recorder.stop()
+        server.stop()
+        close_clients()
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            "posts": posts,
+            "images": images,
+            "blob_size": blob_size,
+            "latency": latency,
+            "error_rate": error_rate,
+            "rate_limit_rate": rate_limit_rate,
+            "threads": threads,
+            "pipeline": pipeline,
+            "engine": engine,
+            "throttle": throttle,
+            "low_memory": low_memory
+        },
+        "stages": recorder.stages
+    }
+
+def compare(previous: dict, current: dict) -> list[str]:
+    """
+    compare: describes the change in throughput of every stage between two benchmark results
+
+    Args:
+        previous (dict): results of the earlier run, from run_benchmark()
+        current (dict): results of the later run, from run_benchmark()
+
+    Returns:
+        list[str]: a line for each stage in both results
+    """
+    lines = []
+    for name, stage in current["stages"].items():
+        before = previous["stages"].get(name)
+        if not before or not before["posts_per_second"]:
+            continue
+        change = (stage["posts_per_second"] - before["posts_per_second"]) / before["posts_per_second"] * 100
+        lines.append(f"{name}: {before['posts_per_second']:.1f} -> {stage['posts_per_second']:.1f} posts/s ({change:+.1f}%)")
+    return lines
+
+@contextmanager
+def local_network(server: MockServer, data_dir: str, throttle: bool = False):
+    # every host mdfb talks to is pointed at the mock server, and the database at a directory of its own
+    limiter = get_rate_limiter()
+    with patch("platformdirs.user_data_path", return_value=Path(data_dir)), \
+        patch("platformdirs.user_data_dir", return_value=data_dir), \
+        patch.object(get_post_identifiers, "PDS_URL", server.url), \
+        patch.object(fetch_post_details, "APPVIEW_URL", server.url), \
+        patch.object(download_blobs, "PDS_URL", server.url), \
+        patch.object(limiter, "buckets", {}), \
+        patch.object(limiter, "rate", limiter.rate if throttle else 1_000_000), \
+        patch.object(limiter, "burst", limiter.burst if throttle else 1_000_000):
+        # PDSes resolved in an earlier run of the process point at its server
+        clear_pds_cache()
+        validate_database()
+        con = connect_db()
+        for did in [DID, *AUTHOR_DIDS]:
+            insert_pds(con.cursor(), did, server.url, time.time())
+        con.commit()
+        try:
+            yield
+        finally:
+            close_db()
+
+def _stage_result(name: str, seconds: float, posts: int, start_stats: dict, end_stats: dict, peak_rss: int) -> dict:
+    requests = {endpoint: count - start_stats["requests"].get(endpoint, 0) for endpoint, count in end_stats["requests"].items()}
+    statuses = {str(status): count - start_stats["statuses"].get(status, 0) for status, count in end_stats["statuses"].items()}
+    num_bytes = end_stats["bytes"] - start_stats["bytes"]
+    return {
+        "seconds": round(seconds, 4),
+        "posts": posts,
+        "posts_per_second": round(posts / seconds, 2) if seconds else 0,
+        "bytes": num_bytes,
+        "bytes_per_second": round(num_bytes / seconds, 2) if seconds else 0,
+        "requests": {endpoint: count for endpoint, count in requests.items() if count},
+        "statuses": {status: count for status, count in statuses.items() if count},
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 2)
+    }
+
+def _count_downloaded(directory: str) -> int:
+    return sum(1 for name in os.listdir(directory) if name.endswith(".json") and not name.startswith(REPORT_PREFIX))
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = ArgumentParser(description="Benchmark mdfb against a local mock of the AT Protocol endpoints it downloads from")
+    parser.add_argument("--posts", type=int, default=1000, help="Number of likes of the account, default of 1000")
+    parser.add_argument("--images", type=int, default=1, help="Number of images in each post, default of 1")
+    parser.add_argument("--blob-size", type=int, default=64 * 1024, help="Size of every image in bytes, default of 65536")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--threads", "-t", type=int, help="Number of threads for every stage, the defaults of mdfb when not given")
+    parser.add_argument("--pipeline", action="store_true", help="Run the stages at the same time with --pipeline")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread", help="Engine used for downloading")
+    parser.add_argument("--throttle", action="store_true", help="Keep the default rate limit of mdfb")
+    parser.add_argument("--low-memory", action="store_true", help="Download with --low-memory")
+    parser.add_argument("--output", "-o", default="benchmark-results.json", help="File the results are written to, default of benchmark-results.json")
+    parser.add_argument("--compare", help="Results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmark(directory, args.posts, args.images, args.blob_size, args.latency, args.error_rate, args.rate_limit_rate, args.threads, args.pipeline, args.engine, args.throttle, args.low_memory)
+    with open(args.output, "wt") as file:
+        json.dump(results, file, indent=4)
+
+    for name, stage in results["stages"].items():
+        print(f"{name}: {stage['posts']} posts in {stage['seconds']:.2f}s, {stage['posts_per_second']:.1f} posts/s, {stage['bytes_per_second'] / (1024 * 1024):.2f} MiB/s, {sum(stage['requests'].values())} requests, peak RSS {stage['peak_rss_mb']:.1f} MiB")
+    if args.compare:
+        with open(args.compare, "rt") as file:
+            for line in compare(json.load(file), results):
+                print(line)
+    print(f"Results written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from mdfb.utils.database import connect_db, get_blob_path, get_writer, insert_blob
+
+_lock = threading.Lock()
+_cid_locks = {} # cid : [lock, number of threads using it]
+
+def blob_path(blob_store: str, cid: str) -> str:
+    """
+    blob_path: where a blob is kept in the content-addressed store, blobs/<prefix>/<cid>. The prefix is the last two characters of the
+    CID, as the first characters encode the CID version and codec and are the same for every blob.
+
+    Args:
+        blob_store (str): the directory holding the store
+        cid (str): CID of the blob
+
+    Returns:
+        str: path of the blob in the store
+    """
+    return os.path.join(blob_store, "blobs", cid[-2:], cid)
+
+def find_blob(blob_store: str, cid: str) -> str:
+    """
+    find_blob: looks for a blob that has already been downloaded, first in the given store and then in any store recorded in the
+    database, so archives in different directories share their blobs
+
+    Args:
+        blob_store (str): the directory holding the store
+        cid (str): CID of the blob
+
+    Returns:
+        str: path of the stored blob, None if it has not been downloaded
+    """
+    path = blob_path(blob_store, cid)
+    if os.path.isfile(path):
+        return path
+    stored_path = get_blob_path(connect_db().cursor(), cid)
+    if stored_path and os.path.isfile(stored_path):
+        return stored_path
+    return None
+
+def record_blob(cid: str, path: str):
+    get_writer().submit(insert_blob, cid, os.path.abspath(path), os.path.getsize(path))
+
+def link_blob(stored_path: str, target: str, logger: logging.Logger):
+    """
+    link_blob: gives a stored blob its human-readable filename, as a hardlink or, where hardlinks are not possible such as across
+    filesystems, a symlink. An existing file with that name is replaced.
+
+    Args:
+        stored_path (str): path of the blob in the store
+        target (str): the filename the blob should appear under
+        logger (logging.Logger): logger
+    """
+    if os.path.exists(target) and os.path.samefile(target, stored_path):
+        return
+    temp_target = f"{target}.link"
+    if os.path.lexists(temp_target):
+        os.remove(temp_target)
+    try:
+        os.link(stored_path, temp_target)
+    except OSError:
+        logger.info("Unable to hardlink: %s, using a symlink instead", target)
+        os.symlink(os.path.abspath(stored_path), temp_target)
+    os.replace(temp_target, target)
+
+@contextmanager
+def cid_lock(cid: str):
+    """
+    cid_lock: held while a blob is being stored, so threads wanting the same CID wait for one download instead of each fetching it
+
+    Args:
+        cid (str): CID of the blob
+    """
+    with _lock:
+        entry = _cid_locks.setdefault(cid, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _cid_locks[cid]
@@ -1,23 +1,34 @@
-import json
 import os
 import re
-import time
+import tempfile
 
-from atproto_client.namespaces.sync_ns import ComAtprotoSyncNamespace
-from atproto_client.models.com.atproto.repo.list_records import ParamsDict
-from atproto import Client
 from pathvalidate import sanitize_filename
 import encodings
 import logging
-from mdfb.utils.constants import DELAY, RETRIES, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, VALID_FILENAME_OPTIONS
-from mdfb.utils.database import insert_post, connect_db
+from mdfb.utils.constants import BLOB_CHUNK_SIZE, CHECKPOINT_INTERVAL, PDS_URL, RETRIES, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, VALID_FILENAME_OPTIONS
+from mdfb.utils.database import write_posts
+from mdfb.utils.serialization import dumps_post
+from mdfb.utils.clients import get_http_client
+from mdfb.utils.report import get_report, timed
+from mdfb.utils.metrics import DOWNLOADED_BYTES, POSTS, record_retry
+from mdfb.utils.scheduler import get_scheduler, host_of
+from mdfb.core.resolve_pds import resolve_pds
+from mdfb.core.blob_store import blob_path, cid_lock, find_blob, link_blob, record_blob
+from mdfb.core.shards import ShardWriter
+from mdfb.core.export import ExportWriter
+from mdfb.core.post_record import PostRecord, read_blob_sizes
 from tqdm import tqdm
 
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-def download_blobs(posts: list[dict], file_path: str, progress_bar: tqdm, filename_format_string: str = "{RKEY}_{HANDLE}_{TEXT}", include: str = None) -> None:
+# os.umask() can only be read by setting it, so it is read once here rather than on every download
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def download_blobs(posts: list[dict], file_path: str, progress_bar: tqdm, filename_format_string: str = "{RKEY}_{HANDLE}_{TEXT}", include: str = None, blob_store: str = None, shards: ShardWriter = None, export: ExportWriter = None) -> None:
     """
     download_blobs: for the given posts, returned from fetch_post_details(), and filepath, downloads the associated blobs for each post.
+    Downloaded posts are recorded in the database every CHECKPOINT_INTERVAL posts, so little is lost if the run is interrupted.
 
     Args:
         posts (list[dict]): post details returned from fetch_post_details()
@@ -25,55 +36,142 @@ def download_blobs(posts: list[dict], file_path: str, progress_bar: tqdm, filena
         progress_bar (tqdm): progress bar
         filename_format_string (optional, default="{RKEY}_{HANDLE}_{TEXT}", str): the format the filename will follow
         include (optional, default=None, str): Whether to include only the json or media
+        blob_store (optional, default=None, str): directory of a content-addressed store, when given each blob is downloaded once 
+        into the store and linked to its filename
+        shards (optional, default=None, ShardWriter): when given the JSON of each post is appended to its shards instead of written 
+        to a file of its own
+        export (optional, default=None, ExportWriter): when given the metadata of each downloaded post is exported
     """
     logger = logging.getLogger(__name__)
     sucessful_downloads = []
 
     for post in posts:
         did = post["did"]
-        filename_options = {}
-        for valid_filename_option in VALID_FILENAME_OPTIONS:
-            if valid_filename_option in filename_format_string:
-                filename_options[valid_filename_option] = post[valid_filename_option.lower()]
-        filename = _make_base_filename(filename_options, filename_format_string)
+        filename = _make_post_filename(post, filename_format_string)
         if include:
             if "json" in include:
-                _download_json(file_path, filename, post, logger)
-                time.sleep(DELAY)
+                _download_json(file_path, filename, post, logger, shards)
             elif "media" in include:
-                _download_media(post, filename, did, file_path, logger)
+                _download_media(post, filename, did, file_path, logger, blob_store)
         else:
-            _download_media(post, filename, did, file_path, logger)
-            _download_json(file_path, filename, post, logger)  
+            _download_media(post, filename, did, file_path, logger, blob_store)
+            _download_json(file_path, filename, post, logger, shards)  
         sucessful_downloads.extend(_successful_download(post, progress_bar))
-    con = connect_db()
-    insert_post(con.cursor(), sucessful_downloads)
-    con.commit()
+        if export:
+            export.write([post["response"]])
+        if len(sucessful_downloads) >= CHECKPOINT_INTERVAL:
+            _record_downloads(sucessful_downloads, shards)
+    _record_downloads(sucessful_downloads, shards)
+
+def _record_downloads(sucessful_downloads: list[tuple], shards: ShardWriter = None):
+    if shards and sucessful_downloads:
+        # posts are only recorded once their JSON has left the buffer
+        shards.flush()
+    write_posts(list(sucessful_downloads))
+    sucessful_downloads.clear()
 
-def _get_blob_with_retries(did: str, cid: str, filename: str, file_path: str, logger: logging.Logger):
+def _get_blob_with_retries(did: str, cid: str, filename: str, file_path: str, logger: logging.Logger, size: int = None, blob_store: str = None):
     try:
-        _get_blob(did, cid, filename, file_path, logger)
+        if blob_store:
+            _get_stored_blob(did, cid, filename, file_path, logger, size, blob_store)
+        else:
+            _get_blob(did, cid, filename, file_path, logger, size)
         return True
     except Exception:
-        logger.error(f"Error occured for downloading this file, DID: {did}, CID: {cid}, after {RETRIES} retires", exc_info=True)
+        logger.error("Error occured for downloading this file, DID: %s, CID: %s, after %d retires", did, cid, RETRIES, exc_info=True)
+        get_report().record_failure("com.atproto.sync.getBlob")
         return False
 
 @retry(
     wait=wait_exponential(multiplier=EXP_WAIT_MULTIPLIER, min=EXP_WAIT_MIN, max=EXP_WAIT_MAX), 
-    stop=stop_after_attempt(RETRIES)
+    stop=stop_after_attempt(RETRIES),
+    before_sleep=record_retry
 )
-def _get_blob(did: str, cid: str, filename: str, file_path: str, logger: logging.Logger) -> bool:
+@timed("com.atproto.sync.getBlob", lambda did, cid, *_, **__: cid)
+def _get_blob(did: str, cid: str, filename: str, file_path: str, logger: logging.Logger, size: int = None) -> bool:
     try:
-        res = ComAtprotoSyncNamespace(Client()).get_blob(ParamsDict(
-                did=did,
-                cid=cid
-        ))
-        with open(os.path.join(file_path, filename), "wb") as file:
-            file.write(res)
+        blob_url = _get_blob_url(did, logger)
+        with get_scheduler().slot(host_of(blob_url)), \
+            get_http_client().stream("GET", blob_url, params={"did": did, "cid": cid}) as res:
+            res.raise_for_status()
+            received = 0
+            with AtomicFile(os.path.join(file_path, filename), size) as file:
+                for chunk in res.iter_bytes(BLOB_CHUNK_SIZE):
+                    file.write(chunk)
+                    received += len(chunk)
+        DOWNLOADED_BYTES.inc(received)
     except Exception:
-        logger.error(f"Error occured for downloading this file, DID: {did}, CID: {cid}", exc_info=True)
+        logger.error("Error occured for downloading this file, DID: %s, CID: %s", did, cid, exc_info=True)
         raise 
-    
+
+def _get_stored_blob(did: str, cid: str, filename: str, file_path: str, logger: logging.Logger, size: int, blob_store: str):
+    with cid_lock(cid):
+        stored_path = find_blob(blob_store, cid)
+        if stored_path:
+            logger.debug("Blob already stored, CID: %s, path: %s", cid, stored_path)
+        else:
+            stored_path = blob_path(blob_store, cid)
+            os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+            _get_blob(did, cid, os.path.basename(stored_path), os.path.dirname(stored_path), logger, size)
+            record_blob(cid, stored_path)
+    link_blob(stored_path, os.path.join(file_path, filename), logger)
+
+def _get_blob_url(did: str, logger: logging.Logger) -> str:
+    try:
+        pds = resolve_pds(did)
+    except Exception:
+        # the default host can still redirect us to the right PDS
+        logger.error("Unable to resolve PDS for DID: %s, falling back to: %s", did, PDS_URL, exc_info=True)
+        pds = PDS_URL
+    return f"{pds.rstrip('/')}/xrpc/com.atproto.sync.getBlob"
+
+class AtomicFile:
+    """
+    AtomicFile: context manager that writes to a temporary file next to `path` and only renames it into place once the 
+    block exits without an error, so an interrupted download never leaves a truncated file under the final name.
+
+    Args:
+        path (str): the final path of the file
+        size (optional, default=None, int): the expected size in bytes, used to preallocate the file where supported
+    """
+    def __init__(self, path: str, size: int = None):
+        self.path = path
+        self.size = size
+        self.temp_path = None
+        self.file = None
+
+    def __enter__(self):
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".", suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        if self.size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, self.size)
+            except OSError:
+                pass
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                # the preallocated size may be larger than what was actually written
+                self.file.truncate(self.file.tell())
+            self.file.close()
+            if exc_type is None:
+                # mkstemp creates the file readable by the owner only, a downloaded file gets the mode open() would give it
+                os.chmod(self.temp_path, 0o666 & ~_UMASK)
+                os.replace(self.temp_path, self.path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        return False
+
+def _make_post_filename(post: dict, filename_format_string: str) -> str:
+    filename_options = {}
+    for valid_filename_option in VALID_FILENAME_OPTIONS:
+        if valid_filename_option in filename_format_string:
+            filename_options[valid_filename_option] = post[valid_filename_option.lower()]
+    return _make_base_filename(filename_options, filename_format_string)
+
 def _make_base_filename(filename_options: dict, format_filename: str) -> str:
     filename = format_filename.format(**filename_options)
     filename = _truncate_filename(filename, 245)
@@ -88,28 +186,57 @@ def _append_extension(base_filename: str, mime_type: str = None, i: int = None)
         filename += f".{file_type}"
     return filename
 
-def _download_media(post: dict, filename: str, did: str, file_path: str, logger: logging.Logger):
+def _download_media(post: dict, filename: str, did: str, file_path: str, logger: logging.Logger, blob_store: str = None):
+    blob_sizes = _get_blob_sizes(post)
     if "video_cid" in post:
         video_filename = _append_extension(filename, post["mime_type"])
-        success = _get_blob_with_retries(did, post["video_cid"], video_filename, file_path, logger)
+        success = _get_blob_with_retries(did, post["video_cid"], video_filename, file_path, logger, blob_sizes.get(post["video_cid"]), blob_store)
         if success:
-            logger.info(f"Successful downloaded video: {video_filename}")
-        time.sleep(DELAY)
+            logger.debug("Successful downloaded video: %s", video_filename)
+            get_report().add_bytes("video", _saved_size(blob_sizes, post["video_cid"], os.path.join(file_path, video_filename)))
 
     if "images_cid" in post:
         for index ,image_cid in enumerate(post["images_cid"]):
             if len(post["images_cid"]) > 1:
                 image_filename = _append_extension(filename, post["mime_type"], index + 1)
             else: image_filename = _append_extension(filename, post["mime_type"])
-            success = _get_blob_with_retries(did, image_cid, image_filename, file_path, logger)
+            success = _get_blob_with_retries(did, image_cid, image_filename, file_path, logger, blob_sizes.get(image_cid), blob_store)
             if success:
-                logger.info(f"Successful downloaded image: {image_filename}")
-            time.sleep(DELAY)
+                logger.debug("Successful downloaded image: %s", image_filename)
+                get_report().add_bytes("image", _saved_size(blob_sizes, image_cid, os.path.join(file_path, image_filename)))
+
+def _saved_size(blob_sizes: dict[str, int], cid: str, path: str) -> int:
+    # the size reported by getPosts saves a stat of the file
+    if blob_sizes.get(cid):
+        return blob_sizes[cid]
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _get_blob_sizes(post: dict) -> dict[str, int]:
+    """
+    _get_blob_sizes: reads the size of every blob in the post's embed, as reported by app.bsky.feed.getPosts, used to preallocate files
+
+    Args:
+        post (dict): post details returned from fetch_post_details()
+
+    Returns:
+        dict[str, int]: CID of the blob to its size in bytes, empty if the sizes are not known
+    """
+    if isinstance(post, PostRecord):
+        # kept on the record, so its response is not read back from the spill
+        return post.blob_sizes
+    return read_blob_sizes(post.get("response"))
 
-def _download_json(file_path: str, filename: str, post: dict, logger: logging.Logger):
+def _download_json(file_path: str, filename: str, post: dict, logger: logging.Logger, shards: ShardWriter = None):
+    if shards:
+        shards.write(post)
+        logger.debug("Sucessful wrote post to shards: %s", post["poster_post_uri"])
+        return
     with open(f"{os.path.join(file_path, filename)}.json", "wt") as json_file:
-        json.dump(post["response"], json_file, indent=4)
-    logger.info(f"Sucessful wrote file: {filename + '.json'}")
+        json_file.write(dumps_post(post["response"]))
+    logger.debug("Sucessful wrote file: %s.json", filename)
 
 def _truncate_filename(filename: str, MAX_BYTE: int) -> str:
     """
@@ -136,4 +263,5 @@ def _successful_download(post: dict, progress_bar: tqdm) -> list[tuple]:
     for i in range(len(post["feed_type"])):
         res.append((post["user_did"], post["user_post_uri"][i], post["feed_type"][i], post["poster_post_uri"]))
     progress_bar.update(1)
+    POSTS.inc(stage="downloaded")
     return res
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import logging
+
+import httpx
+from tqdm import tqdm
+
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from mdfb.core.download_blobs import AtomicFile, _append_extension, _record_downloads, _download_json, _get_blob_sizes, _get_blob_url, _make_post_filename, _saved_size, _successful_download
+from mdfb.utils.constants import BLOB_CHUNK_SIZE, CHECKPOINT_INTERVAL, DEFAULT_CONCURRENCY, RETRIES, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER
+from mdfb.utils.clients import make_async_http_client
+from mdfb.utils.report import get_report, timed
+from mdfb.utils.metrics import DOWNLOADED_BYTES, record_retry
+from mdfb.core.blob_store import blob_path, find_blob, link_blob, record_blob
+from mdfb.core.shards import ShardWriter
+from mdfb.core.export import ExportWriter
+
+async def download_blobs_async(posts: list[dict], file_path: str, progress_bar: tqdm, filename_format_string: str = "{RKEY}_{HANDLE}_{TEXT}", include: str = None, concurrency: int = DEFAULT_CONCURRENCY, blob_store: str = None, shards: ShardWriter = None, export: ExportWriter = None) -> None:
+    """
+    download_blobs_async: asyncio counterpart of download_blobs(), keeps up to `concurrency` posts in flight on a single event loop 
+    and a single pooled HTTP client instead of one OS thread per download.
+
+    Args:
+        posts (list[dict]): post details returned from fetch_post_details()
+        file_path (str): filepath for where the files will be stored
+        progress_bar (tqdm): progress bar
+        filename_format_string (optional, default="{RKEY}_{HANDLE}_{TEXT}", str): the format the filename will follow
+        include (optional, default=None, str): Whether to include only the json or media
+        concurrency (optional, default=DEFAULT_CONCURRENCY, int): maximum number of posts being downloaded at once
+        blob_store (optional, default=None, str): directory of a content-addressed store, when given each blob is downloaded once 
+        into the store and linked to its filename
+        shards (optional, default=None, ShardWriter): when given the JSON of each post is appended to its shards, see download_blobs()
+        export (optional, default=None, ExportWriter): when given the metadata of each downloaded post is exported
+    """
+    logger = logging.getLogger(__name__)
+    sucessful_downloads = []
+    client = make_async_http_client(concurrency)
+    posts_iter = iter(posts)
+
+    async def worker():
+        for post in posts_iter:
+            try:
+                await _download_post(post, file_path, filename_format_string, include, client, logger, blob_store, shards)
+            except Exception as e:
+                logger.error("Error in task for post: %s, %s", post.get("poster_post_uri"), e, exc_info=True)
+                continue
+            sucessful_downloads.extend(_successful_download(post, progress_bar))
+            if export:
+                export.write([post["response"]])
+            if len(sucessful_downloads) >= CHECKPOINT_INTERVAL:
+                _record_downloads(sucessful_downloads, shards)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, len(posts))))])
+    finally:
+        await client.aclose()
+    _record_downloads(sucessful_downloads, shards)
+
+async def _download_post(post: dict, file_path: str, filename_format_string: str, include: str, client: httpx.AsyncClient, logger: logging.Logger, blob_store: str = None, shards: ShardWriter = None):
+    did = post["did"]
+    filename = _make_post_filename(post, filename_format_string)
+    if include:
+        if "json" in include:
+            await asyncio.to_thread(_download_json, file_path, filename, post, logger, shards)
+        elif "media" in include:
+            await _download_media(post, filename, did, file_path, client, logger, blob_store)
+    else:
+        await _download_media(post, filename, did, file_path, client, logger, blob_store)
+        await asyncio.to_thread(_download_json, file_path, filename, post, logger, shards)
+
+async def _download_media(post: dict, filename: str, did: str, file_path: str, client: httpx.AsyncClient, logger: logging.Logger, blob_store: str = None):
+    blob_sizes = _get_blob_sizes(post)
+    if "video_cid" in post:
+        video_filename = _append_extension(filename, post["mime_type"])
+        success = await _get_blob_with_retries(did, post["video_cid"], video_filename, file_path, client, logger, blob_sizes.get(post["video_cid"]), blob_store)
+        if success:
+            logger.debug("Successful downloaded video: %s", video_filename)
+            get_report().add_bytes("video", _saved_size(blob_sizes, post["video_cid"], os.path.join(file_path, video_filename)))
+
+    if "images_cid" in post:
+        for index, image_cid in enumerate(post["images_cid"]):
+            if len(post["images_cid"]) > 1:
+                image_filename = _append_extension(filename, post["mime_type"], index + 1)
+            else: image_filename = _append_extension(filename, post["mime_type"])
+            success = await _get_blob_with_retries(did, image_cid, image_filename, file_path, client, logger, blob_sizes.get(image_cid), blob_store)
+            if success:
+                logger.debug("Successful downloaded image: %s", image_filename)
+                get_report().add_bytes("image", _saved_size(blob_sizes, image_cid, os.path.join(file_path, image_filename)))
+
+async def _get_blob_with_retries(did: str, cid: str, filename: str, file_path: str, client: httpx.AsyncClient, logger: logging.Logger, size: int = None, blob_store: str = None) -> bool:
+    try:
+        if blob_store:
+            await _get_stored_blob(did, cid, filename, file_path, client, logger, size, blob_store)
+        else:
+            await _get_blob(did, cid, filename, file_path, client, logger, size)
+        return True
+    except Exception:
+        logger.error("Error occured for downloading this file, DID: %s, CID: %s, after %d retires", did, cid, RETRIES, exc_info=True)
+        get_report().record_failure("com.atproto.sync.getBlob")
+        return False
+
+async def _get_stored_blob(did: str, cid: str, filename: str, file_path: str, client: httpx.AsyncClient, logger: logging.Logger, size: int, blob_store: str):
+    # two tasks wanting the same CID at once may both download it, the atomic rename keeps the stored blob whole either way
+    stored_path = await asyncio.to_thread(find_blob, blob_store, cid)
+    if stored_path:
+        logger.debug("Blob already stored, CID: %s, path: %s", cid, stored_path)
+    else:
+        stored_path = blob_path(blob_store, cid)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        await _get_blob(did, cid, os.path.basename(stored_path), os.path.dirname(stored_path), client, logger, size)
+        record_blob(cid, stored_path)
+    link_blob(stored_path, os.path.join(file_path, filename), logger)
+
+@retry(
+    wait=wait_exponential(multiplier=EXP_WAIT_MULTIPLIER, min=EXP_WAIT_MIN, max=EXP_WAIT_MAX), 
+    stop=stop_after_attempt(RETRIES),
+    before_sleep=record_retry
+)
+@timed("com.atproto.sync.getBlob", lambda did, cid, *_, **__: cid)
+async def _get_blob(did: str, cid: str, filename: str, file_path: str, client: httpx.AsyncClient, logger: logging.Logger, size: int = None):
+    try:
+        blob_url = await asyncio.to_thread(_get_blob_url, did, logger)
+        async with client.stream("GET", blob_url, params={"did": did, "cid": cid}) as res:
+            res.raise_for_status()
+            # chunks are small enough that writing them to the page cache does not stall the event loop
+            received = 0
+            with AtomicFile(os.path.join(file_path, filename), size) as file:
+                async for chunk in res.aiter_bytes(BLOB_CHUNK_SIZE):
+                    file.write(chunk)
+                    received += len(chunk)
+        DOWNLOADED_BYTES.inc(received)
+    except Exception:
+        logger.error("Error occured for downloading this file, DID: %s, CID: %s", did, cid, exc_info=True)
+        raise
@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import ContextManager, Iterable, Iterator
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from mdfb.core.fetch_post_details import _extract_media, _get_rkey
+from mdfb.core.shards import iter_shard_posts
+from mdfb.utils.constants import EXPORT_ROW_GROUP_SIZE
+from mdfb.utils.report import REPORT_PREFIX
+from mdfb.utils.serialization import loads
+
+FORMATS = {
+    ".parquet": "parquet",
+    ".db": "sqlite",
+    ".sqlite": "sqlite",
+    ".sqlite3": "sqlite"
+}
+COLUMNS = ["rkey", "uri", "did", "handle", "text", "created_at", "media_type", "images_cid", "video_cid", "feed_type", "user_did"]
+LIST_COLUMNS = {"media_type", "images_cid", "feed_type"}
+
+class ExportWriter:
+    """
+    ExportWriter: writes a row of metadata for each post to a Parquet file or an SQLite database, EXPORT_ROW_GROUP_SIZE rows at a
+    time, so an archive can be queried without reading every JSON file. Parquet needs pyarrow. Safe to share between threads.
+
+    Args:
+        path (str): the file to write, a new file for Parquet and a new or existing database for SQLite
+        format (optional, default=None, str): "parquet" or "sqlite", taken from the extension of the path when None
+        row_group_size (optional, default=EXPORT_ROW_GROUP_SIZE, int): number of rows written at once
+
+    Raises:
+        ValueError: If the format is unknown, pyarrow is missing for Parquet or the Parquet file already exists
+    """
+    def __init__(self, path: str, format: str = None, row_group_size: int = EXPORT_ROW_GROUP_SIZE):
+        self.format = format or FORMATS.get(os.path.splitext(path)[1].lower())
+        if self.format not in ("parquet", "sqlite"):
+            raise ValueError(f"Unable to tell the export format of: {path}, use a .parquet, .db or .sqlite file or pass the format")
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.lock = threading.Lock()
+        if self.format == "parquet":
+            if pyarrow is None:
+                raise ValueError("Exporting to Parquet needs the pyarrow package, install it with: pip install \"mdfb[parquet]\"")
+            if os.path.exists(path):
+                raise ValueError(f"The file: {path} already exists, Parquet files cannot be appended to")
+            self.schema = pyarrow.schema([(column, pyarrow.list_(pyarrow.string()) if column in LIST_COLUMNS else pyarrow.string()) for column in COLUMNS])
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.con = sqlite3.connect(path, check_same_thread=False)
+            # keyed by the post, so exporting a post again replaces its row rather than adding another
+            self.con.execute(f"CREATE TABLE IF NOT EXISTS posts ({', '.join(f'{column} TEXT PRIMARY KEY' if column == 'uri' else f'{column} TEXT' for column in COLUMNS)})")
+            self.con.commit()
+
+    def write(self, responses: Iterable[dict]):
+        """
+        write: adds a row for each post, writing out a row group whenever EXPORT_ROW_GROUP_SIZE rows are waiting
+
+        Args:
+            responses (Iterable[dict]): the responses of the posts, the "response" key of post details from fetch_post_details()
+        """
+        with self.lock:
+            for response in responses:
+                self.rows.append(post_row(response))
+                if len(self.rows) >= self.row_group_size:
+                    self._write_rows()
+
+    def close(self):
+        with self.lock:
+            self._write_rows()
+            if self.format == "parquet":
+                self.writer.close()
+            else:
+                self.con.close()
+
+    def _write_rows(self):
+        if not self.rows:
+            return
+        if self.format == "parquet":
+            self.writer.write_table(pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+        else:
+            self.con.executemany(f"INSERT OR REPLACE INTO posts VALUES ({', '.join('?' * len(COLUMNS))})", [
+                [",".join(row[column]) if column in LIST_COLUMNS else row[column] for column in COLUMNS] for row in self.rows
+            ])
+            self.con.commit()
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def post_row(response: dict) -> dict:
+    """
+    post_row: the exported metadata of a post, taken from its response as written to its JSON file
+
+    Args:
+        response (dict): the response of the post, from fetch_post_details()
+
+    Returns:
+        dict: the row of the post, with a value for each of COLUMNS
+    """
+    record = response.get("record", {})
+    embed = record.get("embed")
+    media = _extract_media(embed.get("media", embed)) if embed else {}
+    return {
+        "rkey": _get_rkey(response["uri"]),
+        "uri": response["uri"],
+        "did": response["author"]["did"],
+        "handle": response["author"]["handle"],
+        "text": record.get("text", ""),
+        "created_at": record.get("created_at"),
+        "media_type": media.get("media_type", []),
+        "images_cid": media.get("images_cid", []),
+        "video_cid": media.get("video_cid"),
+        "feed_type": response.get("feed_type", []),
+        "user_did": response.get("user_did")
+    }
+
+def open_export(path: str, format: str = None) -> ContextManager[ExportWriter]:
+    if path:
+        return ExportWriter(path, format)
+    return nullcontext()
+
+def export_posts(directory: str, path: str, format: str = None) -> int:
+    """
+    export_posts: rebuilds an export from the posts already downloaded to a directory, whether written as a JSON file per post
+    or as JSONL shards
+
+    Args:
+        directory (str): the download directory
+        path (str): the file to write, see ExportWriter
+        format (optional, default=None, str): "parquet" or "sqlite", taken from the extension of the path when None
+
+    Returns:
+        int: the number of posts exported
+    """
+    count = 0
+    with ExportWriter(path, format) as writer:
+        for response in iter_output_posts(directory):
+            writer.write([response])
+            count += 1
+    return count
+
+def iter_output_posts(directory: str) -> Iterator[dict]:
+    """
+    iter_output_posts: reads the response of every post downloaded to a directory, from both JSON files and JSONL shards
+
+    Args:
+        directory (str): the download directory
+
+    Yields:
+        dict: the response of each post
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # the run reports written next to the posts are not posts
+            if entry.is_file() and entry.name.endswith(".json") and not entry.name.startswith(REPORT_PREFIX):
+                with open(entry.path, "rb") as file:
+                    yield loads(file.read())
+    yield from iter_shard_posts(directory)
@@ -1,7 +1,7 @@
 import re
-import time
-import json
 import logging
+import time
+import zlib
 
 from atproto_client.namespaces.sync_ns import AppBskyFeedNamespace
 from atproto_client.models.com.atproto.repo.list_records import ParamsDict
@@ -10,62 +10,130 @@ from atproto.exceptions import AtProtocolError
 
 from tenacity import RetryError, retry, stop_after_attempt, wait_exponential
 
+from mdfb.core.post_record import PostRecord, ResponseSpill, get_spill
 from mdfb.utils.helpers import get_chunk
-from mdfb.utils.constants import DELAY, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, RETRIES
-
-def fetch_post_details(uris: list[dict[str, str]]) -> list[dict[str, str]]:
+from mdfb.utils.clients import get_client
+from mdfb.utils.metrics import POSTS, record_retry
+from mdfb.utils.report import get_report, timed
+from mdfb.utils.serialization import dumps, loads
+from mdfb.utils.database import connect_db, get_post_details, get_writer, insert_post_details
+from mdfb.utils.scheduler import get_scheduler, host_of
+from mdfb.utils.constants import APPVIEW_URL, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, IDENTIFIER_KEYS, POST_DETAILS_BATCH_SIZE, RETRIES
+
+def fetch_post_details(uris: list[dict[str, str]], cache: bool = False, max_age: float = None) -> list[dict[str, str]]:
     """
-    fetch_post_details: Fetches post details from the given AT-URIs
+    fetch_post_details: Fetches post details from the given AT-URIs, every post fetched is kept in the post details cache of the database
 
     Args:
         uris (list[dict]): A list of dictionaries of the desired AT-URIs from the post and user, user did and feed type 
+        cache (optional, default=False, bool): Whether to read the post details from the cache, only fetching the posts that are not cached
+        max_age (optional, default=None, float): in seconds, cached posts fetched longer ago than this are fetched again, never when None
 
     Returns:
-        list[dict]: A list of dictionaries that contain post details
+        list[dict]: A list of dictionaries that contain post details, or of PostRecord while in spill_responses()
     """
     all_post_details = []
     logger = logging.getLogger(__name__)
+    spill = get_spill()
     seen_uris = set()
-    client = Client("https://public.api.bsky.app/")
+    if cache:
+        all_post_details, uris = _read_cached_post_details(uris, max_age, logger, spill)
+        POSTS.inc(len(all_post_details), stage="hydrated")
+        if not uris:
+            return all_post_details
+    client = get_client(APPVIEW_URL)
     
-    for uri_chunk in get_chunk(uris, 25):
-        logger.info(f"Fetching details from {len(uri_chunk)} URIs")
+    for uri_chunk in get_chunk(uris, POST_DETAILS_BATCH_SIZE):
+        logger.info("Fetching details from %d URIs", len(uri_chunk))
         res = _get_post_details_with_retries(uri_chunk, client, logger)
         if not res:
             continue
-        records = json.loads(res.model_dump_json())
+        records = res.model_dump(mode="json")
 
         merged = _merge_uri_chunk_to_records(uri_chunk, records)
 
+        cache_rows = []
         for post in merged:
             seen_uris.add(post["uri"])
-            post_details = {
-                "rkey": _get_rkey(post["uri"]),
-                "text": post["record"].get("text", ""),
-                "response": post,
-                "user_did": post["user_did"],
-                "user_post_uri": post["user_post_uri"],
-                "poster_post_uri": post["poster_post_uri"],
-                "feed_type": post["feed_type"],
-                **_get_author_details(post["author"])
-            }
-        
-            embed_media = post["record"].get("embed", None)
-            if not embed_media:
-                all_post_details.append(post_details)
-                continue
-
-            embed_media = embed_media.get("media", embed_media)
-            post_details.update(_extract_media(embed_media))
-            
-            logger.info("Post details retrieved for URI: %s", post["uri"])
+            post_details = _make_post_details(post, logger)
+            cache_row = _make_cache_row(post_details)
+            cache_rows.append(cache_row)
+            if spill:
+                # the compressed response made for the cache is the one spilled
+                post_details = PostRecord(post_details, cache_row[8], spill)
             all_post_details.append(post_details)
+        if cache_rows:
+            get_writer().submit(insert_post_details, cache_rows)
+        POSTS.inc(len(merged), stage="hydrated")
         for uris in uri_chunk:
             if uris["poster_post_uri"] not in seen_uris:
-                logger.info(f"The post associated with this URI is missing/deleted: {uris['poster_post_uri']}")
-        time.sleep(DELAY)
+                logger.info("The post associated with this URI is missing/deleted: %s", uris["poster_post_uri"])
     return all_post_details
 
+def _make_post_details(post: dict, logger: logging.Logger) -> dict:
+    post_details = {
+        "rkey": _get_rkey(post["uri"]),
+        "text": post["record"].get("text", ""),
+        "response": post,
+        "user_did": post["user_did"],
+        "user_post_uri": post["user_post_uri"],
+        "poster_post_uri": post["poster_post_uri"],
+        "feed_type": post["feed_type"],
+        **_get_author_details(post["author"])
+    }
+
+    embed_media = post["record"].get("embed", None)
+    if not embed_media:
+        return post_details
+
+    embed_media = embed_media.get("media", embed_media)
+    post_details.update(_extract_media(embed_media))
+    
+    logger.debug("Post details retrieved for URI: %s", post["uri"])
+    return post_details
+
+def _make_cache_row(post_details: dict) -> tuple:
+    # the identifiers belong to the account that liked, reposted or posted it, only the post itself is shared between accounts
+    post = {key: value for key, value in post_details["response"].items() if key not in IDENTIFIER_KEYS}
+    return (
+        post_details["poster_post_uri"],
+        post_details["did"],
+        post_details["handle"],
+        post_details["display_name"],
+        ",".join(post_details.get("media_type", [])) or None,
+        ",".join(post_details.get("images_cid", [])) or None,
+        post_details.get("video_cid"),
+        post_details.get("mime_type"),
+        zlib.compress(dumps(post)),
+        time.time()
+    )
+
+def _read_cached_post_details(uris: list[dict], max_age: float, logger: logging.Logger, spill: ResponseSpill = None) -> tuple[list[dict], list[dict]]:
+    """
+    _read_cached_post_details: builds the post details of the given identifiers from the cache, as if they had just been fetched
+
+    Args:
+        uris (list[dict]): A list of dictionaries of the desired AT-URIs from the post and user, user did and feed type 
+        max_age (float): in seconds, cached posts fetched longer ago than this are left out, none are when None
+        logger (logging.Logger): logger
+        spill (optional, default=None, ResponseSpill): when given, each post is read into a PostRecord with its response spilled
+
+    Returns:
+        tuple[list[dict], list[dict]]: the post details read from the cache, and the identifiers of the posts that still need fetching
+    """
+    cached = get_post_details(connect_db().cursor(), [identifier["poster_post_uri"] for identifier in uris], max_age)
+    post_details = []
+    missing = []
+    for identifier in uris:
+        response = cached.get(identifier["poster_post_uri"])
+        if response is None:
+            missing.append(identifier)
+            continue
+        details = _make_post_details({**identifier, **loads(zlib.decompress(response))}, logger)
+        post_details.append(PostRecord(details, response, spill) if spill else details)
+    logger.info("Read the details of %d of %d posts from the cache", len(post_details), len(uris))
+    return post_details, missing
+
 def _extract_media(embed: dict) -> dict:
     """
     _extract_media: Extracts information from the media, or embed, key in the post details JSON response from the atproto API: app.bsky.feed.getPosts
@@ -107,21 +175,25 @@ def _get_post_details_with_retries(uri_chunk: list[dict], client: Client, logger
     try:
         return _get_post_details(uri_chunk, client, logger)
     except (RetryError, AtProtocolError):
-        logger.error(f"Failure to fetch records from the URIs: {uri_chunk}", exc_info=True)
+        logger.error("Failure to fetch records from the URIs: %s", uri_chunk, exc_info=True)
+        get_report().record_failure("app.bsky.feed.getPosts")
 
 @retry(
     wait=wait_exponential(multiplier=EXP_WAIT_MULTIPLIER, min=EXP_WAIT_MIN, max=EXP_WAIT_MAX), 
-    stop=stop_after_attempt(RETRIES)
+    stop=stop_after_attempt(RETRIES),
+    before_sleep=record_retry
 )
+@timed("app.bsky.feed.getPosts", lambda uri_chunk, *_: f"{len(uri_chunk)} posts from: {uri_chunk[0]['poster_post_uri']}")
 def _get_post_details(uri_chunk: list[dict], client: Client, logger: logging.Logger):
     try:
         uris = [uris["poster_post_uri"] for uris in uri_chunk]
-        res = AppBskyFeedNamespace(client).get_posts(ParamsDict(
-            uris=uris
-        ))
+        with get_scheduler().slot(host_of(APPVIEW_URL)):
+            res = AppBskyFeedNamespace(client).get_posts(ParamsDict(
+                uris=uris
+            ))
         return res
     except (AtProtocolError, RetryError):
-        logger.error(f"Error occurred fetching records from URIs: {uri_chunk}", exc_info=True)
+        logger.error("Error occurred fetching records from URIs: %s", uri_chunk, exc_info=True)
         raise
     
 def _get_rkey(at_uri: str) -> str:
@@ -136,12 +208,23 @@ def _get_author_details(author: dict) -> dict:
     return author_details
 
 def _merge_uri_chunk_to_records(uri_chunk: list[dict], records: dict) -> list[dict]:
-    merged = []
+    """
+    _merge_uri_chunk_to_records: joins each post identifier with the post returned for its AT-URI, in the order of the identifiers. 
+    Posts are indexed by their exact AT-URI, so the join is a single pass over each no matter the size of the chunk
+
+    Args:
+        uri_chunk (list[dict]): post identifiers, with the AT-URIs of the post and user, user did and feed type
+        records (dict): the response of app.bsky.feed.getPosts
 
+    Returns:
+        list[dict]: the identifiers merged with their post, one for every identifier and post sharing an AT-URI
+    """
+    posts_by_uri = {}
+    for post in records["posts"]:
+        posts_by_uri.setdefault(post["uri"], []).append(post)
+
+    merged = []
     for uris in uri_chunk:
-        uri = uris["poster_post_uri"]
-        for post in records["posts"]:
-            if uri in post["uri"]:
-                combined = {**uris, **post}
-                merged.append(combined)
+        for post in posts_by_uri.get(uris["poster_post_uri"], ()):
+            merged.append({**uris, **post})
     return merged
@@ -0,0 +1,208 @@
+import logging
+from typing import Iterable, Iterator
+
+import libipld
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from mdfb.utils.constants import BLOB_CHUNK_SIZE, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, PDS_URL, RETRIES
+from mdfb.utils.clients import get_http_client
+from mdfb.utils.metrics import record_retry
+from mdfb.utils.database import finish_listing, get_writer, save_page, start_run
+from mdfb.utils.scheduler import get_scheduler, host_of
+from mdfb.core.resolve_pds import resolve_pds
+
+FEED_COLLECTIONS = {f"app.bsky.feed.{feed_type}": feed_type for feed_type in ["post", "like", "repost"]}
+
+def fetch_repo_identifiers(did: str, feed_types: list[str]) -> dict[str, list[dict]]:
+    """
+    fetch_repo_identifiers: downloads the whole repository of the account once with com.atproto.sync.getRepo and extracts the
+    AT-URIs of its posts, likes and reposts locally, instead of paging through com.atproto.repo.listRecords 100 records at a time
+
+    Args:
+        did (str): DID of the target account
+        feed_types (list[str]): The types of post wanted from the account: like, repost and post
+
+    Raises:
+        Exception: If the repository could not be downloaded or parsed after the retries
+
+    Returns:
+        dict[str, list[dict]]: for each feed type, a list of dictionaries of the desired AT-URIs from the post and user, user did and
+        feed type, the same as get_post_identifiers() with archive=True
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        identifiers = _fetch_repo_identifiers(did, feed_types, logger)
+    except Exception:
+        logger.error("Failure to fetch repository for DID: %s, after %d retries", did, RETRIES, exc_info=True)
+        raise
+
+    writer = get_writer()
+    for feed_type, post_uris in identifiers.items():
+        writer.submit(start_run, did, feed_type, 0, True, False)
+        writer.submit(save_page, did, feed_type, post_uris, None, 0)
+        writer.submit(finish_listing, did, feed_type)
+    return identifiers
+
+@retry(
+    wait=wait_exponential(multiplier=EXP_WAIT_MULTIPLIER, min=EXP_WAIT_MIN, max=EXP_WAIT_MAX),
+    stop=stop_after_attempt(RETRIES),
+    before_sleep=record_retry
+)
+def _fetch_repo_identifiers(did: str, feed_types: list[str], logger: logging.Logger) -> dict[str, list[dict]]:
+    repo_url = _get_repo_url(did, logger)
+    logger.info("Attempting to fetch repository for DID: %s", did)
+    with get_scheduler().slot(host_of(repo_url)), \
+        get_http_client().stream("GET", repo_url, params={"did": did}) as res:
+        res.raise_for_status()
+        identifiers = parse_repo(res.iter_bytes(BLOB_CHUNK_SIZE), did, feed_types)
+    logger.info("Successful retrieved repository for DID: %s, %s", did, ", ".join(f"{feed_type}: {len(uris)}" for feed_type, uris in identifiers.items()))
+    return identifiers
+
+def _get_repo_url(did: str, logger: logging.Logger) -> str:
+    try:
+        pds = resolve_pds(did)
+    except Exception:
+        logger.error("Unable to resolve PDS for DID: %s, falling back to: %s", did, PDS_URL, exc_info=True)
+        pds = PDS_URL
+    return f"{pds.rstrip('/')}/xrpc/com.atproto.sync.getRepo"
+
+def parse_repo(chunks: Iterable[bytes], did: str, feed_types: list[str]) -> dict[str, list[dict]]:
+    """
+    parse_repo: stream-parses a repository CAR file and returns the identifiers of its posts, likes and reposts. Blocks are decoded
+    one at a time and only the record keys and subject URIs are kept, so the repository never has to fit in memory.
+
+    Args:
+        chunks (Iterable[bytes]): the CAR file as an iterable of byte chunks of any size, e.g. an open file or a streamed response
+        did (str): DID of the account owning the repository
+        feed_types (list[str]): The types of post wanted from the account: like, repost and post
+
+    Returns:
+        dict[str, list[dict]]: for each feed type, a list of identifier dictionaries, newest first as listRecords returns them
+    """
+    collections = {collection for collection, feed_type in FEED_COLLECTIONS.items() if feed_type in feed_types}
+    keys = {} # record cid : collection/rkey, from the MST nodes
+    subjects = {} # record cid : subject uri, or None for posts
+
+    for cid, data in iter_car_blocks(chunks):
+        block = libipld.decode_dag_cbor(data)
+        if not isinstance(block, dict):
+            continue
+        if _is_mst_node(block):
+            for key, value in _mst_entries(block):
+                if key.split("/", 1)[0] in collections:
+                    keys[_cid_key(value)] = key
+        elif block.get("$type") in collections:
+            subject = block.get("subject")
+            subjects[_cid_key(cid)] = subject.get("uri") if isinstance(subject, dict) else None
+
+    identifiers = {feed_type: [] for feed_type in feed_types}
+    # TIDs sort by time, so the rkey order matches the reverse chronological order of listRecords
+    for cid, key in sorted(keys.items(), key=lambda item: item[1].split("/", 1)[1], reverse=True):
+        if cid not in subjects:
+            continue
+        collection = key.split("/", 1)[0]
+        feed_type = FEED_COLLECTIONS[collection]
+        record_uri = f"at://{did}/{key}"
+        identifiers[feed_type].append({
+            "user_did": did,
+            "user_post_uri": [record_uri],
+            "feed_type": [feed_type],
+            "poster_post_uri": record_uri if feed_type == "post" else subjects[cid],
+        })
+    return identifiers
+
+def iter_car_blocks(chunks: Iterable[bytes]) -> Iterator[tuple[bytes, bytes]]:
+    """
+    iter_car_blocks: reads a CARv1 file, yielding each block as it arrives
+
+    Args:
+        chunks (Iterable[bytes]): the CAR file as an iterable of byte chunks
+
+    Raises:
+        ValueError: if the file ends in the middle of a block
+
+    Yields:
+        tuple[bytes, bytes]: the CID of the block, in its binary form, and the DAG-CBOR encoded block
+    """
+    reader = _ChunkReader(chunks)
+    header_length = reader.read_varint()
+    if header_length is None:
+        raise ValueError("CAR file is empty")
+    reader.read(header_length)
+    while (block_length := reader.read_varint()) is not None:
+        block = reader.read(block_length)
+        cid_length = _cid_length(block)
+        yield block[:cid_length], block[cid_length:]
+
+class _ChunkReader:
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def _fill(self, size: int) -> bool:
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+            self.buffer.extend(chunk)
+        return True
+
+    def read(self, size: int) -> bytes:
+        if not self._fill(size):
+            raise ValueError(f"CAR file ended early, expected {size} bytes but only {len(self.buffer)} remain")
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_varint(self) -> int:
+        """
+        read_varint: reads an unsigned LEB128 varint, returns None at a clean end of the file
+        """
+        value = shift = 0
+        position = 0
+        while True:
+            if not self._fill(position + 1):
+                if position == 0:
+                    return None
+                raise ValueError("CAR file ended in the middle of a varint")
+            byte = self.buffer[position]
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            position += 1
+            if not byte & 0x80:
+                del self.buffer[:position]
+                return value
+
+def _cid_length(block: bytes) -> int:
+    # CIDv0 is a bare sha2-256 multihash
+    if block[:2] == b"\x12\x20":
+        return 34
+    position = 0
+    # version, codec, multihash code and digest length
+    for _ in range(4):
+        value, position = _decode_varint(block, position)
+    return position + value
+
+def _decode_varint(data: bytes, position: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        position += 1
+        if not byte & 0x80:
+            return value, position
+
+def _is_mst_node(block: dict) -> bool:
+    return block.keys() == {"l", "e"} and isinstance(block["e"], list)
+
+def _mst_entries(node: dict) -> Iterator[tuple[str, bytes]]:
+    # keys are prefix compressed against the previous key in the same node
+    key = b""
+    for entry in node["e"]:
+        key = key[:entry["p"]] + entry["k"]
+        yield key.decode(), entry["v"]
+
+def _cid_key(cid) -> str:
+    # libipld decodes links to their binary form, older versions decode them to strings
+    return cid if isinstance(cid, str) else libipld.encode_cid(cid)
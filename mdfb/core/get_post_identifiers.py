@@ -1,8 +1,7 @@
-import json
 import sqlite3
 import re
-import time
 import logging
+from typing import Iterator
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from atproto_client.namespaces.sync_ns import ComAtprotoRepoNamespace
@@ -12,9 +11,13 @@ from atproto.exceptions import AtProtocolError
 
 from tenacity import RetryError, retry, stop_after_attempt, wait_exponential
 
-from mdfb.utils.constants import DELAY, EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, RETRIES, DEFAULT_THREADS
-from mdfb.utils.database import check_post_exists, connect_db
-from mdfb.utils.helpers import split_list
+from mdfb.utils.constants import EXP_WAIT_MAX, EXP_WAIT_MIN, EXP_WAIT_MULTIPLIER, RETRIES, DEFAULT_HYDRATE_THREADS, PDS_URL, POST_DETAILS_BATCH_SIZE
+from mdfb.utils.database import connect_db, flush_writes, get_existing_posts, finish_listing, get_pending_posts, get_run_state, get_writer, save_page, start_run
+from mdfb.utils.clients import get_client
+from mdfb.utils.metrics import POSTS, record_retry
+from mdfb.utils.report import get_report, timed
+from mdfb.utils.scheduler import get_scheduler, host_of
+from mdfb.utils.helpers import get_chunk
 from mdfb.utils.database import restore_posts
 from mdfb.core.fetch_post_details import fetch_post_details
 
@@ -42,16 +45,18 @@ def _get_post_identifiers_base(
     logger.info("Successful retrieved: %d posts, %d remaining", fetch_amount, limit)
     records = res.get("records", {})
     if not records:
-        logger.info(f"No more records to fetch for DID: {did}, feed_type: {feed_type}")
+        logger.info("No more records to fetch for DID: %s, feed_type: %s", did, feed_type)
         return {}
     last_record_cid = re.search(r"\w+$", records[-1]["uri"])[0]
     cursor = last_record_cid
+    existing = get_existing_posts(db_cursor, did, [record["uri"] for record in records], feed_type) if update else set()
     for record in records:
         if feed_type == "post":
             uri = record["uri"]
         else:
             uri = record["value"]["subject"]["uri"]
-        if check_post_exists(db_cursor, did, record["uri"], feed_type) and update:
+        if record["uri"] in existing:
+            POSTS.inc(len(post_uris), stage="listed")
             res = {
                 "cursor": cursor,
                 "limit": limit,
@@ -65,12 +70,12 @@ def _get_post_identifiers_base(
             "poster_post_uri": uri,
         }
         post_uris.append(uris)
+    POSTS.inc(len(post_uris), stage="listed")
     res = {
         "cursor": cursor,
         "limit": limit,
         "post_uris": post_uris        
     }
-    time.sleep(DELAY)
     return res
 
 def get_post_identifiers(did: str, feed_type: str, limit: int = 0, archive: bool = False, update: bool = False) -> list[dict]:
@@ -89,76 +94,161 @@ def get_post_identifiers(did: str, feed_type: str, limit: int = 0, archive: bool
     Returns:
         list[dict]: A list of dictionaries of the desired AT-URIs from the post and user, user did and feed type 
     """
+    post_uris = []
+    for page in iter_post_identifiers(did, feed_type, limit=limit, archive=archive, update=update):
+        post_uris.extend(page)
+    return post_uris
+
+def iter_post_identifiers(did: str, feed_type: str, limit: int = 0, archive: bool = False, update: bool = False, resume: bool = False) -> Iterator[list[dict]]:
+    """
+    iter_post_identifiers: Lazily pages through the AT-URIs of the posts wanted from the desired account, yielding one page at a time 
+    so that later stages can start before every identifier has been listed. Every page is saved as pending along with the cursor
+    before it is yielded, so an interrupted run can be resumed.
+
+    Args:
+        did (str): DID of the target account
+        feed_type (str): The type of post wanted from the account: like, repost and post
+        limit (optional, default=0, int): The amount wanted to get
+        archive (optional, default=False, bool): Will download all posts of the wanted type
+        update (optional, default=True, bool): Will only latest posts that have not been downloaded
+        resume (optional, default=False, bool): Will continue listing from where an interrupted run stopped, ignoring limit, archive 
+        and update in favour of those of the interrupted run
+
+    Raises:
+        ValueError: If resuming and there is no run to resume for the account and feed type
+
+    Yields:
+        list[dict]: A page of dictionaries of the desired AT-URIs from the post and user, user did and feed type 
+    """
     cursor = ""
     con = connect_db()
     db_cursor = con.cursor()
-    post_uris = []
     logger = logging.getLogger(__name__)
-    client = Client()
+    client = get_client(PDS_URL)
+    writer = get_writer()
+
+    if resume:
+        flush_writes()
+        state = get_run_state(db_cursor, did, feed_type)
+        if not state:
+            raise ValueError(f"There is no interrupted run to resume for DID: {did}, feed_type: {feed_type}")
+        if state["listed"]:
+            return
+        logger.info("Resuming listing for DID: %s, feed_type: %s, from cursor: %s", did, feed_type, state["cursor"])
+        cursor, limit, archive, update = state["cursor"] or "", state["remaining"], state["archive"], state["update"]
+    else:
+        writer.submit(start_run, did, feed_type, limit, archive, update)
 
     while limit > 0 or archive:
         res = _get_post_identifiers_base(client, did, feed_type, logger, cursor, db_cursor, limit, archive, update)
         if res == {}:
-            return post_uris
-        post_uris.extend(res["post_uris"])
+            break
+        writer.submit(save_page, did, feed_type, res["post_uris"], res["cursor"], res["limit"])
+        yield res["post_uris"]
         limit = res["limit"]
         cursor = res["cursor"]
-    return post_uris
+    writer.submit(finish_listing, did, feed_type)
+
+def resume_post_identifiers(did: str, feed_type: str) -> list[dict]:
+    """
+    resume_post_identifiers: finishes the listing of an interrupted run and returns every post identifier it listed that has not 
+    been downloaded yet
 
-def get_post_identifiers_media_types(did: str, feed_type: str, media_types: list[str], limit: int = 0, archive: bool = False, update: bool = False, num_threads: int = DEFAULT_THREADS, restore: bool = False) -> list[dict]:
+    Args:
+        did (str): DID of the target account
+        feed_type (str): The type of post wanted from the account: like, repost and post
+
+    Raises:
+        ValueError: If there is no run to resume for the account and feed type
+
+    Returns:
+        list[dict]: A list of dictionaries of the desired AT-URIs from the post and user, user did and feed type 
+    """
+    for _ in iter_post_identifiers(did, feed_type, resume=True):
+        pass
+    flush_writes()
+    return get_pending_posts(did, {feed_type: True})
+
+def get_post_identifiers_media_types(did: str, feed_type: str, media_types: list[str], limit: int = 0, archive: bool = False, update: bool = False, num_threads: int = DEFAULT_HYDRATE_THREADS, restore: bool = False, max_age: float = None) -> list[dict]:
     cursor = ""
     con = connect_db()
     db_cursor = con.cursor()
     logger = logging.getLogger(__name__)
-    client = Client()
+    client = get_client(PDS_URL)
     cursor = ""
     res = []
+    writer = get_writer()
+    if not restore:
+        writer.submit(start_run, did, feed_type, limit, archive, update)
 
     while limit > 0 or archive or restore:
         if not restore:
             identifiers = _get_post_identifiers_base(client, did, feed_type, logger, cursor, db_cursor, limit, archive, update)   
             if identifiers == {}:
-                return res
-        post_details = []
+                break
+            writer.submit(save_page, did, feed_type, identifiers["post_uris"], identifiers["cursor"], identifiers["limit"])
         post_uris = identifiers.get("post_uris", []) if not restore else restore_posts(did, {feed_type: True})
-        post_batchs = split_list(post_uris, num_threads)
-
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = []
-            for post_batch in post_batchs:
-                futures.append(executor.submit(fetch_post_details, post_batch))
-            for future in as_completed(futures):
-                post_details.extend(future.result())
-
-        for post in post_details:
-            if "media_type" in post:
-                for media_type in media_types:
-                    if media_type in post["media_type"]:
-                        res.append(post)
+        res.extend(filter_media_types(post_uris, media_types, num_threads, max_age))
         if restore:
             break
         else:
             limit = identifiers["limit"]        
             cursor = identifiers["cursor"] 
+    if not restore:
+        writer.submit(finish_listing, did, feed_type)
+    return res
+
+def filter_media_types(post_uris: list[dict], media_types: list[str], num_threads: int = DEFAULT_HYDRATE_THREADS, max_age: float = None) -> list[dict]:
+    """
+    filter_media_types: gets the post details of the given post identifiers and keeps those containing one of the media types. Post 
+    details are read from the cache where possible, so only posts never fetched before are fetched
+
+    Args:
+        post_uris (list[dict]): post identifiers, e.g. from get_post_identifiers()
+        media_types (list[str]): the media types wanted: image, video and text
+        num_threads (optional, default=DEFAULT_HYDRATE_THREADS, int): number of threads fetching post details
+        max_age (optional, default=None, float): in seconds, cached posts fetched longer ago than this are fetched again, never when None
+
+    Returns:
+        list[dict]: post details, as returned from fetch_post_details(), of the posts that contain one of the media types
+    """
+    res = []
+    post_details = []
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = []
+        for post_batch in get_chunk(post_uris, POST_DETAILS_BATCH_SIZE):
+            futures.append(executor.submit(fetch_post_details, post_batch, True, max_age))
+        for future in as_completed(futures):
+            post_details.extend(future.result())
+
+    for post in post_details:
+        if "media_type" in post:
+            for media_type in media_types:
+                if media_type in post["media_type"]:
+                    res.append(post)
     return res
 
 def _get_post_identifiers_with_retires(params: ParamsDict, client: Client, fetch_amount: int, logger: logging.Logger):
     try:
         return _get_post_identifiers(params, client, fetch_amount, logger)
     except (AtProtocolError, RetryError) as e:
-        logger.error(f"Failure to fetch posts: {e}", exc_info=True) 
+        logger.error("Failure to fetch posts: %s", e, exc_info=True) 
+        get_report().record_failure("com.atproto.repo.listRecords")
         raise
 
 @retry(
     wait=wait_exponential(multiplier=EXP_WAIT_MULTIPLIER, min=EXP_WAIT_MIN, max=EXP_WAIT_MAX), 
-    stop=stop_after_attempt(RETRIES)
+    stop=stop_after_attempt(RETRIES),
+    before_sleep=record_retry
 )
+@timed("com.atproto.repo.listRecords", lambda params, *_: f"{params.get('repo')} {params.get('collection')} cursor: {params.get('cursor') or None}")
 def _get_post_identifiers(params: ParamsDict, client: Client, fetch_amount: int, logger: logging.Logger):
     try:
-        logger.info(f"Attempting to fetch up to {fetch_amount} posts for DID: {params['repo']}, feed_type: {params['collection']}")
-        res = ComAtprotoRepoNamespace(client).list_records(params)  
-        res = json.loads(res.model_dump_json())
+        logger.info("Attempting to fetch up to %d posts for DID: %s, feed_type: %s", fetch_amount, params["repo"], params["collection"])
+        with get_scheduler().slot(host_of(PDS_URL)):
+            res = ComAtprotoRepoNamespace(client).list_records(params)  
+        res = res.model_dump(mode="json")
         return res
     except (AtProtocolError, RetryError):
-        logger.error(f"Error occurred fetching posts from: {params}, fetch amount: {fetch_amount}", exc_info=True)
+        logger.error("Error occurred fetching posts from: %s, fetch amount: %d", params, fetch_amount, exc_info=True)
         raise
@@ -0,0 +1,190 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable
+
+from tqdm import tqdm
+
+from mdfb.core.fetch_post_details import fetch_post_details
+from mdfb.core.download_blobs import download_blobs
+from mdfb.core.shards import ShardWriter
+from mdfb.core.export import ExportWriter
+from mdfb.utils.constants import DEFAULT_DOWNLOAD_THREADS, DEFAULT_HYDRATE_THREADS, PIPELINE_BATCH_WAIT, PIPELINE_QUEUE_SIZE, POST_DETAILS_BATCH_SIZE
+from mdfb.utils.database import write_posts
+from mdfb.utils.helpers import merge_identifiers
+from mdfb.utils.metrics import QUEUE_DEPTH
+
+_DONE = object()
+
+def run_pipeline(
+        sources: list[Iterable[list[dict]]],
+        directory: str,
+        filename_format_string: str = "",
+        include: str = None,
+        media_types: list[str] = None,
+        hydrate_threads: int = DEFAULT_HYDRATE_THREADS,
+        download_threads: int = DEFAULT_DOWNLOAD_THREADS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        blob_store: str = None,
+        cache: bool = False,
+        max_age: float = None,
+        shards: ShardWriter = None,
+        export: ExportWriter = None,
+        account_progress: dict[str, int] = None
+    ) -> int:
+    """
+    run_pipeline: runs listing, hydration and downloading as concurrent stages joined by bounded queues, so that files are written
+    while identifiers are still being listed and memory is bounded by the queue size rather than the size of the account.
+
+    Args:
+        sources (list[Iterable[list[dict]]]): one iterable per feed type, each yielding pages of post identifiers, e.g. from iter_post_identifiers()
+        directory (str): filepath for where the files will be stored
+        filename_format_string (optional, default="", str): the format the filename will follow, uses the download_blobs() default if empty
+        include (optional, default=None, str): Whether to include only the json or media
+        media_types (optional, default=None, list[str]): only download posts that contain one of these media types
+        hydrate_threads (optional, default=DEFAULT_HYDRATE_THREADS, int): number of threads fetching post details
+        download_threads (optional, default=DEFAULT_DOWNLOAD_THREADS, int): number of threads downloading posts
+        queue_size (optional, default=PIPELINE_QUEUE_SIZE, int): maximum number of post identifiers waiting to be hydrated
+        blob_store (optional, default=None, str): directory of a content-addressed store, see download_blobs()
+        cache (optional, default=False, bool): Whether to read the post details from the cache, see fetch_post_details()
+        max_age (optional, default=None, float): in seconds, cached posts fetched longer ago than this are fetched again, never when None
+        shards (optional, default=None, ShardWriter): when given the JSON of each post is appended to its shards, see download_blobs()
+        export (optional, default=None, ExportWriter): when given the metadata of each downloaded post is exported
+        account_progress (optional, default=None, dict[str, int]): when given it is kept up to date with the number of posts 
+        downloaded for each account, by DID
+
+    Returns:
+        int: the number of post identifiers that entered the pipeline
+    """
+    logger = logging.getLogger(__name__)
+    identifier_queue = queue.Queue(maxsize=queue_size)
+    details_queue = queue.Queue(maxsize=max(1, queue_size // POST_DETAILS_BATCH_SIZE))
+    state = {
+        "lock": threading.Lock(),
+        # poster_post_uri to the duplicates waiting for the first copy to be downloaded, None once it has been
+        "claimed": {},
+        "num_identifiers": 0,
+        "account_progress": account_progress
+    }
+    QUEUE_DEPTH.track(identifier_queue.qsize, queue="identifiers")
+    QUEUE_DEPTH.track(details_queue.qsize, queue="details")
+
+    with tqdm(total=0, desc="Downloading files") as progress_bar:
+        with ThreadPoolExecutor(max_workers=max(1, len(sources))) as listers, \
+            ThreadPoolExecutor(max_workers=hydrate_threads) as hydrators, \
+            ThreadPoolExecutor(max_workers=download_threads) as downloaders:
+            list_futures = [listers.submit(_list_stage, source, identifier_queue, state, progress_bar) for source in sources]
+            hydrate_futures = [hydrators.submit(_hydrate_stage, identifier_queue, details_queue, state, progress_bar, media_types, cache, max_age) for _ in range(hydrate_threads)]
+            download_futures = [downloaders.submit(_download_stage, details_queue, state, directory, progress_bar, filename_format_string, include, blob_store, shards, export) for _ in range(download_threads)]
+
+            _wait_stage(list_futures, logger)
+            for _ in range(hydrate_threads):
+                identifier_queue.put(_DONE)
+            _wait_stage(hydrate_futures, logger)
+            for _ in range(download_threads):
+                details_queue.put(_DONE)
+            _wait_stage(download_futures, logger)
+    QUEUE_DEPTH.untrack(queue="identifiers")
+    QUEUE_DEPTH.untrack(queue="details")
+    return state["num_identifiers"]
+
+def _wait_stage(futures: list[Future], logger: logging.Logger):
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            # written above the progress bar rather than through it
+            tqdm.write(f"Error in thread: {e}")
+            logger.error("Error in thread: %s", e, exc_info=True)
+
+def _list_stage(source: Iterable[list[dict]], identifier_queue: queue.Queue, state: dict, progress_bar: tqdm):
+    for page in source:
+        fresh = []
+        downloaded = []
+        with state["lock"]:
+            for post in page:
+                state["num_identifiers"] += 1
+                poster_post_uri = post["poster_post_uri"]
+                if poster_post_uri not in state["claimed"]:
+                    state["claimed"][poster_post_uri] = []
+                    fresh.append(post)
+                elif state["claimed"][poster_post_uri] is None:
+                    # the first one is already downloaded and recorded
+                    downloaded.extend(_identifier_rows(post))
+                else:
+                    # the same post was liked and reposted, only the files of the first one are downloaded and the duplicate is 
+                    # recorded with it, so it is not recorded if the first one is never downloaded
+                    state["claimed"][poster_post_uri].append(post)
+            progress_bar.total += len(fresh)
+            progress_bar.refresh()
+        if downloaded:
+            write_posts(downloaded)
+        for post in fresh:
+            identifier_queue.put(post)
+
+def _identifier_rows(post: dict) -> list[tuple]:
+    return [(post["user_did"], post["user_post_uri"][i], post["feed_type"][i], post["poster_post_uri"]) for i in range(len(post["feed_type"]))]
+
+def _hydrate_stage(identifier_queue: queue.Queue, details_queue: queue.Queue, state: dict, progress_bar: tqdm, media_types: list[str] = None, cache: bool = False, max_age: float = None):
+    logger = logging.getLogger(__name__)
+    done = False
+    while not done:
+        batch, done = _next_batch(identifier_queue)
+        if not batch:
+            continue
+        try:
+            post_details = fetch_post_details(batch, cache, max_age)
+        except Exception as e:
+            logger.error("Error fetching post details for batch: %s", e, exc_info=True)
+            post_details = []
+        if media_types:
+            post_details = [post for post in post_details if any(media_type in post.get("media_type", []) for media_type in media_types)]
+        if len(post_details) != len(batch):
+            with state["lock"]:
+                progress_bar.total -= len(batch) - len(post_details)
+                progress_bar.refresh()
+        if post_details:
+            details_queue.put(post_details)
+
+def _next_batch(identifier_queue: queue.Queue) -> tuple[list[dict], bool]:
+    batch = []
+    item = identifier_queue.get()
+    while item is not _DONE:
+        batch.append(item)
+        if len(batch) >= POST_DETAILS_BATCH_SIZE:
+            return batch, False
+        try:
+            item = identifier_queue.get(timeout=PIPELINE_BATCH_WAIT)
+        except queue.Empty:
+            return batch, False
+    return batch, True
+
+def _download_stage(details_queue: queue.Queue, state: dict, directory: str, progress_bar: tqdm, filename_format_string: str, include: str = None, blob_store: str = None, shards: ShardWriter = None, export: ExportWriter = None):
+    logger = logging.getLogger(__name__)
+    while (post_details := details_queue.get()) is not _DONE:
+        with state["lock"]:
+            for post in post_details:
+                duplicates = state["claimed"][post["poster_post_uri"]]
+                for duplicate in duplicates:
+                    merge_identifiers(post, duplicate)
+                duplicates.clear()
+        try:
+            if not filename_format_string:
+                download_blobs(post_details, directory, progress_bar, include=include, blob_store=blob_store, shards=shards, export=export)
+            else:
+                download_blobs(post_details, directory, progress_bar, filename_format_string, include=include, blob_store=blob_store, shards=shards, export=export)
+        except Exception as e:
+            logger.error("Error in thread: %s", e, exc_info=True)
+            continue
+        downloaded = []
+        with state["lock"]:
+            for post in post_details:
+                # duplicates listed while the first one was downloading
+                for duplicate in state["claimed"][post["poster_post_uri"]]:
+                    downloaded.extend(_identifier_rows(duplicate))
+                state["claimed"][post["poster_post_uri"]] = None
+                if state["account_progress"] is not None:
+                    state["account_progress"][post["user_did"]] = state["account_progress"].get(post["user_did"], 0) + 1
+        if downloaded:
+            write_posts(downloaded)
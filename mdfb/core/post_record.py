@@ -0,0 +1,168 @@
+import sys
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+
+from mdfb.utils.constants import IDENTIFIER_KEYS
+from mdfb.utils.serialization import loads
+
+_FIELDS = ("rkey", "text", "did", "handle", "display_name", "user_did", "user_post_uri", "poster_post_uri", "feed_type", "media_type", "images_cid", "video_cid", "mime_type")
+# shared by many posts, so each distinct value is only held once
+_INTERNED = ("did", "handle", "display_name", "user_did", "mime_type")
+_INTERNED_LISTS = ("feed_type", "media_type")
+_spill = None
+
+def read_blob_sizes(response: dict) -> dict[str, int]:
+    """
+    read_blob_sizes: reads the size of every blob in the post's embed, as reported by app.bsky.feed.getPosts
+
+    Args:
+        response (dict): the response of the post from app.bsky.feed.getPosts
+
+    Returns:
+        dict[str, int]: CID of the blob to its size in bytes, empty if the sizes are not known
+    """
+    record = (response or {}).get("record") or {}
+    embed = record.get("embed") or {}
+    embed = embed.get("media") or embed
+    blobs = [image_obj.get("image") or {} for image_obj in embed.get("images") or []]
+    if embed.get("video"):
+        blobs.append(embed["video"])
+    return {blob["ref"]["link"]: blob["size"] for blob in blobs if blob.get("ref") and blob.get("size")}
+
+def _compact(field: str, value):
+    if field in _INTERNED and isinstance(value, str):
+        return sys.intern(value)
+    if field in _INTERNED_LISTS:
+        return tuple(sys.intern(item) for item in value)
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+class ResponseSpill:
+    """
+    ResponseSpill: an anonymous temporary file holding the responses of posts once they are fetched, so they are not kept in
+    memory until the end of the run. Each response is appended as the compressed row of the post details cache, and read back
+    from its offset when the post is written. Safe to share between threads, the file is deleted when closed.
+
+    Args:
+        directory (optional, default=None, str): directory of the file, the temporary directory of the system when None
+    """
+    def __init__(self, directory: str = None):
+        self.file = tempfile.TemporaryFile(prefix="mdfb_spill_", dir=directory)
+        self.lock = threading.Lock()
+        self.offset = 0
+
+    def write(self, data: bytes) -> int:
+        """
+        write: appends the data to the file
+
+        Args:
+            data (bytes): the data to append
+
+        Returns:
+            int: offset of the data in the file
+        """
+        with self.lock:
+            offset = self.offset
+            self.file.seek(offset)
+            self.file.write(data)
+            self.offset += len(data)
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+class PostRecord:
+    """
+    PostRecord: the post details of a post from fetch_post_details(), holding only the fields needed to download it. The response
+    is spilled to a ResponseSpill and read back whenever the "response" key is read. Read like the post details dict: a media field
+    the post does not have is a missing key. The sizes of its blobs are kept, so downloading it does not read the response.
+
+    Args:
+        post_details (dict): post details from fetch_post_details(), the response is only read for the sizes of the blobs
+        data (bytes): the compressed response without its identifiers, as stored in the post details cache
+        spill (ResponseSpill): where the response is spilled to
+    """
+    __slots__ = _FIELDS + ("_blob_sizes", "_spill", "_offset", "_length")
+
+    def __init__(self, post_details: dict, data: bytes, spill: ResponseSpill):
+        for field in _FIELDS:
+            if field in post_details:
+                setattr(self, field, _compact(field, post_details[field]))
+        self._blob_sizes = tuple(read_blob_sizes(post_details.get("response")).items())
+        self._spill = spill
+        self._offset = spill.write(data)
+        self._length = len(data)
+
+    @property
+    def response(self) -> dict:
+        # the identifiers come first, as they do in the response merged by fetch_post_details()
+        identifiers = {}
+        for key in IDENTIFIER_KEYS:
+            value = self[key]
+            identifiers[key] = list(value) if isinstance(value, tuple) else value
+        return {**identifiers, **loads(zlib.decompress(self._spill.read(self._offset, self._length)))}
+
+    @property
+    def blob_sizes(self) -> dict[str, int]:
+        return dict(self._blob_sizes)
+
+    def __getitem__(self, key: str):
+        if key == "response":
+            return self.response
+        if key not in _FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        # only the identifiers change, when the same post is merged from another feed type or account
+        if key not in IDENTIFIER_KEYS:
+            raise KeyError(key)
+        setattr(self, key, _compact(key, value))
+
+    def __contains__(self, key: str) -> bool:
+        return key == "response" or (key in _FIELDS and hasattr(self, key))
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> list[str]:
+        return [field for field in _FIELDS if hasattr(self, field)] + ["response"]
+
+def get_spill() -> ResponseSpill:
+    return _spill
+
+@contextmanager
+def spill_responses(directory: str = None) -> Iterator[ResponseSpill]:
+    """
+    spill_responses: while in the context, fetch_post_details() returns a PostRecord for each post with its response spilled to a
+    temporary file, rather than a dict holding the whole response
+
+    Args:
+        directory (optional, default=None, str): directory of the temporary file, the temporary directory of the system when None
+
+    Returns:
+        Iterator[ResponseSpill]: the spill, closed and deleted when leaving the context
+    """
+    global _spill
+    spill = ResponseSpill(directory)
+    _spill = spill
+    try:
+        yield spill
+    finally:
+        _spill = None
+        spill.close()
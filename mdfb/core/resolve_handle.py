@@ -1,13 +1,26 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from atproto_identity.handle.resolver import HandleResolver
 from atproto_identity.exceptions import DidNotFoundError
 
-def resolve_handle(handle: str) -> str:
+from mdfb.utils.constants import HANDLE_CACHE_TTL, RESOLVE_THREADS
+from mdfb.utils.database import connect_db, get_handle_did, get_writer, insert_handle_did
+
+_lock = threading.Lock()
+_handle_cache = {} # handle : (did, resolved_at)
+_resolver = None
+
+def resolve_handle(handle: str, ttl: float = HANDLE_CACHE_TTL) -> str:
     """
-    resolve_handle: for a given handle, uses atproto API: com.atproto.identity.resolveHandle, to resolve the handle to a DID
+    resolve_handle: for a given handle, uses atproto API: com.atproto.identity.resolveHandle, to resolve the handle to a DID. The 
+    result is cached in memory and in the database, so each handle is only resolved once every `ttl` seconds.
 
     Args:
         handle (str): handle of the target account
+        ttl (optional, default=HANDLE_CACHE_TTL, float): how long, in seconds, a resolved DID is used before resolving it again
 
     Raises:
         DidNotFoundError: if the handle is able to be resolved
@@ -16,9 +29,70 @@ def resolve_handle(handle: str) -> str:
         str: resolved DID
     """
     logger = logging.getLogger(__name__)
+    # handles are case-insensitive
+    key = handle.lower()
+    now = time.time()
+    with _lock:
+        cached = _handle_cache.get(key)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+
+    row = get_handle_did(connect_db().cursor(), key)
+    if row and now - row[1] < ttl:
+        with _lock:
+            _handle_cache[key] = row
+        return row[0]
+
     try:
-        did = HandleResolver().ensure_resolve(handle)    
+        did = _get_resolver().ensure_resolve(handle)
     except DidNotFoundError:
-        logger.error(f"Unable to resolve handle: {handle}")
+        logger.error("Unable to resolve handle: %s", handle)
         raise DidNotFoundError(f"Unable to resolve handle: {handle}")
-    return did  
\ No newline at end of file
+
+    get_writer().submit(insert_handle_did, key, did, now)
+    with _lock:
+        _handle_cache[key] = (did, now)
+    logger.info("Resolved handle: %s, DID: %s", handle, did)
+    return did
+
+def resolve_handles(handles: list[str], num_threads: int = RESOLVE_THREADS, ttl: float = HANDLE_CACHE_TTL) -> dict[str, str]:
+    """
+    resolve_handles: resolves many handles at once, each through resolve_handle() so cached handles are not looked up again. Handles 
+    that cannot be resolved are logged and left out.
+
+    Args:
+        handles (list[str]): handles of the target accounts
+        num_threads (optional, default=RESOLVE_THREADS, int): number of handles resolved at the same time
+        ttl (optional, default=HANDLE_CACHE_TTL, float): how long, in seconds, a resolved DID is used before resolving it again
+
+    Returns:
+        dict[str, str]: the DID of each handle that was resolved
+    """
+    logger = logging.getLogger(__name__)
+    handles = list(dict.fromkeys(handles))
+    if not handles:
+        return {}
+    dids = {}
+    with ThreadPoolExecutor(max_workers=min(num_threads, len(handles))) as executor:
+        futures = {handle: executor.submit(resolve_handle, handle, ttl) for handle in handles}
+        for handle, future in futures.items():
+            try:
+                dids[handle] = future.result()
+            except Exception as e:
+                logger.error("Unable to resolve handle: %s, %s", handle, e)
+    return dids
+
+def clear_handle_cache():
+    """
+    clear_handle_cache: forgets every handle to DID mapping held in memory, the database is left untouched
+    """
+    with _lock:
+        _handle_cache.clear()
+
+def _get_resolver() -> HandleResolver:
+    # a single resolver keeps its HTTP connections open between lookups
+    global _resolver
+    with _lock:
+        if _resolver is None:
+            _resolver = HandleResolver()
+        return _resolver
@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+
+from atproto_identity.did.resolver import DidResolver
+from atproto_identity.exceptions import DidNotFoundError
+
+from mdfb.utils.constants import PDS_CACHE_TTL
+from mdfb.utils.database import connect_db, get_pds, get_writer, insert_pds
+
+_lock = threading.Lock()
+_pds_cache = {} # did : (pds, resolved_at)
+
+def resolve_pds(did: str, ttl: float = PDS_CACHE_TTL) -> str:
+    """
+    resolve_pds: for a given DID, resolves its DID document to find the endpoint of the PDS hosting the account. The result is cached 
+    in memory and in the database, so each DID is only resolved once every `ttl` seconds.
+
+    Args:
+        did (str): DID of the target account
+        ttl (optional, default=PDS_CACHE_TTL, float): how long, in seconds, a resolved endpoint is used before resolving it again
+
+    Raises:
+        DidNotFoundError: if the DID document could not be resolved or has no PDS endpoint
+
+    Returns:
+        str: the PDS endpoint, e.g. https://morel.us-east.host.bsky.network
+    """
+    logger = logging.getLogger(__name__)
+    now = time.time()
+    with _lock:
+        cached = _pds_cache.get(did)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+
+    row = get_pds(connect_db().cursor(), did)
+    if row and now - row[1] < ttl:
+        with _lock:
+            _pds_cache[did] = row
+        return row[0]
+
+    did_doc = DidResolver().resolve(did)
+    pds = did_doc.get_pds_endpoint() if did_doc else None
+    if not pds:
+        logger.error("Unable to resolve PDS for DID: %s", did)
+        raise DidNotFoundError(f"Unable to resolve PDS for DID: {did}")
+
+    get_writer().submit(insert_pds, did, pds, now)
+    with _lock:
+        _pds_cache[did] = (pds, now)
+    logger.info("Resolved PDS for DID: %s, PDS: %s", did, pds)
+    return pds
+
+def clear_pds_cache():
+    """
+    clear_pds_cache: forgets every DID to PDS mapping held in memory, the database is left untouched
+    """
+    with _lock:
+        _pds_cache.clear()
@@ -0,0 +1,245 @@
+import gzip
+import io
+import os
+import re
+import threading
+from contextlib import nullcontext
+from typing import ContextManager, Iterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from mdfb.utils.constants import SHARD_BUFFER_SIZE, SHARD_SIZE
+from mdfb.utils.serialization import dumps, loads
+
+INDEX_FILENAME = "posts.index.jsonl"
+EXTENSIONS = {
+    None: ".jsonl",
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst"
+}
+_SHARD_PATTERN = re.compile(r"^posts-(\d+)\.jsonl(\.gz|\.zst)?$")
+_local = threading.local()
+_readers = {} # directory : ShardReader
+_readers_lock = threading.Lock()
+
+class ShardWriter:
+    """
+    ShardWriter: appends the JSON of posts, one per line, to shards of at most SHARD_SIZE bytes instead of writing a file per post.
+    Compressed shards hold each post as its own gzip member or zstd frame, so a shard is still a valid .gz or .zst file while any
+    post can be read on its own from its offset. The offset of every post is kept in an index next to the shards, by rkey.
+    Safe to share between threads, each post is written whole.
+
+    Args:
+        directory (str): directory the shards and index are written to
+        compression (optional, default=None, str): None, "gzip" or "zstd"
+        shard_size (optional, default=SHARD_SIZE, int): in bytes, a new shard is started once a shard reaches this size
+    """
+    def __init__(self, directory: str, compression: str = None, shard_size: int = SHARD_SIZE):
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package, install it with: pip install \"mdfb[zstd]\"")
+        self.directory = directory
+        self.compression = compression
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.number = _last_shard_number(directory)
+        self.shard = None
+        self.file = None
+        self.offset = 0
+        self.index = open(os.path.join(directory, INDEX_FILENAME), "ab", buffering=SHARD_BUFFER_SIZE)
+
+    def write(self, post: dict):
+        """
+        write: appends the response of a post, from fetch_post_details(), to the current shard and its offset to the index
+
+        Args:
+            post (dict): post details returned from fetch_post_details()
+        """
+        record = compress(dumps(post["response"]) + b"\n", self.compression)
+        with self.lock:
+            if self.file is None or self.offset >= self.shard_size:
+                self._rotate()
+            self.file.write(record)
+            self.index.write(dumps({
+                "rkey": post["rkey"],
+                "uri": post["poster_post_uri"],
+                "shard": self.shard,
+                "offset": self.offset,
+                "length": len(record)
+            }) + b"\n")
+            self.offset += len(record)
+
+    def flush(self):
+        with self.lock:
+            if self.file:
+                self.file.flush()
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+            self.index.close()
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        self.number += 1
+        self.shard = f"posts-{self.number:05d}{EXTENSIONS[self.compression]}"
+        self.file = open(os.path.join(self.directory, self.shard), "xb", buffering=SHARD_BUFFER_SIZE)
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def open_shards(directory: str, output_format: str = "files", compression: str = None) -> ContextManager[ShardWriter]:
+    """
+    open_shards: opens a ShardWriter for the directory when posts are written as JSONL, closed when leaving the context
+
+    Args:
+        directory (str): directory the shards and index are written to
+        output_format (optional, default="files", str): "files" for a JSON file per post or "jsonl" for shards
+        compression (optional, default=None, str): None, "gzip" or "zstd"
+
+    Returns:
+        ContextManager[ShardWriter]: the writer, or None when writing a file per post
+    """
+    if output_format == "jsonl":
+        return ShardWriter(directory, compression)
+    return nullcontext()
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zstd":
+        # compressors are not safe to share between threads
+        if not hasattr(_local, "compressor"):
+            _local.compressor = zstandard.ZstdCompressor()
+        return _local.compressor.compress(data)
+    return data
+
+def decompress(data: bytes, shard: str) -> bytes:
+    if shard.endswith(".gz"):
+        return gzip.decompress(data)
+    if shard.endswith(".zst"):
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+class ShardReader:
+    """
+    ShardReader: reads single posts from the shards in a directory, by rkey or AT-URI, without reading the rest of their shard. The
+    index is loaded into memory on the first read, and afterwards only the entries appended since are read, so a lookup does not
+    scan the index. When a post was written more than once, the latest copy is read. Safe to share between threads.
+
+    Args:
+        directory (str): directory holding the shards and index
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.by_rkey = {}
+        self.by_uri = {}
+        self.index_id = None
+        self.index_offset = 0
+
+    def read(self, key: str) -> dict:
+        """
+        read: reads a post from its shard
+
+        Args:
+            key (str): rkey or AT-URI of the post
+
+        Returns:
+            dict: the response of the post, None if it is not in the index
+        """
+        self.refresh()
+        with self.lock:
+            entry = self.by_uri.get(key) if key.startswith("at://") else self.by_rkey.get(key)
+        if not entry:
+            return None
+        shard_name, offset, length = entry
+        with open(os.path.join(self.directory, shard_name), "rb") as shard:
+            shard.seek(offset)
+            return loads(decompress(shard.read(length), shard_name))
+
+    def refresh(self):
+        """
+        refresh: loads the entries appended to the index since it was last read, or the whole index when it has been replaced
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            index_id = (stat.st_dev, stat.st_ino)
+            if index_id != self.index_id or stat.st_size < self.index_offset:
+                self.by_rkey.clear()
+                self.by_uri.clear()
+                self.index_id = index_id
+                self.index_offset = 0
+            if stat.st_size == self.index_offset:
+                return
+            with open(self.path, "rb") as index:
+                index.seek(self.index_offset)
+                data = index.read(stat.st_size - self.index_offset)
+            # a line still being written is left for the next refresh
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.splitlines():
+                entry = loads(line)
+                location = (entry["shard"], entry["offset"], entry["length"])
+                self.by_rkey[entry["rkey"]] = location
+                self.by_uri[entry["uri"]] = location
+            self.index_offset += len(data)
+
+def read_post(directory: str, key: str) -> dict:
+    """
+    read_post: reads a single post from the shards in the directory using the index, through a ShardReader kept for the directory
+
+    Args:
+        directory (str): directory holding the shards and index
+        key (str): rkey or AT-URI of the post
+
+    Returns:
+        dict: the response of the post, None if it is not in the index
+    """
+    directory = os.path.abspath(directory)
+    with _readers_lock:
+        reader = _readers.get(directory)
+        if reader is None:
+            reader = _readers[directory] = ShardReader(directory)
+    return reader.read(key)
+
+def iter_shard_posts(directory: str) -> Iterator[dict]:
+    """
+    iter_shard_posts: reads every post from the shards in the directory, in the order they were written
+
+    Args:
+        directory (str): directory holding the shards
+
+    Yields:
+        dict: the response of each post
+    """
+    shards = sorted((int(match.group(1)), name) for name in os.listdir(directory) if (match := _SHARD_PATTERN.match(name)))
+    for _, name in shards:
+        path = os.path.join(directory, name)
+        if name.endswith(".gz"):
+            file = gzip.open(path, "rb")
+        elif name.endswith(".zst"):
+            file = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True))
+        else:
+            file = open(path, "rb")
+        with file:
+            for line in file:
+                yield loads(line)
+
+def _last_shard_number(directory: str) -> int:
+    # later runs into the same directory start a new shard instead of appending to the last one
+    numbers = [int(match.group(1)) for name in os.listdir(directory) if (match := _SHARD_PATTERN.match(name))]
+    return max(numbers, default=0)
@@ -1,81 +1,164 @@
+import asyncio
 import logging
 import traceback
 
 from argparse import ArgumentParser, Namespace
+from contextlib import nullcontext
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator
 
-from mdfb.core.get_post_identifiers import get_post_identifiers, get_post_identifiers_media_types
+from mdfb.core.get_post_identifiers import filter_media_types, get_post_identifiers, get_post_identifiers_media_types, iter_post_identifiers, resume_post_identifiers
+from mdfb.core.fetch_repo import fetch_repo_identifiers
 from mdfb.core.fetch_post_details import fetch_post_details
 from mdfb.core.download_blobs import download_blobs
-from mdfb.core.resolve_handle import resolve_handle
-from mdfb.utils.validation import validate_database, validate_directory, validate_download, validate_format, validate_limit, validate_no_posts, validate_threads
-from mdfb.utils.helpers import split_list, dedupe_posts
-from mdfb.utils.cli_helpers import account_or_did, get_did 
-from mdfb.utils.database import connect_db, delete_user, check_user_has_posts, restore_posts
-from mdfb.utils.logging import setup_logging, setup_resource_monitoring
-from mdfb.utils.constants import DEFAULT_THREADS, MAX_THREADS 
-
-def fetch_posts(did: str, post_types: dict[str, bool], limit: int = 0, archive: bool = False, update: bool = False, media_types: list[str] = None, num_threads: int = 1, restore: bool = False) -> list[dict[str, str]]:
+from mdfb.core.download_blobs_async import download_blobs_async
+from mdfb.core.resolve_handle import resolve_handle, resolve_handles
+from mdfb.core.pipeline import run_pipeline
+from mdfb.core.shards import ShardWriter, open_shards
+from mdfb.core.export import ExportWriter, export_posts, open_export
+from mdfb.core.post_record import spill_responses
+from mdfb.utils.validation import validate_blob_store, validate_concurrency, validate_database, validate_metrics_port, validate_queue_size, validate_refresh_stale, validate_directory, validate_download, validate_format, validate_limit, validate_no_posts, validate_stage_threads
+from mdfb.utils.helpers import dedupe_posts, drain_queue, get_chunk, interleave, split_list, work_queue
+from mdfb.utils.cli_helpers import account_or_did, get_did, is_did, read_accounts_file
+from mdfb.utils.database import close_db, connect_db, delete_user, check_user_has_posts, get_pending_posts, get_run_state, restore_posts
+from mdfb.utils.clients import close_clients
+from mdfb.utils.logging import LOG_LEVELS, setup_logging, setup_resource_monitoring
+from mdfb.utils.metrics import start_metrics_server, start_metrics_snapshots
+from mdfb.utils.report import get_report, start_report
+from mdfb.utils.constants import DEFAULT_CONCURRENCY, DEFAULT_DOWNLOAD_THREADS, DEFAULT_HYDRATE_THREADS, DEFAULT_LIST_THREADS, MAX_CONCURRENCY, MAX_THREADS, METRICS_INTERVAL, PIPELINE_QUEUE_SIZE, POST_DETAILS_BATCH_SIZE
+
+def fetch_posts(did: str, post_types: dict[str, bool], limit: int = 0, archive: bool = False, update: bool = False, media_types: list[str] = None, num_threads: int = 1, restore: bool = False, hydrate_threads: int = DEFAULT_HYDRATE_THREADS, car: bool = False, resume: bool = False, max_age: float = None) -> list[dict[str, str]]:
     post_uris = []
+    if car:
+        identifiers = fetch_repo_identifiers(did, [post_type for post_type, wanted in post_types.items() if wanted])
+        for post_type_uris in identifiers.values():
+            post_uris.extend(filter_media_types(post_type_uris, media_types, hydrate_threads, max_age) if media_types else post_type_uris)
+        return dedupe_posts(post_uris)
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         futures = []
         for post_type, wanted in post_types.items():
             if wanted:
-                if update:
+                if resume:
+                    futures.append(executor.submit(resume_post_identifiers, did, post_type))
+                elif update:
                     if check_user_has_posts(connect_db().cursor(), did, post_type):
                         futures.append(executor.submit(get_post_identifiers, did, post_type, archive=archive, update=update))
                     else:
                         raise ValueError(f"This user has no post in database for feed_type: {post_type}, cannot update as you have not downloaded any post for feed_type: {post_type}.")
                 else:
                     if media_types:
-                        futures.append(executor.submit(get_post_identifiers_media_types, did, post_type, media_types, limit=limit, archive=archive, update=update, num_threads=num_threads, restore=restore))
+                        futures.append(executor.submit(get_post_identifiers_media_types, did, post_type, media_types, limit=limit, archive=archive, update=update, num_threads=hydrate_threads, restore=restore, max_age=max_age))
                     elif restore:
                         futures.append(executor.submit(restore_posts, did, {post_type: wanted}))
                     else:
                         futures.append(executor.submit(get_post_identifiers, did, post_type, limit=limit, archive=archive, update=update))
         for future in as_completed(futures):
             post_uris.extend(future.result())
+    if resume and media_types:
+        post_uris = filter_media_types(post_uris, media_types, hydrate_threads, max_age)
     return dedupe_posts(post_uris)
 
-def process_posts(posts: list, num_threads: int) -> list[dict]:
+def pipeline_sources(did: str, post_types: dict[str, bool], limit: int = 0, archive: bool = False, update: bool = False, restore: bool = False, car: bool = False, resume: bool = False) -> list[Iterable[list[dict]]]:
+    """
+    pipeline_sources: builds the lazy identifier sources, one per wanted post type, that feed run_pipeline()
+
+    Args:
+        did (str): DID of the target account, or None when restoring every account
+        post_types (dict[str, bool]): the post types and whether they are wanted
+        limit (optional, default=0, int): The amount wanted to get
+        archive (optional, default=False, bool): Will download all posts of the wanted type
+        update (optional, default=False, bool): Will only latest posts that have not been downloaded
+        restore (optional, default=False, bool): Will read the identifiers from the database
+        car (optional, default=False, bool): Will read the identifiers from the repository of the account, downloaded once as a CAR file
+        resume (optional, default=False, bool): Will continue the interrupted run of the account
+
+    Raises:
+        ValueError: If updating and the account has no downloaded posts, or resuming and there is no interrupted run
+
+    Returns:
+        list[Iterable[list[dict]]]: a list of iterables, each yielding pages of post identifiers
+    """
+    if car:
+        identifiers = fetch_repo_identifiers(did, [post_type for post_type, wanted in post_types.items() if wanted])
+        return [[post_type_uris] for post_type_uris in identifiers.values()]
+    sources = []
+    for post_type, wanted in post_types.items():
+        if not wanted:
+            continue
+        if update and not check_user_has_posts(connect_db().cursor(), did, post_type):
+            raise ValueError(f"This user has no post in database for feed_type: {post_type}, cannot update as you have not downloaded any post for feed_type: {post_type}.")
+        if resume and not get_run_state(connect_db().cursor(), did, post_type):
+            raise ValueError(f"There is no interrupted run to resume for feed_type: {post_type}.")
+        if resume:
+            sources.append(_resume_pages(did, post_type))
+        elif restore:
+            sources.append(_restore_pages(did, post_type))
+        else:
+            sources.append(iter_post_identifiers(did, post_type, limit=limit, archive=archive, update=update))
+    return sources
+
+def _restore_pages(did: str, post_type: str) -> Iterator[list[dict]]:
+    yield restore_posts(did, {post_type: True})
+
+def _resume_pages(did: str, post_type: str) -> Iterator[list[dict]]:
+    # the posts listed before the interruption, then the rest of the listing
+    yield get_pending_posts(did, {post_type: True})
+    yield from iter_post_identifiers(did, post_type, resume=True)
+
+def process_posts(posts: list, num_threads: int, cache: bool = False, max_age: float = None) -> list[dict]:
     """
-    process_posts: processes the given list of post URIs to get the post details required for downloading, can be threaded 
+    process_posts: processes the given list of post URIs to get the post details required for downloading, can be threaded.
+    Every getPosts sized chunk is its own task, so idle threads keep pulling chunks until none are left 
 
     Args:
         posts (list): list of URIs of the post wanted
         num_threads (int): number of threads 
+        cache (optional, default=False, bool): Whether to read the post details from the cache, see fetch_post_details()
+        max_age (optional, default=None, float): in seconds, cached posts fetched longer ago than this are fetched again, never when None
 
     Returns:
         list[dict]: list of dictionaries that contain post details for each post
     """
-    posts = split_list(posts, num_threads)
     post_details = []
     
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         futures = []
-        for post_batch in posts:
-            futures.append(executor.submit(fetch_post_details, post_batch))
+        for post_batch in get_chunk(posts, POST_DETAILS_BATCH_SIZE):
+            futures.append(executor.submit(fetch_post_details, post_batch, cache, max_age))
         for future in as_completed(futures):
             post_details.extend(future.result())
     return post_details
 
-def download_posts(post_links: list[dict], num_of_posts: int, num_threads: int, filename_format_string: str, directory: str, include: str = None):
+def download_posts(post_details: list[dict], num_of_posts: int, num_threads: int, filename_format_string: str, directory: str, include: str = None, blob_store: str = None, shards: ShardWriter = None, export: ExportWriter = None):
     logger = logging.getLogger(__name__)
+    posts = work_queue(post_details)
     with tqdm(total=num_of_posts, desc="Downloading files") as progress_bar:
         with ThreadPoolExecutor(max_workers=num_threads) as executor:
             futures = []
-            for batch_post_link in post_links:
+            for _ in range(num_threads):
                 if not filename_format_string:
-                    futures.append(executor.submit(download_blobs, batch_post_link, directory, progress_bar, include=include))
+                    futures.append(executor.submit(download_blobs, drain_queue(posts), directory, progress_bar, include=include, blob_store=blob_store, shards=shards, export=export))
                 else:
-                    futures.append(executor.submit(download_blobs, batch_post_link, directory, progress_bar, filename_format_string, include=include))
+                    futures.append(executor.submit(download_blobs, drain_queue(posts), directory, progress_bar, filename_format_string, include=include, blob_store=blob_store, shards=shards, export=export))
             for future in as_completed(futures):
                 try:
                     future.result()
                 except Exception as e:
                     print(f"Error in thread: {e}")
-                    logger.error(f"Error in thread: {e}", exc_info=True)
+                    logger.error("Error in thread: %s", e, exc_info=True)
+
+def download_posts_async(post_details: list[dict], num_of_posts: int, concurrency: int, filename_format_string: str, directory: str, include: str = None, blob_store: str = None, shards: ShardWriter = None, export: ExportWriter = None):
+    logger = logging.getLogger(__name__)
+    with tqdm(total=num_of_posts, desc="Downloading files") as progress_bar:
+        try:
+            if not filename_format_string:
+                asyncio.run(download_blobs_async(post_details, directory, progress_bar, include=include, concurrency=concurrency, blob_store=blob_store, shards=shards, export=export))
+            else:
+                asyncio.run(download_blobs_async(post_details, directory, progress_bar, filename_format_string, include=include, concurrency=concurrency, blob_store=blob_store, shards=shards, export=export))
+        except Exception as e:
+            print(f"Error in event loop: {e}")
+            logger.error("Error in event loop: %s", e, exc_info=True)
                     
 def handle_db(args: Namespace, parser: ArgumentParser):
     validate_database()
@@ -84,16 +167,29 @@ def handle_db(args: Namespace, parser: ArgumentParser):
         delete_user(did)
         return 
 
+def handle_export(args: Namespace, parser: ArgumentParser):
+    directory = validate_directory(args.directory, parser)
+    print("Exporting posts...")
+    count = export_posts(directory, args.output, args.format)
+    print(f"Exported {count} post(s) to: {args.output}")
+
 def handle_download(args: Namespace, parser: ArgumentParser):
-    did = get_did(args)
     directory = validate_directory(args.directory, parser)
     filename_format_string = validate_format(args.format) if args.format else ""
-    setup_logging(directory)
+    setup_logging(directory, LOG_LEVELS[args.log_level])
     if args.resource:
         setup_resource_monitoring(directory)
+    if args.metrics_port:
+        start_metrics_server(validate_metrics_port(args.metrics_port))
+    if args.metrics_file:
+        start_metrics_snapshots(args.metrics_file)
     validate_database()
+    # handles are resolved through the cache in the database, so it has to exist first
+    did = get_did(args) if not args.accounts_file else None
 
-    num_threads = validate_threads(args.threads) if args.threads else DEFAULT_THREADS
+    stage_threads = validate_stage_threads(args)
+    blob_store = validate_blob_store(args.blob_store, directory)
+    max_age = validate_refresh_stale(args.refresh_stale) if args.refresh_stale else None
     
     post_types = {
         "like": args.like,
@@ -101,32 +197,138 @@ def handle_download(args: Namespace, parser: ArgumentParser):
         "post": args.post
     }
 
+    report = start_report()
+    with spill_responses(directory) if args.low_memory else nullcontext():
+        if args.accounts_file:
+            with report.phase("pipeline"):
+                handle_accounts(args, post_types, stage_threads, filename_format_string, directory, max_age)
+        elif args.pipeline:
+            with report.phase("pipeline"):
+                handle_pipeline(args, did, post_types, stage_threads, filename_format_string, directory, max_age)
+        else:
+            handle_sequential(args, did, post_types, stage_threads, filename_format_string, directory, blob_store, max_age)
+    with report.phase("db_commit"):
+        close_db()
+    print(f"Report written to: {report.write(directory)}")
+
+def handle_sequential(args: Namespace, did: str, post_types: dict[str, bool], stage_threads: dict[str, int], filename_format_string: str, directory: str, blob_store: str = None, max_age: float = None):
+    report = get_report()
     print("Fetching post identifiers...")
-    if args.restore:
-        posts = fetch_posts(did, post_types, archive=True, media_types=args.media_types, num_threads=num_threads, restore=True)
-    elif args.archive:
-        posts = fetch_posts(did, post_types, archive=True, media_types=args.media_types, num_threads=num_threads)
-    elif args.update:
-        posts = fetch_posts(did, post_types, archive=True, update=True, media_types=args.media_types, num_threads=num_threads)
-    else:
-        limit = validate_limit(args.limit)
-        posts = fetch_posts(did, post_types, limit=limit, media_types=args.media_types, num_threads=num_threads)
+    with report.phase("identifiers"):
+        if args.restore:
+            posts = fetch_posts(did, post_types, archive=True, media_types=args.media_types, num_threads=stage_threads["list"], restore=True, hydrate_threads=stage_threads["hydrate"], max_age=max_age)
+        elif args.resume:
+            posts = fetch_posts(did, post_types, media_types=args.media_types, num_threads=stage_threads["list"], hydrate_threads=stage_threads["hydrate"], resume=True, max_age=max_age)
+        elif args.archive:
+            posts = fetch_posts(did, post_types, archive=True, media_types=args.media_types, num_threads=stage_threads["list"], hydrate_threads=stage_threads["hydrate"], car=args.car, max_age=max_age)
+        elif args.update:
+            posts = fetch_posts(did, post_types, archive=True, update=True, media_types=args.media_types, num_threads=stage_threads["list"], hydrate_threads=stage_threads["hydrate"], max_age=max_age)
+        else:
+            limit = validate_limit(args.limit)
+            posts = fetch_posts(did, post_types, limit=limit, media_types=args.media_types, num_threads=stage_threads["list"], hydrate_threads=stage_threads["hydrate"], max_age=max_age)
     wanted_post_types = [post_type for post_type, wanted in post_types.items() if wanted]
     account = account_or_did(args, did)
-    validate_no_posts(posts, account, wanted_post_types, args.update, did, args.restore)
+    validate_no_posts(posts, account, wanted_post_types, args.update, did, args.restore, args.resume)
 
     if args.media_types:
         post_details = posts
     else:
         print("Getting post details...")
-        post_details = process_posts(posts, num_threads)
+        with report.phase("hydration"):
+            post_details = process_posts(posts, stage_threads["hydrate"], cache=bool(args.restore), max_age=max_age)
 
     num_of_posts = len(post_details)
-    post_links = split_list(post_details, num_threads)
+    with report.phase("download"), open_export(args.export) as export, open_shards(directory, args.output_format, args.compression) as shards:
+        if args.engine == "async":
+            concurrency = validate_concurrency(args.concurrency) if args.concurrency else DEFAULT_CONCURRENCY
+            download_posts_async(post_details, num_of_posts, concurrency, filename_format_string, directory, args.include, blob_store, shards, export)
+        else:
+            download_posts(post_details, num_of_posts, stage_threads["download"], filename_format_string, directory, args.include, blob_store, shards, export)
 
-    download_posts(post_links, num_of_posts, num_threads, filename_format_string, directory, args.include)
+def handle_pipeline(args: Namespace, did: str, post_types: dict[str, bool], stage_threads: dict[str, int], filename_format_string: str, directory: str, max_age: float = None):
+    queue_size = validate_queue_size(args.queue_size) if args.queue_size else PIPELINE_QUEUE_SIZE
+    if args.restore:
+        sources = pipeline_sources(did, post_types, restore=True)
+    elif args.resume:
+        sources = pipeline_sources(did, post_types, resume=True)
+    elif args.archive:
+        sources = pipeline_sources(did, post_types, archive=True, car=args.car)
+    elif args.update:
+        sources = pipeline_sources(did, post_types, archive=True, update=True)
+    else:
+        sources = pipeline_sources(did, post_types, limit=validate_limit(args.limit))
 
-def main():
+    print("Streaming posts...")
+    with open_export(args.export) as export, open_shards(directory, args.output_format, args.compression) as shards:
+        num_identifiers = run_pipeline(sources, directory, filename_format_string, args.include, args.media_types, stage_threads["hydrate"], stage_threads["download"], queue_size, validate_blob_store(args.blob_store, directory), bool(args.restore or args.media_types), max_age, shards, export)
+    if not num_identifiers:
+        wanted_post_types = [post_type for post_type, wanted in post_types.items() if wanted]
+        validate_no_posts([], account_or_did(args, did), wanted_post_types, args.update, did, args.restore, args.resume)
+
+def handle_accounts(args: Namespace, post_types: dict[str, bool], stage_threads: dict[str, int], filename_format_string: str, directory: str, max_age: float = None):
+    """
+    handle_accounts: downloads every account in --accounts-file in a single run of the pipeline. The accounts share the scheduler,
+    HTTP clients, database writer and claimed posts, so a post liked or reposted by many of them is only downloaded once. Each 
+    listing thread takes a page from each of its accounts in turn, so a large account does not hold up the others.
+
+    Args:
+        args (Namespace): the parsed arguments of download
+        post_types (dict[str, bool]): the post types and whether they are wanted
+        stage_threads (dict[str, int]): number of threads of each stage, from validate_stage_threads()
+        filename_format_string (str): the format the filename will follow, uses the download_blobs() default if empty
+        directory (str): filepath for where the files will be stored
+        max_age (optional, default=None, float): in seconds, cached posts fetched longer ago than this are fetched again, never when None
+
+    Raises:
+        ValueError: If none of the accounts could be resolved
+    """
+    queue_size = validate_queue_size(args.queue_size) if args.queue_size else PIPELINE_QUEUE_SIZE
+    if args.resume:
+        options = {"resume": True}
+    elif args.archive:
+        options = {"archive": True, "car": args.car}
+    elif args.update:
+        options = {"archive": True, "update": True}
+    else:
+        options = {"limit": validate_limit(args.limit)}
+
+    accounts = read_accounts_file(args.accounts_file)
+    handle_dids = resolve_handles([account for account in accounts if not is_did(account)])
+    account_dids = {}
+    for account in accounts:
+        did = account if is_did(account) else handle_dids.get(account)
+        if did:
+            account_dids[account] = did
+        else:
+            print(f"Skipping account: {account}, unable to resolve handle")
+    if not account_dids:
+        raise ValueError(f"None of the accounts in: {args.accounts_file} could be resolved")
+
+    listed = {}
+    downloaded = {}
+    pages = [_account_pages(account, did, post_types, listed, options) for account, did in account_dids.items()]
+    sources = [interleave(group) for group in split_list(pages, min(stage_threads["list"], len(pages)))]
+
+    print(f"Streaming posts of {len(account_dids)} accounts...")
+    with open_export(args.export) as export, open_shards(directory, args.output_format, args.compression) as shards:
+        run_pipeline(sources, directory, filename_format_string, args.include, args.media_types, stage_threads["hydrate"], stage_threads["download"], queue_size, validate_blob_store(args.blob_store, directory), bool(args.media_types), max_age, shards, export, downloaded)
+    for account, did in account_dids.items():
+        print(f"{account}: listed {listed.get(did, 0)} post(s), downloaded {downloaded.get(did, 0)} post(s)")
+
+def _account_pages(account: str, did: str, post_types: dict[str, bool], listed: dict[str, int], options: dict) -> Iterator[list[dict]]:
+    # an account that fails is reported and skipped, the rest carry on
+    listed[did] = 0
+    try:
+        for page in interleave(pipeline_sources(did, post_types, **options)):
+            listed[did] += len(page)
+            yield page
+    except Exception as e:
+        logging.getLogger(__name__).error("Error listing posts for account: %s, %s", account, e, exc_info=True)
+        tqdm.write(f"Stopped listing account: {account}, {e}")
+        return
+    tqdm.write(f"Listed {listed[did]} post(s) for account: {account}")
+
+def make_parser() -> ArgumentParser:
     parser = ArgumentParser()
 
     subparsers = parser.add_subparsers(dest="subcommand", required=False)
@@ -136,7 +338,10 @@ def main():
     common_parser.add_argument("--like", action="store_true", help="To retreive liked posts")
     common_parser.add_argument("--post", action="store_true", help="To retreive posts")
     common_parser.add_argument("--repost", action="store_true", help="To retreive reposts")
-    common_parser.add_argument("--threads", "-t", action="store", help=f"Number of threads, maximum of {MAX_THREADS} threads")
+    common_parser.add_argument("--threads", "-t", action="store", help=f"Number of threads for every stage, maximum of {MAX_THREADS} threads")
+    common_parser.add_argument("--list-threads", action="store", help=f"Number of threads listing post identifiers, default of {DEFAULT_LIST_THREADS}")
+    common_parser.add_argument("--hydrate-threads", action="store", help=f"Number of threads fetching post details, default of {DEFAULT_HYDRATE_THREADS}")
+    common_parser.add_argument("--download-threads", action="store", help=f"Number of threads downloading posts, default of {DEFAULT_DOWNLOAD_THREADS}")
     common_parser.add_argument("--format", "-f", action="store", help="Format string for filename e.g '{RKEY}_{DID}'. Valid keywords are: [RKEY, HANDLE, TEXT, DISPLAY_NAME, DID]")
     common_parser.add_argument("--did", "-d", action="store", help="The DID associated with the account")
     common_parser.add_argument("--handle", action="store", help="The handle for the account e.g. johnny.bsky.social")
@@ -146,16 +351,41 @@ def main():
     database_parser.add_argument("--delete_user", action="store", help="Delete all posts from this user")
     database_parser.add_argument("directory", nargs="?", action="store", default="", help="Directory for where all downloaded post will be stored")
 
+    export_parser = subparsers.add_parser("export", help="Export the metadata of downloaded posts to a Parquet file or SQLite database")
+    export_parser.add_argument("directory", action="store", help="Directory the posts were downloaded to")
+    export_parser.add_argument("output", action="store", help="The Parquet file or SQLite database to write")
+    export_parser.add_argument("--format", choices=["parquet", "sqlite"], help="Format of the export, chosen by the extension of the output when not given")
+
     download_parser = subparsers.add_parser("download", help="Download posts", parents=[common_parser])
     download_parser.add_argument("directory", action="store", help="Directory for where all downloaded post will be stored")
     download_parser.add_argument("--media-types", choices=["image", "video", "text"], nargs="+", help="Only download posts that contain this type of media")    
     download_parser.add_argument("--include", "-i", nargs=1, choices=["json", "media"], help="Whether to include the json of the post, or media attached to the post")
+    download_parser.add_argument("--car", action="store_true", help="Used with --archive, downloads the whole repository of the account once instead of listing posts 100 at a time")
+    download_parser.add_argument("--blob-store", nargs="?", const=True, help="Download each image and video once into a content-addressed store, blobs/ in the download directory or the directory given, and hardlink it to its filename")
+    download_parser.add_argument("--accounts-file", action="store", help="A file of handles or DIDs, one per line, to download every account in one run instead of a single --handle or --did")
+    download_parser.add_argument("--output-format", choices=["files", "jsonl"], default="files", help="Write the JSON of each post to a file of its own, or append it to rotating JSONL shards with an index by rkey")
+    download_parser.add_argument("--compression", choices=["gzip", "zstd"], help="Compress each post in the JSONL shards when using --output-format jsonl")
+    download_parser.add_argument("--export", action="store", help="Also write the metadata of each downloaded post to this Parquet file or SQLite database, chosen by its extension: .parquet, .db or .sqlite")
+    download_parser.add_argument("--refresh-stale", action="store", help="Fetch the details of a post again when the copy cached by an earlier download is older than this many days, used by --restore and --media-types")
+    download_parser.add_argument("--metrics-port", action="store", help="Serve live metrics in the Prometheus format at http://127.0.0.1:PORT/metrics while downloading")
+    download_parser.add_argument("--metrics-file", action="store", help=f"Append a JSON snapshot of the metrics to this file every {METRICS_INTERVAL} seconds while downloading")
+    download_parser.add_argument("--low-memory", action="store_true", help="Keep only the fields needed to download each post in memory, and spill the rest of its details to a temporary file in the download directory until it is written")
+    download_parser.add_argument("--log-level", choices=list(LOG_LEVELS), default="info", help="Lowest level written to the log file, 'debug' also logs a line for every post, file and request")
+    download_parser.add_argument("--pipeline", action="store_true", help="Stream posts through listing, fetching details and downloading at the same time instead of one phase after another")
+    download_parser.add_argument("--queue-size", action="store", help=f"Maximum number of posts waiting between stages when using --pipeline, default of {PIPELINE_QUEUE_SIZE}")
+    download_parser.add_argument("--engine", choices=["thread", "async"], default="thread", help="Engine used to download posts, 'async' keeps many downloads in flight on a single event loop")
+    download_parser.add_argument("--concurrency", "-c", action="store", help=f"Maximum number of posts downloaded at once when using --engine async, default of {DEFAULT_CONCURRENCY} and maximum of {MAX_CONCURRENCY}")
 
     group_archive_limit = download_parser.add_mutually_exclusive_group(required=True)
     group_archive_limit.add_argument("--limit", "-l", action="store", help="The number of posts to be downloaded") 
     group_archive_limit.add_argument("--restore", nargs="?", const=True, help="Restore all posts in the database or for those for a specified handle")
     group_archive_limit.add_argument("--archive", action="store_true", help="To archive all posts of the specified types")
     group_archive_limit.add_argument("--update", "-u", action="store_true", help="Downloads latest posts that haven't been downloaded")
+    group_archive_limit.add_argument("--resume", action="store_true", help="Continues an interrupted run of the specified types from where it stopped")
+    return parser
+
+def main():
+    parser = make_parser()
     args = parser.parse_args()
     try:
         if args.subcommand == "download":
@@ -163,9 +393,14 @@ def main():
             handle_download(args, parser)
         elif args.subcommand == "db":
             handle_db(args, parser)
+        elif args.subcommand == "export":
+            handle_export(args, parser)
     except Exception as e:
         print(f"Error: {e}")
         traceback.print_exc()
+    finally:
+        close_clients()
+        close_db()
         
 if __name__ == "__main__":
     main()  
\ No newline at end of file
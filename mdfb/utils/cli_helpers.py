@@ -17,6 +17,30 @@ def is_did(did: str) -> bool:
         return False
     return True
 
+def read_accounts_file(path: str) -> list[str]:
+    """
+    read_accounts_file: reads the handles and DIDs of the accounts in the file, one per line. Blank lines and lines starting with # 
+    are skipped, and an account listed more than once is only read once.
+
+    Args:
+        path (str): path of the file
+
+    Raises:
+        ValueError: If the file lists no accounts
+
+    Returns:
+        list[str]: the handles and DIDs, in the order they are listed
+    """
+    accounts = {}
+    with open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            account = line.strip()
+            if account and not account.startswith("#"):
+                accounts[account] = None
+    if not accounts:
+        raise ValueError(f"There are no accounts in the file: {path}")
+    return list(accounts)
+
 def account_or_did(args: argparse.ArgumentParser, did: str) -> str:
     if args.restore:
         return args.restore
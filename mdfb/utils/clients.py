@@ -0,0 +1,132 @@
+import threading
+import time
+
+import httpx
+from atproto import Client
+from atproto_client.request import Request, RequestBase
+
+from mdfb.utils.metrics import RATE_LIMITED, REQUEST_SECONDS, REQUESTS
+from mdfb.utils.rate_limiter import get_rate_limiter
+from mdfb.utils.constants import HTTP_CONNECT_TIMEOUT, HTTP_KEEPALIVE_EXPIRY, HTTP_MAX_CONNECTIONS, HTTP_TIMEOUT, PDS_URL
+
+_lock = threading.RLock()
+_http_client = None
+_clients = {}
+
+class PooledRequest(Request):
+    """
+    PooledRequest: an atproto Request that sends every call through the process-wide httpx connection pool, 
+    rather than opening a new pool, and so a new TCP/TLS handshake, for every Client.
+    """
+    def __init__(self, http_client: httpx.Client = None) -> None:
+        RequestBase.__init__(self)
+        self._client = http_client if http_client else get_http_client()
+
+    def clone(self) -> "PooledRequest":
+        cloned_request = type(self)(self._client)
+        cloned_request.set_additional_headers(self.get_headers())
+        return cloned_request
+
+    def close(self) -> None:
+        # the pool is shared with every other client, it is closed by close_clients()
+        pass
+
+def get_http_client() -> httpx.Client:
+    """
+    get_http_client: returns the process-wide httpx client, creating it on first use. It keeps connections alive between requests 
+    and is safe to share between threads.
+
+    Returns:
+        httpx.Client: the shared httpx client
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                follow_redirects=True,
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                event_hooks={"request": [_limit_request], "response": [_observe_response]}
+            )
+        return _http_client
+
+def get_client(base_url: str = PDS_URL) -> Client:
+    """
+    get_client: returns the shared atproto Client for the given host, creating it on first use. Every client sends its requests 
+    through the pool from get_http_client().
+
+    Args:
+        base_url (optional, default=PDS_URL, str): the host the client sends requests to
+
+    Returns:
+        Client: the shared atproto Client for that host
+    """
+    with _lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = Client(base_url, request=PooledRequest(get_http_client()))
+            _clients[base_url] = client
+        return client
+
+def make_async_http_client(max_connections: int = HTTP_MAX_CONNECTIONS) -> httpx.AsyncClient:
+    """
+    make_async_http_client: creates an httpx.AsyncClient with a keep-alive connection pool sized for the given concurrency
+
+    Args:
+        max_connections (optional, default=HTTP_MAX_CONNECTIONS, int): the maximum number of open connections
+
+    Returns:
+        httpx.AsyncClient: the client, close it with `await client.aclose()`
+    """
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        event_hooks={"request": [_limit_request_async], "response": [_observe_response_async]}
+    )
+
+def _limit_request(request: httpx.Request):
+    get_rate_limiter().acquire(request.url.host)
+    # time spent waiting on the rate limiter is not part of the latency of the request
+    request.extensions["mdfb_sent_at"] = time.perf_counter()
+
+def _observe_response(response: httpx.Response):
+    get_rate_limiter().observe(response.request.url.host, response.status_code, response.headers)
+    _record_response(response)
+
+async def _limit_request_async(request: httpx.Request):
+    await get_rate_limiter().acquire_async(request.url.host)
+    request.extensions["mdfb_sent_at"] = time.perf_counter()
+
+async def _observe_response_async(response: httpx.Response):
+    get_rate_limiter().observe(response.request.url.host, response.status_code, response.headers)
+    _record_response(response)
+
+def _record_response(response: httpx.Response):
+    request = response.request
+    endpoint = request.url.path.rsplit("/", 1)[-1]
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    sent_at = request.extensions.get("mdfb_sent_at")
+    if sent_at is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - sent_at, endpoint=endpoint)
+    if response.status_code == 429:
+        RATE_LIMITED.inc(host=request.url.host)
+
+def close_clients():
+    """
+    close_clients: closes the shared connection pool and forgets every shared client
+    """
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        _clients.clear()
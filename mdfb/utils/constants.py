@@ -1,10 +1,48 @@
-MAX_THREADS = 3
-DELAY = 0.25 # in seconds
-DEFAULT_THREADS = 1
+MAX_THREADS = 64
+DEFAULT_LIST_THREADS = 3
+DEFAULT_HYDRATE_THREADS = 4
+DEFAULT_DOWNLOAD_THREADS = 16
+DEFAULT_CONCURRENCY = 100
+MAX_CONCURRENCY = 1000
 RETRIES = 5
+PDS_URL = "https://bsky.social"
+APPVIEW_URL = "https://public.api.bsky.app/"
+PDS_CACHE_TTL = 24 * 60 * 60 # in seconds
+HANDLE_CACHE_TTL = 6 * 60 * 60 # in seconds
+RESOLVE_THREADS = 8 # handles resolved at once
+RATE_LIMIT_DEFAULT = 10 # requests per second, per host, until the host reports its own limit
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_MIN = 0.5 # requests per second
+RATE_LIMIT_MAX = 100 # requests per second
+RATE_LIMIT_BACKOFF = 5 # in seconds, used when a 429 carries no reset time
+HTTP_TIMEOUT = 30 # in seconds
+HTTP_CONNECT_TIMEOUT = 10 # in seconds
+HTTP_KEEPALIVE_EXPIRY = 30 # in seconds
+HTTP_MAX_CONNECTIONS = 100
+BLOB_CHUNK_SIZE = 64 * 1024 # in bytes
+HOST_CONCURRENCY_DEFAULT = 16 # requests in flight per host
+HOST_CONCURRENCY = {
+    "public.api.bsky.app": 8,
+    "bsky.social": 8
+}
 EXP_WAIT_MULTIPLIER = 1
 EXP_WAIT_MAX = 16
 EXP_WAIT_MIN = 0.5 
+POST_DETAILS_BATCH_SIZE = 25
+IDENTIFIER_KEYS = ("user_did", "user_post_uri", "feed_type", "poster_post_uri")
+DB_BUSY_TIMEOUT = 30 # in seconds, how long a connection waits for the database lock
+DB_CACHE_SIZE = 16 * 1024 # in KiB, page cache per connection
+WRITER_BATCH_SIZE = 500 # writes committed per transaction by the writer thread
+EXISTS_BATCH_SIZE = 500 # kept well under the SQLite limit on query parameters
+CHECKPOINT_INTERVAL = 25 # downloaded posts recorded per transaction
+SHARD_SIZE = 256 * 1024 * 1024 # in bytes, as written to disk
+SHARD_BUFFER_SIZE = 1024 * 1024 # in bytes
+EXPORT_ROW_GROUP_SIZE = 10_000 # rows
+PIPELINE_QUEUE_SIZE = 500
+METRICS_INTERVAL = 15 # in seconds, between JSON snapshots
+REPORT_SLOWEST = 10 # slowest items kept for each API call in the run report
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # in seconds
+PIPELINE_BATCH_WAIT = 0.5 # in seconds
 VALID_FILENAME_OPTIONS = {
     "RKEY",
     "HANDLE",
@@ -1,11 +1,19 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
 import platformdirs
 import os
+import time
 
-def create_db(path: str):
-    con = sqlite3.connect(os.path.join(path, "mdfb.db"))
-    cur = con.cursor()
-    cur.execute("""
+from mdfb.utils.metrics import DB_WRITE_SECONDS, DB_WRITES, QUEUE_DEPTH
+from mdfb.utils.constants import DB_BUSY_TIMEOUT, DB_CACHE_SIZE, EXISTS_BATCH_SIZE, WRITER_BATCH_SIZE
+
+MIGRATIONS = [
+    # 1: downloaded posts
+    [
+        """
         CREATE TABLE IF NOT EXISTS downloaded_posts (
             user_did TEXT NOT NULL,
             user_post_uri TEXT NOT NULL,
@@ -13,11 +21,143 @@ def create_db(path: str):
             poster_post_uri TEXT NOT NULL,
             PRIMARY KEY (user_post_uri, user_did, feed_type)
         );
-    """)
+        """
+    ],
+    # 2: PDS of each DID
+    [
+        """
+        CREATE TABLE IF NOT EXISTS did_pds (
+            did TEXT PRIMARY KEY,
+            pds TEXT NOT NULL,
+            resolved_at REAL NOT NULL
+        );
+        """
+    ],
+    # 3: state of interrupted runs
+    [
+        """
+        CREATE TABLE IF NOT EXISTS run_state (
+            user_did TEXT NOT NULL,
+            feed_type TEXT NOT NULL,
+            cursor TEXT,
+            remaining INTEGER NOT NULL,
+            archive INTEGER NOT NULL,
+            update_only INTEGER NOT NULL,
+            listed INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (user_did, feed_type)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pending_posts (
+            user_did TEXT NOT NULL,
+            user_post_uri TEXT NOT NULL,
+            feed_type TEXT NOT NULL,
+            poster_post_uri TEXT NOT NULL,
+            PRIMARY KEY (user_post_uri, user_did, feed_type)
+        );
+        """
+    ],
+    # 4: lookups by account and feed type
+    [
+        "CREATE INDEX IF NOT EXISTS downloaded_posts_user_did_feed_type ON downloaded_posts (user_did, feed_type);",
+        "CREATE INDEX IF NOT EXISTS pending_posts_user_did_feed_type ON pending_posts (user_did, feed_type);"
+    ],
+    # 5: content-addressed blob store
+    [
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            cid TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL
+        );
+        """
+    ],
+    # 6: post details of fetched posts
+    [
+        """
+        CREATE TABLE IF NOT EXISTS post_details (
+            poster_post_uri TEXT PRIMARY KEY,
+            did TEXT NOT NULL,
+            handle TEXT NOT NULL,
+            display_name TEXT,
+            media_type TEXT,
+            images_cid TEXT,
+            video_cid TEXT,
+            mime_type TEXT,
+            response BLOB NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+        """
+    ],
+    # 7: DID of each handle
+    [
+        """
+        CREATE TABLE IF NOT EXISTS handle_did (
+            handle TEXT PRIMARY KEY,
+            did TEXT NOT NULL,
+            resolved_at REAL NOT NULL
+        );
+        """
+    ]
+]
+
+_local = threading.local()
+
+def create_db(path: str):
+    con = _open_db(os.path.join(path, "mdfb.db"))
+    migrate_db(con)
     con.close()
 
+def migrate_db(con: sqlite3.Connection) -> int:
+    """
+    migrate_db: brings the schema of the database up to date, applying each migration that has not been applied yet in its own 
+    transaction. The applied version is kept in the user_version pragma of the database.
+
+    Args:
+        con (sqlite3.Connection): connection to the database
+
+    Returns:
+        int: the schema version of the database
+    """
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        con.execute("BEGIN")
+        try:
+            for statement in statements:
+                con.execute(statement)
+            con.execute(f"PRAGMA user_version = {number}")
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        version = number
+    return version
+
 def connect_db() -> sqlite3.Connection:
-    con = sqlite3.connect(os.path.join(platformdirs.user_data_path("mdfb"), "mdfb.db"))
+    """
+    connect_db: returns the connection of the calling thread to the database, opening it on first use. Connections are reused for 
+    the life of the thread, so they must not be closed by callers.
+
+    Returns:
+        sqlite3.Connection: connection to the database
+    """
+    path = os.path.join(platformdirs.user_data_path("mdfb"), "mdfb.db")
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path not in connections:
+        connections[path] = _open_db(path)
+    return connections[path]
+
+def _open_db(path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT)
+    # WAL lets readers carry on while the writer thread commits, NORMAL only syncs at checkpoints which is safe in WAL mode
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    con.execute("PRAGMA temp_store = MEMORY")
+    con.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE}")
     return con
 
 def insert_post(cur: sqlite3.Cursor, rows: list[tuple]) -> bool:
@@ -25,17 +165,26 @@ def insert_post(cur: sqlite3.Cursor, rows: list[tuple]) -> bool:
         INSERT OR IGNORE INTO downloaded_posts (user_did, user_post_uri, feed_type, poster_post_uri) 
         VALUES (?, ?, ?, ?)
     """, rows)
+    inserted = res.rowcount
+    # a downloaded post is no longer waiting to be resumed
+    cur.executemany("""
+        DELETE FROM pending_posts
+        WHERE user_did = ?
+        AND user_post_uri = ?
+        AND feed_type = ?
+    """, [row[:3] for row in rows])
     
-    if res.rowcount > 0:
+    if inserted > 0:
         return True
     return False
 
 def check_post_exists(cur: sqlite3.Cursor, user_did: str, user_post_uri: str, feed_type: str) -> bool:
     res = cur.execute("""
-        SELECT * FROM downloaded_posts 
+        SELECT 1 FROM downloaded_posts 
         WHERE user_did = ? 
         AND user_post_uri = ?
         AND feed_type = ?
+        LIMIT 1
     """, (user_did, user_post_uri, feed_type))
 
     row = res.fetchone()
@@ -43,11 +192,38 @@ def check_post_exists(cur: sqlite3.Cursor, user_did: str, user_post_uri: str, fe
         return True
     return False
 
+def get_existing_posts(cur: sqlite3.Cursor, user_did: str, user_post_uris: list[str], feed_type: str) -> set[str]:
+    """
+    get_existing_posts: checks which of the given posts are already in the database with a single query per EXISTS_BATCH_SIZE posts, 
+    rather than one query per post
+
+    Args:
+        cur (sqlite3.Cursor): database cursor
+        user_did (str): DID of the account
+        user_post_uris (list[str]): AT-URIs of the records of the account, e.g. a page from listRecords
+        feed_type (str): The type of post: like, repost and post
+
+    Returns:
+        set[str]: the AT-URIs that are already in the database
+    """
+    existing = set()
+    for start in range(0, len(user_post_uris), EXISTS_BATCH_SIZE):
+        batch = user_post_uris[start:start + EXISTS_BATCH_SIZE]
+        res = cur.execute("""
+            SELECT user_post_uri FROM downloaded_posts
+            WHERE user_did = ?
+            AND feed_type = ?
+            AND user_post_uri IN ({})
+        """.format(",".join(["?"] * len(batch))), [user_did, feed_type, *batch])
+        existing.update(row[0] for row in res)
+    return existing
+
 def check_user_has_posts(cur: sqlite3.Cursor, user_did: str, feed_type: str) -> bool:
     res = cur.execute("""
-        SELECT * FROM downloaded_posts
+        SELECT 1 FROM downloaded_posts
         WHERE user_did = ?
         AND feed_type = ?
+        LIMIT 1
     """, [user_did, feed_type])
 
     row = res.fetchone()
@@ -59,8 +235,9 @@ def check_user_exists(did: str) -> bool:
     con = connect_db()
     cur = con.cursor()
     res = cur.execute("""
-        SELECT * FROM downloaded_posts
+        SELECT 1 FROM downloaded_posts
         WHERE user_did = ?
+        LIMIT 1
     """, (did,))
 
     row = res.fetchone()
@@ -84,8 +261,8 @@ def delete_user(did: str):
 
 def restore_posts(did: str, post_types: dict) -> list[dict]:
     con = connect_db()
-    con.row_factory = _dict_factory
     cur = con.cursor()
+    cur.row_factory = _dict_factory
 
     uris = []
     conditions = []
@@ -111,6 +288,294 @@ def restore_posts(did: str, post_types: dict) -> list[dict]:
         uris.append(row)
     return uris
 
+def get_pds(cur: sqlite3.Cursor, did: str) -> tuple[str, float]:
+    res = cur.execute("""
+        SELECT pds, resolved_at FROM did_pds
+        WHERE did = ?
+    """, (did,))
+    return res.fetchone()
+
+def insert_pds(cur: sqlite3.Cursor, did: str, pds: str, resolved_at: float):
+    cur.execute("""
+        INSERT OR REPLACE INTO did_pds (did, pds, resolved_at)
+        VALUES (?, ?, ?)
+    """, (did, pds, resolved_at))
+
+def get_handle_did(cur: sqlite3.Cursor, handle: str) -> tuple[str, float]:
+    res = cur.execute("""
+        SELECT did, resolved_at FROM handle_did
+        WHERE handle = ?
+    """, (handle,))
+    return res.fetchone()
+
+def insert_handle_did(cur: sqlite3.Cursor, handle: str, did: str, resolved_at: float):
+    cur.execute("""
+        INSERT OR REPLACE INTO handle_did (handle, did, resolved_at)
+        VALUES (?, ?, ?)
+    """, (handle, did, resolved_at))
+
+def start_run(cur: sqlite3.Cursor, did: str, feed_type: str, limit: int, archive: bool, update: bool):
+    """
+    start_run: records the start of a listing run for the account and feed type, forgetting any earlier run that was interrupted
+
+    Args:
+        cur (sqlite3.Cursor): database cursor
+        did (str): DID of the target account
+        feed_type (str): The type of post being listed: like, repost and post
+        limit (int): The amount wanted to get
+        archive (bool): Whether all posts of the type are being listed
+        update (bool): Whether only posts that have not been downloaded are being listed
+    """
+    cur.execute("""
+        DELETE FROM pending_posts
+        WHERE user_did = ?
+        AND feed_type = ?
+    """, (did, feed_type))
+    cur.execute("""
+        INSERT OR REPLACE INTO run_state (user_did, feed_type, cursor, remaining, archive, update_only, listed, updated_at)
+        VALUES (?, ?, NULL, ?, ?, ?, 0, ?)
+    """, (did, feed_type, limit, archive, update, time.time()))
+
+def save_page(cur: sqlite3.Cursor, did: str, feed_type: str, post_uris: list[dict], cursor: str, remaining: int):
+    """
+    save_page: stores a page of listed post identifiers as pending, along with the listRecords cursor to continue from
+
+    Args:
+        cur (sqlite3.Cursor): database cursor
+        did (str): DID of the target account
+        feed_type (str): The type of post being listed: like, repost and post
+        post_uris (list[dict]): the page of post identifiers, as returned by get_post_identifiers()
+        cursor (str): the listRecords cursor of the next page
+        remaining (int): the amount still wanted after this page
+    """
+    rows = []
+    for post in post_uris:
+        for user_post_uri, post_feed_type in zip(post["user_post_uri"], post["feed_type"]):
+            rows.append((post["user_did"], user_post_uri, post_feed_type, post["poster_post_uri"]))
+    cur.executemany("""
+        INSERT OR IGNORE INTO pending_posts (user_did, user_post_uri, feed_type, poster_post_uri)
+        VALUES (?, ?, ?, ?)
+    """, rows)
+    cur.execute("""
+        UPDATE run_state SET cursor = ?, remaining = ?, updated_at = ?
+        WHERE user_did = ?
+        AND feed_type = ?
+    """, (cursor, remaining, time.time(), did, feed_type))
+
+def finish_listing(cur: sqlite3.Cursor, did: str, feed_type: str):
+    cur.execute("""
+        UPDATE run_state SET listed = 1, updated_at = ?
+        WHERE user_did = ?
+        AND feed_type = ?
+    """, (time.time(), did, feed_type))
+
+def get_run_state(cur: sqlite3.Cursor, did: str, feed_type: str) -> dict:
+    res = cur.execute("""
+        SELECT cursor, remaining, archive, update_only, listed FROM run_state
+        WHERE user_did = ?
+        AND feed_type = ?
+    """, (did, feed_type))
+    row = res.fetchone()
+    if not row:
+        return None
+    return {
+        "cursor": row[0],
+        "remaining": row[1],
+        "archive": bool(row[2]),
+        "update": bool(row[3]),
+        "listed": bool(row[4])
+    }
+
+def get_pending_posts(did: str, post_types: dict) -> list[dict]:
+    """
+    get_pending_posts: gets the post identifiers that were listed by an earlier run but not downloaded yet, in the order they were listed
+
+    Args:
+        did (str): DID of the target account
+        post_types (dict): the post types and whether they are wanted
+
+    Returns:
+        list[dict]: A list of dictionaries of the AT-URIs from the post and user, user did and feed type
+    """
+    con = connect_db()
+    cur = con.cursor()
+    cur.row_factory = _dict_factory
+    selected_post_types = [post_type for post_type, wanted in post_types.items() if wanted]
+
+    uris = []
+    rows = cur.execute("""
+        SELECT * FROM pending_posts
+        WHERE user_did = ?
+        AND feed_type IN ({})
+        ORDER BY rowid
+    """.format(",".join(["?"] * len(selected_post_types))), [did, *selected_post_types])
+    for row in rows:
+        row["user_post_uri"] = [row["user_post_uri"]]
+        row["feed_type"] = [row["feed_type"]]
+        uris.append(row)
+    return uris
+
+def get_blob_path(cur: sqlite3.Cursor, cid: str) -> str:
+    res = cur.execute("""
+        SELECT path FROM blobs
+        WHERE cid = ?
+    """, (cid,))
+    row = res.fetchone()
+    return row[0] if row else None
+
+def insert_blob(cur: sqlite3.Cursor, cid: str, path: str, size: int):
+    cur.execute("""
+        INSERT OR REPLACE INTO blobs (cid, path, size, stored_at)
+        VALUES (?, ?, ?, ?)
+    """, (cid, path, size, time.time()))
+
+def get_post_details(cur: sqlite3.Cursor, poster_post_uris: list[str], max_age: float = None) -> dict[str, bytes]:
+    """
+    get_post_details: gets the cached post details of the given posts, with a single query per EXISTS_BATCH_SIZE posts
+
+    Args:
+        cur (sqlite3.Cursor): database cursor
+        poster_post_uris (list[str]): AT-URIs of the posts
+        max_age (optional, default=None, float): in seconds, posts fetched longer ago than this are left out, none are when None
+
+    Returns:
+        dict[str, bytes]: the compressed response of each cached post, by its AT-URI
+    """
+    fetched_after = time.time() - max_age if max_age is not None else 0
+    cached = {}
+    for start in range(0, len(poster_post_uris), EXISTS_BATCH_SIZE):
+        batch = poster_post_uris[start:start + EXISTS_BATCH_SIZE]
+        res = cur.execute("""
+            SELECT poster_post_uri, response FROM post_details
+            WHERE fetched_at >= ?
+            AND poster_post_uri IN ({})
+        """.format(",".join(["?"] * len(batch))), [fetched_after, *batch])
+        cached.update(res)
+    return cached
+
+def insert_post_details(cur: sqlite3.Cursor, rows: list[tuple]):
+    cur.executemany("""
+        INSERT OR REPLACE INTO post_details (poster_post_uri, did, handle, display_name, media_type, images_cid, video_cid, mime_type, response, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+class DatabaseWriter:
+    """
+    DatabaseWriter: a single thread that owns every write to the database. Writes from any number of threads are queued, and the 
+    thread applies whatever has queued up since its last commit in one transaction, so workers never wait on the database lock.
+    Writes are applied in the order they were submitted.
+
+    Args:
+        batch_size (optional, default=WRITER_BATCH_SIZE, int): maximum number of writes committed in one transaction
+    """
+    _STOP = object()
+
+    def __init__(self, batch_size: int = WRITER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """
+        submit: queues a write, which is called on the writer thread as func(cursor, *args)
+
+        Args:
+            func (Callable): a function taking a cursor as its first argument, e.g. insert_post()
+            *args: the rest of the arguments of the function
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="mdfb-db-writer", daemon=True)
+                self.thread.start()
+            self.jobs.put((func, args))
+
+    def flush(self):
+        """
+        flush: blocks until every write submitted so far has been committed
+        """
+        self.jobs.join()
+
+    def close(self):
+        """
+        close: commits every write submitted so far and stops the writer thread, it is restarted by the next submit()
+        """
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return
+            self.jobs.put(self._STOP)
+        thread.join()
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while True:
+            batch = [self.jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(job is self._STOP for job in batch)
+            try:
+                self._write([job for job in batch if job is not self._STOP], logger)
+            finally:
+                for _ in batch:
+                    self.jobs.task_done()
+            if stop:
+                with self.lock:
+                    if self.jobs.empty():
+                        self.thread = None
+                        return
+                    # writes were submitted after close(), stop once they are written
+                    self.jobs.put(self._STOP)
+
+    def _write(self, batch: list[tuple], logger: logging.Logger):
+        if not batch:
+            return
+        start = time.perf_counter()
+        con = connect_db()
+        cur = con.cursor()
+        for func, args in batch:
+            try:
+                func(cur, *args)
+            except Exception:
+                logger.error("Error writing to the database with: %s", func.__name__, exc_info=True)
+        try:
+            con.commit()
+        except sqlite3.Error:
+            logger.error("Error committing %d writes to the database", len(batch), exc_info=True)
+            con.rollback()
+            return
+        DB_WRITES.inc(len(batch))
+        DB_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+_writer = DatabaseWriter()
+atexit.register(_writer.close)
+QUEUE_DEPTH.track(_writer.jobs.qsize, queue="db_writer")
+
+def get_writer() -> DatabaseWriter:
+    return _writer
+
+def write_posts(rows: list[tuple]):
+    """
+    write_posts: queues downloaded posts to be inserted into the database by the writer thread, see insert_post()
+
+    Args:
+        rows (list[tuple]): rows of (user_did, user_post_uri, feed_type, poster_post_uri)
+    """
+    if rows:
+        _writer.submit(insert_post, rows)
+
+def flush_writes():
+    _writer.flush()
+
+def close_db():
+    """
+    close_db: commits every queued write and stops the writer thread, called before the program exits
+    """
+    _writer.close()
+
 def _dict_factory(cursor: sqlite3.Cursor, row: sqlite3.Row):
     fields = [column[0] for column in cursor.description]
     return {key: value for key, value in zip(fields, row)}
@@ -1,3 +1,7 @@
+import queue
+from collections import deque
+from typing import Iterable, Iterator
+
 def split_list(input_list: list, split_by: int) -> list[list]:
     """
     split_list: splits the list into the given number of equal sized chunks, used for distributing data so that it can be used for threads
@@ -44,13 +48,81 @@ def get_chunk(posts: list, chunk_size: int) -> list:
         chunk = posts[i:i+chunk_size]
         yield chunk
 
+def work_queue(items: Iterable) -> queue.SimpleQueue:
+    """
+    work_queue: puts every item onto a shared queue that worker threads pull from one item at a time, so a thread that 
+    finishes early keeps taking work rather than sitting idle like it would with a static split_list() partition.
+
+    Args:
+        items (Iterable): the work items
+
+    Returns:
+        queue.SimpleQueue: a thread-safe queue containing every item, to be consumed with drain_queue()
+    """
+    shared_queue = queue.SimpleQueue()
+    for item in items:
+        shared_queue.put(item)
+    return shared_queue
+
+def drain_queue(shared_queue: queue.SimpleQueue) -> Iterator:
+    """
+    drain_queue: yields items from the shared queue until it is empty, safe to be consumed by many threads at once.
+
+    Args:
+        shared_queue (queue.SimpleQueue): queue returned from work_queue()
+
+    Yields:
+        the next item on the queue
+    """
+    while True:
+        try:
+            yield shared_queue.get_nowait()
+        except queue.Empty:
+            return
+
+def interleave(iterables: list[Iterable]) -> Iterator:
+    """
+    interleave: yields one item from each iterable in turn, dropping those that are exhausted, so a long iterable cannot starve
+    the others. Items are only taken from an iterable when they are needed.
+
+    Args:
+        iterables (list[Iterable]): the iterables to take items from
+
+    Yields:
+        the next item, from the next iterable in turn
+    """
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            continue
+        yield item
+        iterators.append(iterator)
+
+def merge_identifiers(post: dict, duplicate: dict):
+    """
+    merge_identifiers: adds the identifiers of a duplicate of the post, the same post from another feed type or account, to the post
+
+    Args:
+        post (dict): post identifiers or post details, a PostRecord included
+        duplicate (dict): post identifiers or post details of the same post
+    """
+    # new lists, as the identifiers of a PostRecord are tuples
+    for key in ("feed_type", "user_post_uri"):
+        merged = [*post[key], *duplicate[key]]
+        post[key] = merged
+        if isinstance(post, dict) and "response" in post:
+            # the response holds the identifiers too, and is what is written as the post's JSON
+            post["response"][key] = merged
+
 def dedupe_posts(posts: list[dict]) -> list[dict]:
     res = {} # poster_post_uri : post
     for post in posts:
         poster_post_uri = post["poster_post_uri"]
         if poster_post_uri in res:
-            res[poster_post_uri]["feed_type"].extend(post["feed_type"])
-            res[poster_post_uri]["user_post_uri"].extend(post["user_post_uri"])
+            merge_identifiers(res[poster_post_uri], post)
         else:
             res[poster_post_uri] = post
     return [v for k, v in res.items()]
\ No newline at end of file
@@ -1,19 +1,61 @@
+import atexit
 import datetime
 import logging
 import os
 import psutil
+import queue
 import time
 import threading
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logging(directory: str):
+from mdfb.utils.metrics import DOWNLOADED_BYTES, POSTS
+
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+_queue_handler = None
+_listener = None
+
+def setup_logging(directory: str, level: int = logging.INFO):
+    """
+    setup_logging: logs to a file in the directory named after the current time. Records are put on a queue by the calling thread, 
+    and formatted and written by a background thread, so the worker threads never wait on the file. Lines about every post are 
+    logged at DEBUG, so they are only written when the level is DEBUG.
+
+    Args:
+        directory (str): the download directory
+        level (optional, default=logging.INFO, int): the lowest level written to the log
+    """
+    global _queue_handler, _listener
+    stop_logging()
     log_name = datetime.datetime.now().strftime("mdfb_%d%m%Y_%H%M%S.log")
-    logging.basicConfig(
-        filename=os.path.join(directory, log_name), 
-        encoding='utf-8', 
-        level=logging.INFO,
-        format='[%(asctime)s] %(message)s', 
-        datefmt='%m/%d/%Y %I:%M:%S %p',
-    )
+    file_handler = logging.FileHandler(os.path.join(directory, log_name), encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%m/%d/%Y %I:%M:%S %p"))
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    # httpx logs every request at INFO, so they are kept with the lines about every post, and httpcore traces are never logged
+    logging.getLogger("httpx").setLevel(logging.INFO if level <= logging.DEBUG else logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.INFO)
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """
+    stop_logging: writes any records left on the queue, and closes the log file
+    """
+    global _queue_handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _queue_handler = None
+    _listener = None
 
 def _monitor_resources(directory: str, interval: int = 5):
     resource_logger = logging.getLogger("resource")
@@ -24,12 +66,14 @@ def _monitor_resources(directory: str, interval: int = 5):
     resource_logger.addHandler(resource_handler)
     resource_logger.propagate = False  
     process = psutil.Process()
+    # without an interval the CPU usage is measured since the previous call, so the monitor never blocks
+    process.cpu_percent()
 
     while True:
-        mem = process.memory_info().rss / (1024 * 1024)  
-        cpu = process.cpu_percent(interval=1)  
-        resource_logger.info(f"Memory Usage: {mem:.2f} MB, CPU Usage: {cpu:.2f}%")
         time.sleep(interval)
+        mem = process.memory_info().rss / (1024 * 1024)  
+        cpu = process.cpu_percent()  
+        resource_logger.info("Memory Usage: %.2f MB, CPU Usage: %.2f%%, Posts downloaded: %.0f, Bytes downloaded: %.0f", mem, cpu, POSTS.value(stage="downloaded"), DOWNLOADED_BYTES.value())
 
 def setup_resource_monitoring(directory: str):
     monitor_thread = threading.Thread(target=_monitor_resources, args=(directory, ), daemon=True)
@@ -0,0 +1,280 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+from mdfb.utils.constants import METRICS_BUCKETS, METRICS_INTERVAL
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metric:
+    """
+    Metric: a named value kept for each combination of labels, safe to update from any thread. Updates take a lock and change a
+    number, so metrics are cheap enough to leave on for every run.
+
+    Args:
+        name (str): name of the metric, e.g. mdfb_requests_total
+        help (str): description of the metric
+    """
+    type = None
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.functions = {}
+        self.lock = threading.Lock()
+
+    def track(self, function, **labels):
+        """
+        track: reads the value from a function, only called when the metrics are read, e.g. the size of a queue
+        """
+        with self.lock:
+            self.functions[_key(labels)] = function
+
+    def untrack(self, **labels):
+        with self.lock:
+            self.functions.pop(_key(labels), None)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return [(self.name, dict(labels), value) for labels, value in values.items()]
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(_key(labels), 0)
+
+class Counter(Metric):
+    """
+    Counter: a total that only goes up. Either increased directly, or tracked with a function reading a total kept elsewhere, e.g.
+    the CPU time of the process.
+    """
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    Gauge: a value that goes up and down. Either set directly, or tracked with a function.
+    """
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_key(labels)] = value
+
+class Histogram(Metric):
+    """
+    Histogram: counts observations, e.g. latencies in seconds, into cumulative buckets along with their sum and count
+
+    Args:
+        name (str): name of the metric, e.g. mdfb_request_seconds
+        help (str): description of the metric
+        buckets (optional, default=METRICS_BUCKETS, tuple[float]): upper bounds of the buckets, in increasing order
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float] = METRICS_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # a count per bucket, then the sum and the count of every observation
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        samples = []
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in values.items():
+            labels = dict(key)
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", {**labels, "le": str(bound)}, count))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-1]))
+            samples.append((f"{self.name}_sum", labels, counts[-2]))
+            samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+class MetricsRegistry:
+    """
+    MetricsRegistry: holds every metric of the process, and renders them in the Prometheus text format or as a JSON snapshot
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: tuple[float] = METRICS_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, buckets)
+
+    def render(self) -> str:
+        """
+        render: the current value of every metric in the Prometheus text exposition format
+
+        Returns:
+            str: the metrics, as served at /metrics
+        """
+        lines = []
+        for metric in self._metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                label_string = ",".join(f'{label}="{_escape(str(label_value))}"' for label, label_value in labels.items())
+                lines.append(f"{name}{{{label_string}}} {value}" if label_string else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        snapshot: the current value of every metric, for writing as JSON
+
+        Returns:
+            dict: the time of the snapshot, and the samples of each metric as a list of labels and value
+        """
+        return {
+            "timestamp": time.time(),
+            "metrics": {metric.name: [{"name": name, "labels": labels, "value": value} for name, labels, value in metric.samples()] for metric in self._metrics()}
+        }
+
+    def _metrics(self) -> list[Metric]:
+        with self.lock:
+            return list(self.metrics.values())
+
+    def _register(self, metric_type: type, name: str, help: str, *args) -> Metric:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_type(name, help, *args)
+            return self.metrics[name]
+
+_registry = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+REQUESTS = _registry.counter("mdfb_requests_total", "HTTP requests sent, by XRPC endpoint and status code")
+REQUEST_SECONDS = _registry.histogram("mdfb_request_seconds", "Seconds from sending a request to receiving its response headers, by XRPC endpoint")
+RATE_LIMITED = _registry.counter("mdfb_rate_limited_total", "Responses with a 429 status code, by host")
+RETRIES = _registry.counter("mdfb_retries_total", "Calls retried after an error, by function")
+DOWNLOADED_BYTES = _registry.counter("mdfb_downloaded_bytes_total", "Bytes of images and videos downloaded")
+POSTS = _registry.counter("mdfb_posts_total", "Posts that have passed through each stage: listed, hydrated and downloaded")
+QUEUE_DEPTH = _registry.gauge("mdfb_queue_depth", "Entries waiting in each queue: post identifiers and batches of post details between pipeline stages, and writes for the database writer")
+DB_WRITES = _registry.counter("mdfb_db_writes_total", "Writes committed by the database writer")
+DB_WRITE_SECONDS = _registry.histogram("mdfb_db_write_seconds", "Seconds taken by the database writer to apply and commit each batch of writes")
+_process = psutil.Process()
+_registry.gauge("mdfb_process_resident_memory_bytes", "Resident memory of the process").track(lambda: _process.memory_info().rss)
+_registry.counter("mdfb_process_cpu_seconds_total", "User and system CPU time of the process").track(lambda: sum(_process.cpu_times()[:2]))
+
+def record_retry(retry_state):
+    """
+    record_retry: tenacity before_sleep callback counting each retry of the decorated function in mdfb_retries_total
+    """
+    RETRIES.inc(call=retry_state.fn.__name__ if retry_state.fn else "unknown")
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    start_metrics_server: serves the metrics in the Prometheus text format at http://host:port/metrics, on a background thread for
+    the life of the process
+
+    Args:
+        port (int): port to listen on
+        host (optional, default="127.0.0.1", str): address to listen on
+
+    Returns:
+        ThreadingHTTPServer: the server, stopped with shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mdfb-metrics", daemon=True).start()
+    logging.getLogger(__name__).info("Serving metrics at: http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+class MetricsSnapshots:
+    """
+    MetricsSnapshots: appends a JSON snapshot of the metrics to a file every `interval` seconds, one per line, on a background
+    thread. A last snapshot is written when closed.
+
+    Args:
+        path (str): the file to append to
+        interval (optional, default=METRICS_INTERVAL, float): in seconds, time between snapshots
+    """
+    def __init__(self, path: str, interval: float = METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="mdfb-metrics-snapshots", daemon=True)
+
+    def start(self) -> "MetricsSnapshots":
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread.is_alive():
+            self.stopped.set()
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            stop = self.stopped.wait(self.interval)
+            with open(self.path, "at", encoding="utf-8") as file:
+                file.write(json.dumps(_registry.snapshot()) + "\n")
+            if stop:
+                return
+
+def start_metrics_snapshots(path: str, interval: float = METRICS_INTERVAL) -> MetricsSnapshots:
+    """
+    start_metrics_snapshots: starts writing snapshots of the metrics to the file, see MetricsSnapshots. The last snapshot is written 
+    when the program exits.
+
+    Args:
+        path (str): the file to append to
+        interval (optional, default=METRICS_INTERVAL, float): in seconds, time between snapshots
+
+    Returns:
+        MetricsSnapshots: the running writer
+    """
+    snapshots = MetricsSnapshots(path, interval).start()
+    atexit.register(snapshots.close)
+    return snapshots
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = _registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
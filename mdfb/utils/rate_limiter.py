@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+
+from mdfb.utils.constants import RATE_LIMIT_BACKOFF, RATE_LIMIT_BURST, RATE_LIMIT_DEFAULT, RATE_LIMIT_MAX, RATE_LIMIT_MIN
+
+class TokenBucket:
+    """
+    TokenBucket: thread-safe token bucket for a single host. Callers reserve a token and wait for the returned time, so requests
+    are spread out at `rate` per second with bursts of up to `burst`. The rate adapts to the RateLimit headers the host sends back.
+
+    Args:
+        rate (optional, default=RATE_LIMIT_DEFAULT, float): requests per second allowed until the host reports its own limit
+        burst (optional, default=RATE_LIMIT_BURST, int): the number of requests that can be sent at once
+    """
+    def __init__(self, rate: float = RATE_LIMIT_DEFAULT, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        reserve: takes a token from the bucket, the balance can go negative which queues the caller behind earlier reservations
+
+        Returns:
+            float: seconds the caller must wait before sending its request
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def observe(self, status_code: int, headers: dict):
+        """
+        observe: adapts the bucket to a response from the host. A 429 pauses the bucket until the host allows requests again and halves
+        the rate, otherwise the rate is set so the remaining quota lasts until the quota resets.
+
+        Args:
+            status_code (int): HTTP status code of the response
+            headers (dict): headers of the response, looked up in lower case
+        """
+        remaining = _to_float(headers.get("ratelimit-remaining"))
+        reset = _to_float(headers.get("ratelimit-reset"))
+        retry_after = _to_float(headers.get("retry-after"))
+        seconds_to_reset = reset - time.time() if reset is not None else None
+
+        with self.lock:
+            now = time.monotonic()
+            if status_code == 429:
+                if retry_after is not None:
+                    wait = retry_after
+                elif seconds_to_reset is not None:
+                    wait = seconds_to_reset
+                else:
+                    wait = RATE_LIMIT_BACKOFF
+                self.paused_until = max(self.paused_until, now + max(wait, 0))
+                self.rate = max(RATE_LIMIT_MIN, self.rate / 2)
+                return
+            if remaining is None or seconds_to_reset is None:
+                return
+            seconds_to_reset = max(seconds_to_reset, 1)
+            if remaining <= 0:
+                self.paused_until = max(self.paused_until, now + seconds_to_reset)
+            else:
+                self.rate = min(RATE_LIMIT_MAX, max(RATE_LIMIT_MIN, remaining / seconds_to_reset))
+
+class RateLimiter:
+    """
+    RateLimiter: a TokenBucket per host, shared by every thread and module so the total request rate to a host stays under its
+    limits however many workers are running.
+    """
+    def __init__(self, rate: float = RATE_LIMIT_DEFAULT, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, host: str) -> float:
+        """
+        acquire: blocks the calling thread until a request to the host is allowed
+
+        Args:
+            host (str): host the request is sent to
+
+        Returns:
+            float: seconds spent waiting
+        """
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, host: str) -> float:
+        """
+        acquire_async: asyncio counterpart of acquire(), waits without blocking the event loop
+
+        Args:
+            host (str): host the request is sent to
+
+        Returns:
+            float: seconds spent waiting
+        """
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, host: str, status_code: int, headers: dict):
+        self.bucket(host).observe(status_code, headers)
+
+_rate_limiter = RateLimiter()
+
+def get_rate_limiter() -> RateLimiter:
+    return _rate_limiter
+
+def _to_float(value: str) -> float:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,179 @@
+import datetime
+import functools
+import heapq
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from mdfb.utils.constants import REPORT_SLOWEST
+
+REPORT_PREFIX = "mdfb_report_"
+
+class RunReport:
+    """
+    RunReport: collects the timings of a download run, the wall time of each phase and the latency of every attempt at an API call,
+    and summarises them once the run is over. Safe to update from any thread.
+
+    Args:
+        slowest (optional, default=REPORT_SLOWEST, int): number of the slowest items kept for each call
+    """
+    def __init__(self, slowest: int = REPORT_SLOWEST):
+        self.slowest = slowest
+        self.started = time.time()
+        self.phases = {}
+        self.latencies = {}
+        self.errors = {}
+        self.failures = {}
+        self.slowest_items = {}
+        self.bytes_by_media_type = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def record_call(self, call: str, seconds: float, ok: bool, item: str = None):
+        """
+        record_call: records a single attempt at an API call
+
+        Args:
+            call (str): the XRPC method called, e.g. app.bsky.feed.getPosts
+            seconds (float): how long the attempt took
+            ok (bool): whether the attempt succeeded
+            item (optional, default=None, str): what was requested, e.g. the CID of a blob, kept if it is one of the slowest
+        """
+        with self.lock:
+            self.latencies.setdefault(call, []).append(seconds)
+            if not ok:
+                self.errors[call] = self.errors.get(call, 0) + 1
+            if item is not None:
+                slowest = self.slowest_items.setdefault(call, [])
+                if len(slowest) < self.slowest:
+                    heapq.heappush(slowest, (seconds, item))
+                elif seconds > slowest[0][0]:
+                    heapq.heapreplace(slowest, (seconds, item))
+
+    def record_failure(self, call: str):
+        """
+        record_failure: records a call that was given up on after running out of retries
+        """
+        with self.lock:
+            self.failures[call] = self.failures.get(call, 0) + 1
+
+    def add_bytes(self, media_type: str, num_bytes: int):
+        with self.lock:
+            self.bytes_by_media_type[media_type] = self.bytes_by_media_type.get(media_type, 0) + num_bytes
+
+    def summary(self) -> dict:
+        """
+        summary: the report of the run so far
+
+        Returns:
+            dict: wall time of each phase, and for each call the latency percentiles, retries, failures and slowest items, along with
+            the bytes saved of each media type
+        """
+        with self.lock:
+            calls = {}
+            for call, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                errors = self.errors.get(call, 0)
+                failures = self.failures.get(call, 0)
+                calls[call] = {
+                    "attempts": len(latencies),
+                    # every failed attempt was either retried or given up on
+                    "retries": max(errors - failures, 0),
+                    "failures": failures,
+                    "p50": _percentile(latencies, 50),
+                    "p95": _percentile(latencies, 95),
+                    "p99": _percentile(latencies, 99),
+                    "max": round(latencies[-1], 4),
+                    "slowest": [{"item": item, "seconds": round(seconds, 4)} for seconds, item in sorted(self.slowest_items.get(call, []), reverse=True)]
+                }
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+                "wall_time": round(time.time() - self.started, 4),
+                "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+                "calls": calls,
+                "bytes_by_media_type": dict(self.bytes_by_media_type)
+            }
+
+    def write(self, directory: str) -> str:
+        """
+        write: writes the report of the run to a JSON file in the directory, named after the time it is written like the log file
+
+        Args:
+            directory (str): the download directory
+
+        Returns:
+            str: path of the report
+        """
+        path = os.path.join(directory, REPORT_PREFIX + datetime.datetime.now().strftime("%d%m%Y_%H%M%S.json"))
+        with open(path, "wt", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=4)
+        return path
+
+_report = RunReport()
+
+def get_report() -> RunReport:
+    return _report
+
+def start_report() -> RunReport:
+    """
+    start_report: starts a new report, replacing the one of any earlier run in the process
+
+    Returns:
+        RunReport: the new report
+    """
+    global _report
+    _report = RunReport()
+    return _report
+
+def timed(call: str, describe=None):
+    """
+    timed: decorator recording every call of the function in the current report, as an attempt at the given API call. Placed below
+    @retry, so each retry is timed on its own.
+
+    Args:
+        call (str): the XRPC method called by the function, e.g. com.atproto.sync.getBlob
+        describe (optional, default=None, Callable): given the arguments of the function, returns what was requested
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                ok = False
+                try:
+                    res = await func(*args, **kwargs)
+                    ok = True
+                    return res
+                finally:
+                    _report.record_call(call, time.perf_counter() - start, ok, describe(*args, **kwargs) if describe else None)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                res = func(*args, **kwargs)
+                ok = True
+                return res
+            finally:
+                _report.record_call(call, time.perf_counter() - start, ok, describe(*args, **kwargs) if describe else None)
+        return wrapper
+    return decorator
+
+def _percentile(values: list[float], percent: float) -> float:
+    # nearest rank of already sorted values
+    index = max(0, min(len(values) - 1, -(-len(values) * percent // 100) - 1))
+    return round(values[int(index)], 4)
@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+
+import httpx
+
+from mdfb.utils.constants import HOST_CONCURRENCY, HOST_CONCURRENCY_DEFAULT
+
+class HostScheduler:
+    """
+    HostScheduler: bounds the number of requests in flight to each host, independently of one another, so that raising the 
+    number of download threads for the blob hosts cannot crowd out hydration requests to the AppView.
+
+    Args:
+        default_limit (optional, default=HOST_CONCURRENCY_DEFAULT, int): the limit for hosts without their own limit
+        limits (optional, default=HOST_CONCURRENCY, dict[str, int]): host to its limit
+    """
+    def __init__(self, default_limit: int = HOST_CONCURRENCY_DEFAULT, limits: dict[str, int] = None):
+        self.default_limit = default_limit
+        self.limits = dict(HOST_CONCURRENCY if limits is None else limits)
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def set_limit(self, host: str, limit: int):
+        with self.lock:
+            self.limits[host] = limit
+            self.semaphores.pop(host, None)
+
+    def semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limits.get(host, self.default_limit))
+            return self.semaphores[host]
+
+    @contextmanager
+    def slot(self, host: str):
+        """
+        slot: holds one of the host's slots for the duration of the block, waiting for one to free up if they are all in use
+
+        Args:
+            host (str): the host the request is sent to
+        """
+        semaphore = self.semaphore(host)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+_scheduler = HostScheduler()
+
+def get_scheduler() -> HostScheduler:
+    return _scheduler
+
+def host_of(url: str) -> str:
+    return httpx.URL(url).host
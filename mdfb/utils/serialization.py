@@ -0,0 +1,48 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj) -> bytes:
+    """
+    dumps: serializes to compact JSON, with orjson when it is installed. Only used for JSON read back by mdfb itself, as the output
+    of the two backends is equivalent but not byte for byte the same.
+
+    Args:
+        obj: a JSON serializable object
+
+    Returns:
+        bytes: UTF-8 encoded JSON
+    """
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+def loads(data: bytes):
+    """
+    loads: parses JSON, with orjson when it is installed
+
+    Args:
+        data (bytes): UTF-8 encoded JSON
+
+    Returns:
+        the parsed object
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_post(post: dict) -> str:
+    """
+    dumps_post: serializes the JSON file of a post in a single pass. This always uses the json module, as orjson cannot produce the
+    4 space indentation and escaped non-ASCII characters of the files written so far.
+
+    Args:
+        post (dict): the response of the post, from fetch_post_details()
+
+    Returns:
+        str: the contents of the JSON file
+    """
+    return json.dumps(post, indent=4)
@@ -4,7 +4,7 @@ import re
 import string
 import argparse
 import platformdirs
-from mdfb.utils.constants import MAX_THREADS, VALID_FILENAME_OPTIONS
+from mdfb.utils.constants import DEFAULT_DOWNLOAD_THREADS, DEFAULT_HYDRATE_THREADS, DEFAULT_LIST_THREADS, MAX_CONCURRENCY, MAX_THREADS, VALID_FILENAME_OPTIONS
 from mdfb.utils.database import create_db, check_user_exists
 
 def validate_directory(directory: str, parser: argparse.ArgumentParser) -> str:
@@ -14,6 +14,15 @@ def validate_directory(directory: str, parser: argparse.ArgumentParser) -> str:
         raise ValueError("The given filepath is either not valid or does not exist")
     return directory.rstrip("/")
 
+def validate_blob_store(blob_store, directory: str) -> str:
+    if not blob_store:
+        return None
+    if blob_store is True:
+        return directory
+    if not os.path.isdir(blob_store):
+        raise ValueError("The given blob store is either not valid or does not exist")
+    return blob_store.rstrip("/")
+
 def validate_limit(limit: str) -> int:
     if not limit.isdigit():
         raise ValueError("The given limit is not a integer")
@@ -31,13 +40,71 @@ def validate_threads(threads: str) -> int:
         raise ValueError("Please enter an integer")
     threads = int(threads)
     if threads > MAX_THREADS:
-        logging.info(f"Entered {threads} threads, but the maximum is {MAX_THREADS}. Setting to {MAX_THREADS} threads")
+        logging.info("Entered %d threads, but the maximum is %d. Setting to %d threads", threads, MAX_THREADS, MAX_THREADS)
         print(f"Entered {threads} threads, but the maximum is {MAX_THREADS}. Setting to {MAX_THREADS} threads.")
         threads = MAX_THREADS
     if threads < 1:
         raise ValueError("Please set threads to 1 or more")
     return threads
 
+def validate_stage_threads(args: argparse.Namespace) -> dict[str, int]:
+    """
+    validate_stage_threads: works out the number of threads for each stage, a stage specific flag takes precedence over --threads,
+    which in turn takes precedence over the stage's default
+
+    Args:
+        args (argparse.Namespace): the parsed arguments
+
+    Returns:
+        dict[str, int]: the number of threads for the "list", "hydrate" and "download" stages
+    """
+    threads = validate_threads(args.threads) if getattr(args, "threads", None) else None
+    stage_threads = {}
+    for stage, default in (("list", DEFAULT_LIST_THREADS), ("hydrate", DEFAULT_HYDRATE_THREADS), ("download", DEFAULT_DOWNLOAD_THREADS)):
+        stage_flag = getattr(args, f"{stage}_threads", None)
+        if stage_flag:
+            stage_threads[stage] = validate_threads(stage_flag)
+        else:
+            stage_threads[stage] = threads if threads else default
+    return stage_threads
+
+def validate_concurrency(concurrency: str) -> int:
+    if not concurrency.isdigit():
+        raise ValueError("Please enter an integer")
+    concurrency = int(concurrency)
+    if concurrency > MAX_CONCURRENCY:
+        logging.info("Entered a concurrency of %d, but the maximum is %d. Setting to %d", concurrency, MAX_CONCURRENCY, MAX_CONCURRENCY)
+        print(f"Entered a concurrency of {concurrency}, but the maximum is {MAX_CONCURRENCY}. Setting to {MAX_CONCURRENCY}.")
+        concurrency = MAX_CONCURRENCY
+    if concurrency < 1:
+        raise ValueError("Please set concurrency to 1 or more")
+    return concurrency
+
+def validate_queue_size(queue_size: str) -> int:
+    if not queue_size.isdigit():
+        raise ValueError("Please enter an integer")
+    queue_size = int(queue_size)
+    if queue_size < 1:
+        raise ValueError("Please set the queue size to 1 or more")
+    return queue_size
+
+def validate_metrics_port(port: str) -> int:
+    if not port.isdigit():
+        raise ValueError("Please enter an integer")
+    port = int(port)
+    if not 0 < port < 65536:
+        raise ValueError("Please set the metrics port between 1 and 65535")
+    return port
+
+def validate_refresh_stale(days: str) -> float:
+    try:
+        days = float(days)
+    except ValueError:
+        raise ValueError("Please enter a number of days")
+    if days < 0:
+        raise ValueError("Please set the number of days to 0 or more")
+    return days * 24 * 60 * 60
+    
 def validate_format(filename_format_string: str) -> str:
     formatter = string.Formatter()
     for _, field_name, _, _ in formatter.parse(filename_format_string):
@@ -45,13 +112,15 @@ def validate_format(filename_format_string: str) -> str:
             raise ValueError(f"The format string provided has invalid keyword: {field_name}") 
     return filename_format_string
 
-def validate_no_posts(posts: list, account: str, post_types: list, update: bool, did: str, restore: str):
+def validate_no_posts(posts: list, account: str, post_types: list, update: bool, did: str, restore: str, resume: bool = False):
     if restore:
         if did:
             if not check_user_exists(did):
                 raise ValueError(f"The account: {account} does not exist in the database.")
         elif not posts:
             raise ValueError(f"There are no posts associated with account: {account}, for post_type(s): {post_types}, in the database.")
+    if not posts and resume:
+        raise ValueError(f"The interrupted run has no posts left to download: {account}, for post_type(s): {post_types}")
     if not posts and update:
         raise ValueError(f"Already downloaded the latest post: {account}, for post_type(s): {post_types}")
     elif not posts:    
@@ -66,16 +135,33 @@ def validate_database():
     elif os.path.isdir(path) and not os.path.isfile(os.path.join(platformdirs.user_data_path(appname="mdfb"), "mdfb.db")): 
         logging.info("Creating database as the mdfb directory does exist, but there is no database...")
         create_db(path)
+    else:
+        # databases created by older versions are missing the newer tables
+        create_db(path)
 
 def validate_download(args: argparse.Namespace, parser: argparse.ArgumentParser):
+    accounts_file = getattr(args, "accounts_file", None)
     if args.restore:
         if args.did or args.handle:
             parser.error("If using --restore, then cannot use --did, -d or --handle, should pass the handle/did as a value to --restore")
+        if accounts_file:
+            parser.error("--accounts-file cannot be used with --restore")
+    elif accounts_file:
+        if args.did or args.handle:
+            parser.error("--accounts-file cannot be used with --did, -d or --handle")
+        if getattr(args, "engine", "thread") == "async":
+            parser.error("--accounts-file downloads through the pipeline and cannot be used with --engine async")
     else:
         if not args.did and not args.handle:
             parser.error("--did, -d or --handle is required")
         if args.did and args.handle:
             parser.error("--did, -d and --handle are mutually exclusive")
+    if getattr(args, "pipeline", False) and getattr(args, "engine", "thread") == "async":
+        parser.error("--pipeline downloads on threads and cannot be used with --engine async")
+    if getattr(args, "car", False) and not args.archive:
+        parser.error("--car can only be used with --archive")
+    if getattr(args, "compression", None) and getattr(args, "output_format", "files") != "jsonl":
+        parser.error("--compression can only be used with --output-format jsonl")
     _validate_post_types(args, parser)
 
 def _validate_post_types(args: argparse.Namespace, parser: argparse.ArgumentParser):
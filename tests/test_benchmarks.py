@@ -0,0 +1,103 @@
+import os
+import tempfile
+import httpx
+import pytest
+from benchmarks.existing_posts import measure_existing_posts
+from benchmarks.export import measure_export_query
+from benchmarks.memory import measure_post_details
+from benchmarks.merge import measure_merge
+from benchmarks.mock_server import MockServer
+from benchmarks.run import compare, run_benchmark
+
+class TestMockServer:
+    @pytest.fixture
+    def server(self):
+        server = MockServer(posts=150, images=2, blob_size=1000).start()
+        yield server
+        server.stop()
+
+    def test_list_records_pages(self, server):
+        params = {"repo": "did:plc:benchmark", "collection": "app.bsky.feed.like", "limit": 100}
+        first = httpx.get(f"{server.url}/xrpc/com.atproto.repo.listRecords", params=params).json()
+        second = httpx.get(f"{server.url}/xrpc/com.atproto.repo.listRecords", params={**params, "cursor": first["cursor"]}).json()
+
+        assert len(first["records"]) == 100
+        assert len(second["records"]) == 50
+        assert "cursor" not in second
+        assert first["records"][0]["value"]["subject"]["uri"].startswith("at://did:plc:author0/app.bsky.feed.post/")
+
+    def test_get_posts_and_blob(self, server):
+        uri = "at://did:plc:author1/app.bsky.feed.post/0000000000001"
+        posts = httpx.get(f"{server.url}/xrpc/app.bsky.feed.getPosts", params={"uris": [uri]}).json()["posts"]
+        blob = httpx.get(f"{server.url}/xrpc/com.atproto.sync.getBlob", params={"did": "did:plc:author1", "cid": "bafkrei"})
+
+        assert posts[0]["uri"] == uri
+        assert len(posts[0]["record"]["embed"]["images"]) == 2
+        assert len(blob.content) == 1000
+        assert server.stats()["requests"] == {"app.bsky.feed.getPosts": 1, "com.atproto.sync.getBlob": 1}
+        assert server.stats()["statuses"] == {200: 2}
+
+    def test_errors(self):
+        server = MockServer(error_rate=0.5, rate_limit_rate=0.5).start()
+        try:
+            statuses = {httpx.get(f"{server.url}/xrpc/com.atproto.sync.getBlob").status_code for _ in range(20)}
+        finally:
+            server.stop()
+        assert statuses == {429, 500}
+
+class TestRunBenchmark:
+    def test_run_benchmark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmark(directory, posts=30, blob_size=1000, threads=2)
+            downloaded = os.listdir(directory)
+
+        stages = results["stages"]
+        assert list(stages) == ["get_post_identifiers", "fetch_post_details", "download_blobs", "total"]
+        assert all(stage["posts"] == 30 for stage in stages.values())
+        assert stages["get_post_identifiers"]["requests"] == {"com.atproto.repo.listRecords": 2}
+        assert stages["fetch_post_details"]["requests"] == {"app.bsky.feed.getPosts": 2}
+        assert stages["download_blobs"]["requests"] == {"com.atproto.sync.getBlob": 30}
+        assert stages["download_blobs"]["bytes"] == 30 * 1000
+        assert stages["total"]["peak_rss_mb"] > 0
+        assert len([name for name in downloaded if name.endswith(".json") and not name.startswith("mdfb_report_")]) == 30
+        assert compare(results, results)[0] == f"get_post_identifiers: {stages['get_post_identifiers']['posts_per_second']:.1f} -> {stages['get_post_identifiers']['posts_per_second']:.1f} posts/s (+0.0%)"
+
+    def test_run_benchmark_low_memory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmark(directory, posts=30, blob_size=1000, threads=2, low_memory=True)
+            downloaded = os.listdir(directory)
+
+        assert results["stages"]["total"]["posts"] == 30
+        assert len([name for name in downloaded if name.endswith(".jpeg")]) == 30
+        assert not [name for name in downloaded if name.startswith("mdfb_spill_")]
+
+class TestMemoryBenchmark:
+    def test_measure_post_details(self):
+        default = measure_post_details(posts=50)
+        low_memory = measure_post_details(posts=50, low_memory=True)
+
+        assert default["posts"] == low_memory["posts"] == 50
+        assert not default["low_memory"] and low_memory["low_memory"]
+        assert default["held_bytes_per_post"] > 0 and low_memory["held_bytes_per_post"] > 0
+
+class TestExistingPostsBenchmark:
+    def test_measure_existing_posts(self):
+        result = measure_existing_posts(num_rows=1000, page_size=100)
+
+        assert result["existing"] == 50
+        assert result["per_record_queries"] == 100
+        assert result["per_page_queries"] == 1
+
+class TestMergeBenchmark:
+    def test_measure_merge(self):
+        result = measure_merge(num_uris=100)
+
+        assert result["uris"] == 100
+        assert result["indexed_ms"] >= 0 and result["nested_ms"] >= 0
+
+class TestExportBenchmark:
+    def test_measure_export_query(self):
+        result = measure_export_query(num_posts=20)
+
+        assert result["posts"] == 20
+        assert result["query_ms"] >= 0 and result["files_ms"] >= 0
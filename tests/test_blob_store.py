@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from mdfb.core import blob_store
+
+class TestBlobStore:
+    @pytest.fixture
+    def logger(self):
+        return logging.getLogger("mdfb.core.blob_store")
+
+    @pytest.fixture
+    def stored_blob(self, tmp_path):
+        path = blob_store.blob_path(str(tmp_path), "bafkreiexample1234")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"blob")
+        return path
+
+    def test_blob_path(self):
+        assert blob_store.blob_path("store", "bafkreiexample1234") == os.path.join("store", "blobs", "34", "bafkreiexample1234")
+
+    def test_find_blob_in_store(self, tmp_path, stored_blob):
+        assert blob_store.find_blob(str(tmp_path), "bafkreiexample1234") == stored_blob
+
+    def test_find_blob_in_other_store(self, tmp_path, stored_blob):
+        with patch.object(blob_store, "get_blob_path", return_value=stored_blob):
+            assert blob_store.find_blob(str(tmp_path / "other"), "bafkreiexample1234") == stored_blob
+
+    def test_find_blob_missing(self, tmp_path):
+        with patch.object(blob_store, "get_blob_path", return_value=str(tmp_path / "deleted")):
+            assert blob_store.find_blob(str(tmp_path), "bafkreiexample1234") is None
+
+    def test_link_blob_hardlink(self, tmp_path, stored_blob, logger):
+        target = str(tmp_path / "post.jpeg")
+        blob_store.link_blob(stored_blob, target, logger)
+        blob_store.link_blob(stored_blob, target, logger)
+
+        assert os.path.samefile(target, stored_blob)
+        assert not os.path.islink(target)
+        assert sorted(os.listdir(tmp_path)) == ["blobs", "post.jpeg"]
+
+    def test_link_blob_symlink_fallback(self, tmp_path, stored_blob, logger):
+        target = str(tmp_path / "post.jpeg")
+        with patch.object(blob_store.os, "link", side_effect=OSError("Invalid cross-device link")):
+            blob_store.link_blob(stored_blob, target, logger)
+
+        assert os.path.islink(target)
+        with open(target, "rb") as f:
+            assert f.read() == b"blob"
+
+    def test_cid_lock_serialises_same_cid(self):
+        active = []
+        overlaps = []
+
+        def worker():
+            with blob_store.cid_lock("bafkreiexample1234"):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.01)
+                active.pop()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(overlaps) == 1
+        assert blob_store._cid_locks == {}
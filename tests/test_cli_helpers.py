@@ -0,0 +1,16 @@
+import pytest
+from mdfb.utils import cli_helpers
+
+class TestReadAccountsFile:
+    def test_read_accounts_file(self, tmp_path):
+        path = tmp_path / "accounts.txt"
+        path.write_text("# accounts to archive\nbsky.app\n\n  did:plc:z72i7hdynmk6r22z27h6tvur  \nbsky.app\n")
+
+        assert cli_helpers.read_accounts_file(str(path)) == ["bsky.app", "did:plc:z72i7hdynmk6r22z27h6tvur"]
+
+    def test_read_accounts_file_empty(self, tmp_path):
+        path = tmp_path / "accounts.txt"
+        path.write_text("# nothing yet\n")
+
+        with pytest.raises(ValueError):
+            cli_helpers.read_accounts_file(str(path))
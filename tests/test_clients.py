@@ -0,0 +1,50 @@
+import pytest
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from mdfb.utils import clients
+
+class TestClients:
+    @pytest.fixture(autouse=True)
+    def fresh_clients(self):
+        clients.close_clients()
+        yield
+        clients.close_clients()
+
+    def test_get_http_client_shared(self):
+        assert clients.get_http_client() is clients.get_http_client()
+
+    def test_get_client_shared_per_host(self):
+        client = clients.get_client()
+        assert clients.get_client() is client
+        assert clients.get_client("https://public.api.bsky.app/") is not client
+
+    def test_get_client_uses_shared_pool(self):
+        pds_client = clients.get_client()
+        appview_client = clients.get_client("https://public.api.bsky.app/")
+        assert pds_client.request._client is clients.get_http_client()
+        assert appview_client.request._client is clients.get_http_client()
+
+    def test_get_client_thread_safe(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            result = list(executor.map(lambda _: clients.get_client(), range(64)))
+        assert all(client is result[0] for client in result)
+
+    def test_pooled_request_close_keeps_pool(self):
+        client = clients.get_client()
+        client.request.close()
+        assert not clients.get_http_client().is_closed
+
+    def test_pooled_request_clone_shares_pool(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"did": "did:plc:123"}))
+        http_client = httpx.Client(transport=transport)
+        request = clients.PooledRequest(http_client)
+        request.get(url="https://example.com/xrpc/com.atproto.identity.resolveHandle")
+        assert request.clone()._client is http_client
+
+    def test_close_clients(self):
+        http_client = clients.get_http_client()
+        client = clients.get_client()
+        clients.close_clients()
+        assert http_client.is_closed
+        assert clients.get_client() is not client
+
@@ -2,7 +2,10 @@ import pytest
 import sqlite3
 import tempfile
 import os
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import Mock, patch
+from mdfb.core import resolve_pds
 from mdfb.utils import database
 
 class TestDatabase:
@@ -130,6 +133,47 @@ class TestDatabase:
         
         assert result is False
 
+    def test_get_existing_posts(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+
+        result = database.get_existing_posts(cur, "user1", ["post1", "post2", "post3", "post999"], "feed1")
+        con.close()
+
+        assert result == {"post1", "post2"}
+
+    def test_get_existing_posts_batches(self, setup_test_db, monkeypatch):
+        monkeypatch.setattr(database, "EXISTS_BATCH_SIZE", 1)
+        con = database.connect_db()
+        cur = con.cursor()
+
+        result = database.get_existing_posts(cur, "user1", ["post1", "post2", "post999"], "feed1")
+        con.close()
+
+        assert result == {"post1", "post2"}
+
+    def test_get_existing_posts_empty(self, setup_test_db):
+        con = database.connect_db()
+        assert database.get_existing_posts(con.cursor(), "user1", [], "feed1") == set()
+        con.close()
+
+    def test_get_existing_posts_one_query(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+        page = ["post1", "post2", "post999"]
+
+        queries = []
+        con.set_trace_callback(queries.append)
+        per_record = {uri for uri in page if database.check_post_exists(cur, "user1", uri, "feed1")}
+        per_record_queries = len(queries)
+        queries.clear()
+        per_page = database.get_existing_posts(cur, "user1", page, "feed1")
+        con.close()
+
+        assert per_page == per_record == {"post1", "post2"}
+        assert per_record_queries == len(page)
+        assert len(queries) == 1
+
     def test_check_user_has_posts_true(self, setup_test_db):
         con = database.connect_db()
         cur = con.cursor()
@@ -221,4 +265,177 @@ class TestDatabase:
         database.delete_user("nonexistent_user")
         
         captured = capsys.readouterr()
-        assert "No matching rows found" in captured.out
\ No newline at end of file
+        assert "No matching rows found" in captured.out
+
+    def test_run_state_save_and_resume(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+        page = [
+            {"user_did": "user4", "user_post_uri": ["post6"], "feed_type": ["like"], "poster_post_uri": "poster6"},
+            {"user_did": "user4", "user_post_uri": ["post7"], "feed_type": ["like"], "poster_post_uri": "poster7"},
+        ]
+
+        database.start_run(cur, "user4", "like", 0, True, False)
+        database.save_page(cur, "user4", "like", page, "post7", 0)
+        con.commit()
+
+        assert database.get_run_state(cur, "user4", "like") == {"cursor": "post7", "remaining": 0, "archive": True, "update": False, "listed": False}
+        assert database.get_pending_posts("user4", {"like": True}) == page
+
+        database.finish_listing(cur, "user4", "like")
+        con.commit()
+        assert database.get_run_state(cur, "user4", "like")["listed"] is True
+        con.close()
+
+    def test_insert_post_removes_pending(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+        page = [
+            {"user_did": "user4", "user_post_uri": ["post6"], "feed_type": ["like"], "poster_post_uri": "poster6"},
+            {"user_did": "user4", "user_post_uri": ["post7"], "feed_type": ["like"], "poster_post_uri": "poster7"},
+        ]
+        database.start_run(cur, "user4", "like", 0, True, False)
+        database.save_page(cur, "user4", "like", page, "post7", 0)
+
+        database.insert_post(cur, [("user4", "post6", "like", "poster6")])
+        con.commit()
+        con.close()
+
+        assert database.get_pending_posts("user4", {"like": True}) == page[1:]
+
+    def test_start_run_forgets_previous_run(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+        page = [{"user_did": "user4", "user_post_uri": ["post6"], "feed_type": ["like"], "poster_post_uri": "poster6"}]
+        database.start_run(cur, "user4", "like", 0, True, False)
+        database.save_page(cur, "user4", "like", page, "post6", 0)
+
+        database.start_run(cur, "user4", "like", 10, False, False)
+        con.commit()
+
+        assert database.get_pending_posts("user4", {"like": True}) == []
+        assert database.get_run_state(cur, "user4", "like")["cursor"] is None
+        con.close()
+
+    def test_get_run_state_none(self, setup_test_db):
+        con = database.connect_db()
+        assert database.get_run_state(con.cursor(), "user4", "like") is None
+        con.close()
+
+    def test_post_details_cache(self, setup_test_db):
+        con = database.connect_db()
+        cur = con.cursor()
+        rows = [
+            ("poster1", "did1", "handle1", "name1", "image", "cid1,cid2", None, "image/jpeg", b"response1", time.time()),
+            ("poster2", "did2", "handle2", None, None, None, None, None, b"response2", time.time() - 100)
+        ]
+        database.insert_post_details(cur, rows)
+        con.commit()
+
+        assert database.get_post_details(cur, ["poster1", "poster2", "poster3"]) == {"poster1": b"response1", "poster2": b"response2"}
+        assert database.get_post_details(cur, ["poster1", "poster2"], max_age=50) == {"poster1": b"response1"}
+
+        database.insert_post_details(cur, [("poster2", "did2", "handle2", None, None, None, None, None, b"refreshed", time.time())])
+        con.commit()
+        assert database.get_post_details(cur, ["poster2"], max_age=50) == {"poster2": b"refreshed"}
+        con.close()
+
+class TestMigrations:
+    def test_migrate_db_new_database(self, tmp_path):
+        database.create_db(str(tmp_path))
+        con = sqlite3.connect(os.path.join(tmp_path, "mdfb.db"))
+
+        assert con.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+        indexes = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert "downloaded_posts_user_did_feed_type" in indexes
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        con.close()
+
+    def test_migrate_db_old_database(self, tmp_path):
+        # databases from before migrations only have downloaded_posts and a user_version of 0
+        con = sqlite3.connect(os.path.join(tmp_path, "mdfb.db"))
+        con.execute(database.MIGRATIONS[0][0])
+        con.execute("INSERT INTO downloaded_posts VALUES ('user1', 'post1', 'like', 'poster1')")
+        con.commit()
+
+        assert database.migrate_db(con) == len(database.MIGRATIONS)
+        assert database.migrate_db(con) == len(database.MIGRATIONS)
+        assert con.execute("SELECT COUNT(*) FROM downloaded_posts").fetchone()[0] == 1
+        plan = con.execute("EXPLAIN QUERY PLAN SELECT 1 FROM downloaded_posts WHERE user_did = ? AND feed_type = ?", ("user1", "like")).fetchall()
+        assert "downloaded_posts_user_did_feed_type" in str(plan)
+        con.close()
+
+class TestConnections:
+    @pytest.fixture
+    def data_path(self, tmp_path):
+        database.create_db(str(tmp_path))
+        with patch.object(database.platformdirs, "user_data_path", return_value=tmp_path):
+            yield tmp_path
+        database.close_db()
+
+    def test_connect_db_reused_per_thread(self, data_path):
+        assert database.connect_db() is database.connect_db()
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.connect_db()))
+        thread.start()
+        thread.join()
+        assert other[0] is not database.connect_db()
+
+    def test_writer_flush(self, data_path):
+        rows = [("user1", f"post{i}", "like", f"poster{i}") for i in range(10)]
+        database.write_posts(rows[:5])
+        database.write_posts(rows[5:])
+        database.flush_writes()
+
+        assert database.get_existing_posts(database.connect_db().cursor(), "user1", [row[1] for row in rows], "like") == {row[1] for row in rows}
+
+    def test_writer_many_threads(self, data_path):
+        def worker(thread_id):
+            for i in range(50):
+                database.write_posts([("user1", f"post{thread_id}-{i}", "like", "poster")])
+
+        threads = [threading.Thread(target=worker, args=(thread_id,)) for thread_id in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        database.close_db()
+
+        con = database.connect_db()
+        assert con.execute("SELECT COUNT(*) FROM downloaded_posts").fetchone()[0] == 400
+
+    def test_writer_resolve_pds(self, data_path):
+        # PDSes resolved by the download threads are cached by the writer thread, never on their own connections
+        did_doc = Mock()
+        did_doc.get_pds_endpoint.return_value = "https://pds.example.com"
+        writing_threads = []
+
+        def insert_pds(cur, *args):
+            writing_threads.append(threading.current_thread().name)
+            database.insert_pds(cur, *args)
+
+        resolve_pds.clear_pds_cache()
+        with patch("atproto_identity.did.resolver.DidResolver.resolve", return_value=did_doc), \
+            patch.object(resolve_pds, "insert_pds", side_effect=insert_pds):
+            threads = [threading.Thread(target=resolve_pds.resolve_pds, args=(f"did:plc:{i}",)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            database.flush_writes()
+        resolve_pds.clear_pds_cache()
+
+        assert writing_threads == ["mdfb-db-writer"] * 8
+        assert all(database.get_pds(database.connect_db().cursor(), f"did:plc:{i}")[0] == "https://pds.example.com" for i in range(8))
+
+    def test_writer_error_does_not_stop_writes(self, data_path, caplog):
+        def broken(cur):
+            raise sqlite3.OperationalError("broken")
+
+        database.get_writer().submit(broken)
+        database.write_posts([("user1", "post1", "like", "poster1")])
+        database.flush_writes()
+
+        assert "Error writing to the database with: broken" in caplog.text
+        assert database.check_post_exists(database.connect_db().cursor(), "user1", "post1", "like")
@@ -1,12 +1,13 @@
 import os
 import json
 import logging
+import stat
 import tempfile
 import pytest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
+import httpx
 from tenacity import stop_after_attempt, retry, wait_fixed
-from atproto.exceptions import AtProtocolError
-from mdfb.core import download_blobs 
+from mdfb.core import download_blobs, shards
 
 class TestDownloadBlobsUtils:
     def test_truncate_filename(self):
@@ -55,6 +56,11 @@ class TestDownloadBlobsUtils:
         assert result == f"{filename}_{i}.{file_type}"
 
 class TestDownloadBlobs:
+    @pytest.fixture(autouse=True)
+    def mock_resolve_pds(self):
+        with patch("mdfb.core.download_blobs.resolve_pds", return_value="https://pds.example.com") as mock_resolve_pds:
+            yield mock_resolve_pds
+
     @pytest.fixture(scope="class", autouse=True)
     def mock_instant_retry(self):
         fast_retry = retry(wait=wait_fixed(0), stop=stop_after_attempt(2))
@@ -71,11 +77,15 @@ class TestDownloadBlobs:
         with tempfile.TemporaryDirectory() as temp_dir:
             yield temp_dir
     
+    @staticmethod
+    def mock_http_client(handler):
+        return patch("mdfb.core.download_blobs.get_http_client", return_value=httpx.Client(transport=httpx.MockTransport(handler)))
+
     @pytest.fixture(scope="function")
     def successful_get_blob(self):
-        with patch("atproto_client.namespaces.sync_ns.ComAtprotoSyncNamespace.get_blob") as mock_download_blob: 
-            mock_blob_data = b"0x3eb"   
-            mock_download_blob.return_value = mock_blob_data
+        mock_blob_data = b"0x3eb"   
+        mock_download_blob = Mock(return_value=httpx.Response(200, content=mock_blob_data))
+        with self.mock_http_client(mock_download_blob): 
             yield {
                 "returned": mock_download_blob,
                 "expected": mock_blob_data
@@ -83,22 +93,22 @@ class TestDownloadBlobs:
 
     @pytest.fixture(scope="function")
     def exceed_retries_get_blob(self):
-        with patch("atproto_client.namespaces.sync_ns.ComAtprotoSyncNamespace.get_blob") as mock_download_blob: 
-            mock_download_blob.side_effect = [
-                AtProtocolError(),
-                AtProtocolError(),
-                AtProtocolError()
-            ]
+        mock_download_blob = Mock(side_effect=[
+            httpx.Response(500),
+            httpx.Response(500),
+            httpx.Response(500)
+        ])
+        with self.mock_http_client(mock_download_blob): 
             yield mock_download_blob
 
     @pytest.fixture(scope="function")
     def retries_then_succeeds_get_blob(self):
-        with patch("atproto_client.namespaces.sync_ns.ComAtprotoSyncNamespace.get_blob") as mock_download_blob: 
-            mock_blob_data = b"0x3eb"   
-            mock_download_blob.side_effect = [
-                AtProtocolError(),
-                mock_blob_data
-            ]
+        mock_blob_data = b"0x3eb"   
+        mock_download_blob = Mock(side_effect=[
+            httpx.ConnectError("connection reset"),
+            httpx.Response(200, content=mock_blob_data)
+        ])
+        with self.mock_http_client(mock_download_blob): 
             yield {
                 "returned": mock_download_blob,
                 "expected": mock_blob_data
@@ -171,6 +181,23 @@ class TestDownloadBlobs:
         assert not response
         assert f"Error occured for downloading this file, DID: {mock_did}, CID: {mock_cid}" in caplog.text
 
+    def test_get_blob_with_retries_blob_store(self, successful_get_blob, temp_dir):
+        logger = logging.getLogger('mdfb.core.download_blobs')
+        mock_cid = "bafkreiexample1234"
+
+        with patch("mdfb.core.blob_store.get_blob_path", return_value=None), \
+            patch("mdfb.core.download_blobs.record_blob") as mock_record_blob:
+            assert download_blobs._get_blob_with_retries("did:example:1234", mock_cid, "first.jpeg", temp_dir, logger, blob_store=temp_dir)
+            assert download_blobs._get_blob_with_retries("did:example:1234", mock_cid, "second.jpeg", temp_dir, logger, blob_store=temp_dir)
+
+        stored_path = os.path.join(temp_dir, "blobs", "34", mock_cid)
+        assert successful_get_blob["returned"].call_count == 1
+        mock_record_blob.assert_called_once_with(mock_cid, stored_path)
+        for filename in ["first.jpeg", "second.jpeg"]:
+            assert os.path.samefile(os.path.join(temp_dir, filename), stored_path)
+            with open(os.path.join(temp_dir, filename), "rb") as f:
+                assert f.read() == successful_get_blob["expected"]
+
     def test_get_blob_with_retries_success(self, successful_get_blob, caplog, temp_dir):
         mock_did = "did:example:1234"
         mock_cid = "example_1234"
@@ -189,6 +216,92 @@ class TestDownloadBlobs:
         assert actual_data == successful_get_blob["expected"]
         assert successful_get_blob["returned"].call_count == 1
 
+    def test_get_blob_requests_own_pds(self, successful_get_blob, temp_dir):
+        logger = logging.getLogger('mdfb.core.download_blobs')
+        download_blobs._get_blob("did:plc:1234", "mock_cid", "example_filename", temp_dir, logger)
+
+        request = successful_get_blob["returned"].call_args[0][0]
+        assert request.url.host == "pds.example.com"
+        assert request.url.path == "/xrpc/com.atproto.sync.getBlob"
+        assert request.url.params["did"] == "did:plc:1234"
+
+    def test_get_blob_unresolved_pds_falls_back(self, successful_get_blob, mock_resolve_pds, temp_dir):
+        mock_resolve_pds.side_effect = Exception()
+        logger = logging.getLogger('mdfb.core.download_blobs')
+        download_blobs._get_blob("did:plc:1234", "mock_cid", "example_filename", temp_dir, logger)
+
+        request = successful_get_blob["returned"].call_args[0][0]
+        assert str(request.url).startswith(download_blobs.PDS_URL)
+
+    def test_get_blob_streams_in_chunks(self, temp_dir):
+        mock_blob_data = os.urandom(3 * download_blobs.BLOB_CHUNK_SIZE + 10)
+        logger = logging.getLogger('mdfb.core.download_blobs')
+
+        with self.mock_http_client(lambda request: httpx.Response(200, content=iter([mock_blob_data[i:i + 4096] for i in range(0, len(mock_blob_data), 4096)]))):
+            download_blobs._get_blob("mock_did", "mock_cid", "example_filename.mp4", temp_dir, logger, size=len(mock_blob_data) + 1024)
+
+        with open(os.path.join(temp_dir, "example_filename.mp4"), "rb") as f:
+            assert f.read() == mock_blob_data
+        assert os.listdir(temp_dir) == ["example_filename.mp4"]
+
+    def test_get_blob_interrupted_leaves_no_file(self, temp_dir):
+        def interrupted_stream():
+            yield b"partial"
+            raise httpx.ReadError("connection dropped")
+        logger = logging.getLogger('mdfb.core.download_blobs')
+
+        with self.mock_http_client(lambda request: httpx.Response(200, content=interrupted_stream())):
+            with pytest.raises(Exception):
+                download_blobs._get_blob("mock_did", "mock_cid", "example_filename.mp4", temp_dir, logger)
+        assert os.listdir(temp_dir) == []
+
+    def test_atomic_file(self, temp_dir):
+        path = os.path.join(temp_dir, "example_filename")
+        with pytest.raises(ValueError):
+            with download_blobs.AtomicFile(path) as file:
+                file.write(b"partial")
+                raise ValueError()
+        assert os.listdir(temp_dir) == []
+
+        with download_blobs.AtomicFile(path, size=100) as file:
+            file.write(b"complete")
+        with open(path, "rb") as f:
+            assert f.read() == b"complete"
+
+    @pytest.mark.skipif(os.name != "posix", reason="file modes are POSIX only")
+    def test_atomic_file_mode(self, temp_dir):
+        umask = os.umask(0o022)
+        try:
+            with patch.object(download_blobs, "_UMASK", 0o022):
+                with download_blobs.AtomicFile(os.path.join(temp_dir, "atomic")) as file:
+                    file.write(b"complete")
+            with open(os.path.join(temp_dir, "opened"), "wb") as file:
+                file.write(b"complete")
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(os.path.join(temp_dir, "atomic")).st_mode) == 0o644
+        assert stat.S_IMODE(os.stat(os.path.join(temp_dir, "atomic")).st_mode) == stat.S_IMODE(os.stat(os.path.join(temp_dir, "opened")).st_mode)
+
+    def test_get_blob_sizes(self):
+        post = {"response": {"record": {"embed": {"media": {"images": [
+            {"image": {"ref": {"link": "cid1"}, "size": 10}},
+            {"image": {"ref": {"link": "cid2"}, "size": 20}}
+        ]}}}}}
+        assert download_blobs._get_blob_sizes(post) == {"cid1": 10, "cid2": 20}
+        assert download_blobs._get_blob_sizes({"response": {"record": {"embed": None}}}) == {}
+
+    def test_download_json_matches_json_dump(self, temp_dir):
+        post = {"response": {"uri": "at://did:plc:author/app.bsky.feed.post/rkey", "record": {"text": "héllo 😀 \"quoted\"\n", "langs": ["en"]}, "like_count": 1, "labels": [], "embed": None}}
+        download_blobs._download_json(temp_dir, "example_filename", post, logging.getLogger(__name__))
+
+        with open(os.path.join(temp_dir, "example_filename.json"), "rb") as f_json:
+            written = f_json.read()
+        expected_path = os.path.join(temp_dir, "expected.json")
+        with open(expected_path, "wt") as f_expected:
+            json.dump(post["response"], f_expected, indent=4)
+        with open(expected_path, "rb") as f_expected:
+            assert written == f_expected.read()
+
     def test_download_blob(self, successful_download_blobs, temp_dir, successful_get_blob):
         download_blobs.download_blobs(successful_download_blobs["post"], temp_dir, successful_download_blobs["mock_tdqm"])
         
@@ -203,4 +316,20 @@ class TestDownloadBlobs:
 
         with open(expected_file_path_json, "r") as f_json:
             actual_data_json = json.load(f_json)
-        assert actual_data_json == successful_download_blobs["post_response"]
\ No newline at end of file
+        assert actual_data_json == successful_download_blobs["post_response"]
+
+    def test_download_blobs_exports_downloaded_posts(self, successful_download_blobs, temp_dir):
+        posts = successful_download_blobs["post"] + [{**successful_download_blobs["post"][0], "rkey": "failed"}]
+        mock_export = Mock()
+        with patch.object(download_blobs, "_download_media", side_effect=[None, ValueError("broken")]), pytest.raises(ValueError):
+            download_blobs.download_blobs(posts, temp_dir, successful_download_blobs["mock_tdqm"], export=mock_export)
+
+        mock_export.write.assert_called_once_with([successful_download_blobs["post_response"]])
+
+    def test_download_blob_shards(self, successful_download_blobs, temp_dir, successful_get_blob):
+        with shards.ShardWriter(temp_dir, "gzip") as writer:
+            download_blobs.download_blobs(successful_download_blobs["post"], temp_dir, successful_download_blobs["mock_tdqm"], shards=writer)
+
+        assert os.path.exists(os.path.join(temp_dir, successful_download_blobs["filename"] + ".jpeg"))
+        assert not os.path.exists(os.path.join(temp_dir, successful_download_blobs["filename"] + ".json"))
+        assert shards.read_post(temp_dir, "3lqwz2kuzg22s") == successful_download_blobs["post_response"]
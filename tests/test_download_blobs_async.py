@@ -0,0 +1,141 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+import pytest
+from unittest.mock import patch, Mock
+import httpx
+from tenacity import stop_after_attempt, retry, wait_fixed
+from mdfb.core import download_blobs_async
+
+class TestDownloadBlobsAsync:
+    @pytest.fixture(autouse=True)
+    def mock_resolve_pds(self):
+        with patch("mdfb.core.download_blobs.resolve_pds", return_value="https://pds.example.com") as mock_resolve_pds:
+            yield mock_resolve_pds
+
+    @pytest.fixture(scope="class", autouse=True)
+    def mock_instant_retry(self):
+        fast_retry = retry(wait=wait_fixed(0), stop=stop_after_attempt(2))
+        
+        with patch('tenacity.retry', return_value=fast_retry):
+            import importlib
+            from mdfb.core import download_blobs_async
+            
+            importlib.reload(download_blobs_async)
+            yield
+
+    @pytest.fixture
+    def temp_dir(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield temp_dir
+
+    @pytest.fixture(scope="function")
+    def mock_posts(self):
+        posts = []
+        for i in range(5):
+            posts.append({
+                "rkey": f"rkey{i}",
+                "text": "",
+                "response": {"uri": f"at://did:plc:author/app.bsky.feed.post/rkey{i}"},
+                "user_did": "did:plc:user",
+                "user_post_uri": [f"at://did:plc:user/app.bsky.feed.like/like{i}"],
+                "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/rkey{i}",
+                "feed_type": ["like"],
+                "did": "did:plc:author",
+                "handle": "author.bsky.social",
+                "display_name": "Author",
+                "media_type": ["image"],
+                "images_cid": [f"cid{i}"],
+                "mime_type": "image/jpeg"
+            })
+        return posts
+
+    @pytest.fixture(scope="function")
+    def successful_get_blob(self):
+        mock_blob_data = b"0x3eb"   
+        mock_download_blob = Mock(return_value=httpx.Response(200, content=mock_blob_data))
+        with patch("mdfb.core.download_blobs_async.make_async_http_client", side_effect=lambda *args: httpx.AsyncClient(transport=httpx.MockTransport(mock_download_blob))): 
+            yield {
+                "returned": mock_download_blob,
+                "expected": mock_blob_data
+            }
+
+    @pytest.fixture(scope="function")
+    def exceed_retries_get_blob(self):
+        mock_download_blob = Mock(return_value=httpx.Response(500))
+        with patch("mdfb.core.download_blobs_async.make_async_http_client", side_effect=lambda *args: httpx.AsyncClient(transport=httpx.MockTransport(mock_download_blob))): 
+            yield mock_download_blob
+
+    @pytest.fixture(scope="function")
+    def mock_write_posts(self):
+        with patch("mdfb.core.download_blobs.write_posts") as mock_write_posts:
+            yield mock_write_posts
+
+    def test_get_blob_with_retries_success(self, successful_get_blob, temp_dir):
+        logger = logging.getLogger('mdfb.core.download_blobs_async')
+
+        response = asyncio.run(download_blobs_async._get_blob_with_retries("did:example:1234", "example_1234", "example_filename", temp_dir, download_blobs_async.make_async_http_client(), logger))
+
+        with open(os.path.join(temp_dir, "example_filename"), "rb") as f:
+            actual_data = f.read()
+        assert response
+        assert actual_data == successful_get_blob["expected"]
+        assert successful_get_blob["returned"].call_count == 1
+
+    def test_get_blob_with_retries_failure(self, exceed_retries_get_blob, caplog, temp_dir):
+        mock_did = "did:example:1234"
+        mock_cid = "example_1234"
+        logger = logging.getLogger('mdfb.core.download_blobs_async')
+
+        with caplog.at_level(logging.ERROR):
+            response = asyncio.run(download_blobs_async._get_blob_with_retries(mock_did, mock_cid, "example_filename", temp_dir, download_blobs_async.make_async_http_client(), logger))
+        
+        assert not response
+        assert exceed_retries_get_blob.call_count == 2
+        assert os.listdir(temp_dir) == []
+        assert f"Error occured for downloading this file, DID: {mock_did}, CID: {mock_cid}" in caplog.text
+
+    def test_download_blobs_async(self, successful_get_blob, mock_write_posts, mock_posts, temp_dir):
+        progress_bar = Mock()
+        asyncio.run(download_blobs_async.download_blobs_async(mock_posts, temp_dir, progress_bar, concurrency=2))
+
+        for post in mock_posts:
+            base_filename = f"{post['rkey']}_{post['handle']}_"
+            with open(os.path.join(temp_dir, base_filename + ".jpeg"), "rb") as f_jpeg:
+                assert f_jpeg.read() == successful_get_blob["expected"]
+            with open(os.path.join(temp_dir, base_filename + ".json"), "r") as f_json:
+                assert json.load(f_json) == post["response"]
+        
+        rows = mock_write_posts.call_args[0][0]
+        expected_rows = [(post["user_did"], post["user_post_uri"][0], post["feed_type"][0], post["poster_post_uri"]) for post in mock_posts]
+        assert sorted(rows) == sorted(expected_rows)
+        assert progress_bar.update.call_count == len(mock_posts)
+
+    def test_download_blobs_async_include_json(self, successful_get_blob, mock_write_posts, mock_posts, temp_dir):
+        asyncio.run(download_blobs_async.download_blobs_async(mock_posts, temp_dir, Mock(), include=["json"]))
+
+        assert successful_get_blob["returned"].call_count == 0
+        assert sorted(os.listdir(temp_dir)) == sorted(f"{post['rkey']}_{post['handle']}_.json" for post in mock_posts)
+        assert len(mock_write_posts.call_args[0][0]) == len(mock_posts)
+
+    def test_download_blobs_async_checkpoints(self, successful_get_blob, mock_write_posts, mock_posts, temp_dir):
+        with patch.object(download_blobs_async, "CHECKPOINT_INTERVAL", 1):
+            asyncio.run(download_blobs_async.download_blobs_async(mock_posts, temp_dir, Mock(), include=["json"]))
+
+        rows = [row for call in mock_write_posts.call_args_list for row in call.args[0]]
+        assert len(rows) == len(mock_posts)
+        assert all(len(call.args[0]) <= 1 for call in mock_write_posts.call_args_list)
+
+    def test_download_blobs_async_exports_downloaded_posts(self, successful_get_blob, mock_write_posts, mock_posts, temp_dir):
+        def download_json(file_path, filename, post, *args):
+            if post["rkey"] == "rkey2":
+                raise ValueError("broken")
+
+        mock_export = Mock()
+        with patch.object(download_blobs_async, "_download_json", side_effect=download_json):
+            asyncio.run(download_blobs_async.download_blobs_async(mock_posts, temp_dir, Mock(), include=["json"], export=mock_export))
+
+        exported = [response for call in mock_export.write.call_args_list for response in call.args[0]]
+        assert sorted(response["uri"] for response in exported) == sorted(post["response"]["uri"] for post in mock_posts if post["rkey"] != "rkey2")
@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import tempfile
+import pytest
+from mdfb.core import export, shards
+
+def _response(index: int, feed_type: str = "like") -> dict:
+    uri = f"at://did:plc:author/app.bsky.feed.post/rkey{index}"
+    return {
+        "user_did": "did:plc:user",
+        "user_post_uri": [f"at://did:plc:user/app.bsky.feed.{feed_type}/{index}"],
+        "feed_type": [feed_type],
+        "poster_post_uri": uri,
+        "uri": uri,
+        "author": {"did": "did:plc:author", "handle": "author.bsky.social", "display_name": "Author"},
+        "record": {
+            "text": f"post {index}",
+            "created_at": "2025-01-01T00:00:00.000Z",
+            "embed": {"images": [{"image": {"ref": {"link": f"cid{index}a"}, "mime_type": "image/jpeg"}}, {"image": {"ref": {"link": f"cid{index}b"}, "mime_type": "image/jpeg"}}]} if index % 2 else None
+        }
+    }
+
+class TestExport:
+    @pytest.fixture
+    def temp_dir(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield temp_dir
+
+    def test_post_row(self):
+        assert export.post_row(_response(1)) == {
+            "rkey": "rkey1",
+            "uri": "at://did:plc:author/app.bsky.feed.post/rkey1",
+            "did": "did:plc:author",
+            "handle": "author.bsky.social",
+            "text": "post 1",
+            "created_at": "2025-01-01T00:00:00.000Z",
+            "media_type": ["image", "image"],
+            "images_cid": ["cid1a", "cid1b"],
+            "video_cid": None,
+            "feed_type": ["like"],
+            "user_did": "did:plc:user"
+        }
+        assert export.post_row(_response(2))["media_type"] == []
+
+    def test_export_posts_sqlite(self, temp_dir):
+        for i in range(3):
+            with open(os.path.join(temp_dir, f"rkey{i}_author.bsky.social_.json"), "wt") as file:
+                json.dump(_response(i), file, indent=4)
+        with shards.ShardWriter(temp_dir, "gzip") as writer:
+            for i in range(3, 5):
+                writer.write({"rkey": f"rkey{i}", "poster_post_uri": _response(i)["uri"], "response": _response(i, "repost")})
+        path = os.path.join(temp_dir, "export.db")
+
+        assert export.export_posts(temp_dir, path) == 5
+
+        con = sqlite3.connect(path)
+        rows = con.execute("SELECT rkey, feed_type, images_cid FROM posts ORDER BY rkey").fetchall()
+        con.close()
+        assert rows == [("rkey0", "like", ""), ("rkey1", "like", "cid1a,cid1b"), ("rkey2", "like", ""), ("rkey3", "repost", "cid3a,cid3b"), ("rkey4", "repost", "")]
+
+    def test_export_writer_row_groups(self, temp_dir):
+        path = os.path.join(temp_dir, "export.sqlite")
+        with export.ExportWriter(path, row_group_size=10) as writer:
+            writer.write(_response(i) for i in range(25))
+            con = sqlite3.connect(path)
+            assert con.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 20
+            con.close()
+
+        con = sqlite3.connect(path)
+        assert con.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 25
+        con.close()
+
+    def test_export_writer_sqlite_replaces_posts(self, temp_dir):
+        path = os.path.join(temp_dir, "export.db")
+        with export.ExportWriter(path) as writer:
+            writer.write(_response(i) for i in range(3))
+        # a later download of the same posts, e.g. with --restore
+        with export.ExportWriter(path) as writer:
+            writer.write([_response(1, "repost"), _response(3)])
+
+        con = sqlite3.connect(path)
+        rows = con.execute("SELECT rkey, feed_type FROM posts ORDER BY rkey").fetchall()
+        con.close()
+        assert rows == [("rkey0", "like"), ("rkey1", "repost"), ("rkey2", "like"), ("rkey3", "like")]
+
+    def test_export_writer_parquet(self, temp_dir):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        path = os.path.join(temp_dir, "export.parquet")
+        with export.ExportWriter(path, row_group_size=10) as writer:
+            writer.write(_response(i) for i in range(25))
+
+        parquet_file = pyarrow_parquet.ParquetFile(path)
+        assert parquet_file.metadata.num_row_groups == 3
+        table = parquet_file.read()
+        assert table.column_names == export.COLUMNS
+        assert table.column("images_cid").to_pylist()[1] == ["cid1a", "cid1b"]
+        with pytest.raises(ValueError):
+            export.ExportWriter(path)
+
+    def test_export_writer_unknown_format(self, temp_dir):
+        with pytest.raises(ValueError):
+            export.ExportWriter(os.path.join(temp_dir, "export.csv"))
+
+    def test_export_query(self, temp_dir):
+        # counting image posts across an archive, from the export and from reading every JSON file
+        num_posts = 20
+        for i in range(num_posts):
+            with open(os.path.join(temp_dir, f"rkey{i}.json"), "wt") as file:
+                json.dump(_response(i), file, indent=4)
+        path = os.path.join(temp_dir, "export.db")
+        export.export_posts(temp_dir, path)
+
+        from_files = 0
+        for name in os.listdir(temp_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(temp_dir, name)) as file:
+                    from_files += "image" in export.post_row(json.load(file))["media_type"]
+        con = sqlite3.connect(path)
+        from_export = con.execute("SELECT COUNT(*) FROM posts WHERE media_type LIKE '%image%'").fetchone()[0]
+        con.close()
+
+        assert from_files == from_export == num_posts // 2
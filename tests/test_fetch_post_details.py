@@ -1,10 +1,13 @@
-import json
 import logging
+import sqlite3
 from unittest.mock import Mock, patch
 import pytest
 from tenacity import RetryError, stop_after_attempt, retry, wait_fixed
 from atproto.exceptions import AtProtocolError
-from mdfb.core import fetch_post_details
+from mdfb.core import download_blobs, fetch_post_details
+from mdfb.core.post_record import PostRecord, spill_responses
+from mdfb.utils import database
+from mdfb.utils.helpers import dedupe_posts
 
 class TestFetchPostDetails:
     @pytest.fixture(scope="class", autouse=True)
@@ -13,7 +16,7 @@ class TestFetchPostDetails:
         
         with patch('tenacity.retry', return_value=fast_retry):
             import importlib
-            from mdfb.core import fetch_post_details
+            from mdfb.core import download_blobs, fetch_post_details
 
             importlib.reload(fetch_post_details)
             yield
@@ -36,7 +39,7 @@ class TestFetchPostDetails:
         with patch("atproto_client.namespaces.sync_ns.AppBskyFeedNamespace.get_posts") as mock_api_response, \
             patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged:
             mock_response = Mock()
-            mock_response.model_dump_json.return_value = json.dumps(api_response["success"]["return"])
+            mock_response.model_dump.return_value = api_response["success"]["return"]
             mock_merged.return_value = api_response["success"]["return"]
             mock_api_response.return_value = mock_response
             yield mock_api_response, api_response["success"]["expected"]
@@ -46,7 +49,7 @@ class TestFetchPostDetails:
         with patch("atproto_client.namespaces.sync_ns.AppBskyFeedNamespace.get_posts") as mock_api_response, \
             patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged:
             mock_response = Mock()
-            mock_response.model_dump_json.return_value = json.dumps(api_response["deleted"]["return"])
+            mock_response.model_dump.return_value = api_response["deleted"]["return"]
             mock_merged.return_value = api_response["deleted"]["return"]
             mock_api_response.return_value = mock_response
             yield mock_api_response, api_response["deleted"]["expected"]
@@ -74,7 +77,7 @@ class TestGetPostDetails:
         
         with patch('tenacity.retry', return_value=fast_retry):
             import importlib
-            from mdfb.core import fetch_post_details
+            from mdfb.core import download_blobs, fetch_post_details
             
             importlib.reload(fetch_post_details)
             yield
@@ -170,4 +173,155 @@ class TestFetchPostDetailsUtils:
         mock_records = {"posts": [{"uri": "example_uri_1"}, {"uri": "example_uri_2"}]}
 
         result = fetch_post_details._merge_uri_chunk_to_records(mock_uri_chunk, mock_records)
-        assert result == [{"uri": "example_uri_1", "poster_post_uri": "example_uri_1"}, {"uri": "example_uri_2", "poster_post_uri": "example_uri_2"}]
\ No newline at end of file
+        assert result == [{"uri": "example_uri_1", "poster_post_uri": "example_uri_1"}, {"uri": "example_uri_2", "poster_post_uri": "example_uri_2"}]
+
+    def test_merge_uri_chunk_to_records_exact_uri(self):
+        mock_uri_chunk = [{"poster_post_uri": "at://did:plc:author/app.bsky.feed.post/post1"}]
+        mock_records = {"posts": [{"uri": "at://did:plc:author/app.bsky.feed.post/post10"}, {"uri": "at://did:plc:author/app.bsky.feed.post/post1"}]}
+
+        result = fetch_post_details._merge_uri_chunk_to_records(mock_uri_chunk, mock_records)
+        assert result == [{"uri": "at://did:plc:author/app.bsky.feed.post/post1", "poster_post_uri": "at://did:plc:author/app.bsky.feed.post/post1"}]
+
+    def test_merge_uri_chunk_to_records_duplicates(self):
+        # every identifier gets its own copy of the post, in the order of the identifiers, and missing posts are left out
+        mock_uri_chunk = [
+            {"user_post_uri": ["like1"], "poster_post_uri": "example_uri_2"},
+            {"user_post_uri": ["like2"], "poster_post_uri": "example_uri_1"},
+            {"user_post_uri": ["repost1"], "poster_post_uri": "example_uri_2"},
+            {"user_post_uri": ["like3"], "poster_post_uri": "example_uri_3"}
+        ]
+        mock_records = {"posts": [{"uri": "example_uri_1"}, {"uri": "example_uri_2"}]}
+
+        result = fetch_post_details._merge_uri_chunk_to_records(mock_uri_chunk, mock_records)
+        assert [(post["user_post_uri"], post["uri"]) for post in result] == [(["like1"], "example_uri_2"), (["like2"], "example_uri_1"), (["repost1"], "example_uri_2")]
+
+    @pytest.mark.parametrize("num_uris", [25, 100])
+    def test_merge_uri_chunk_to_records_matches_nested_scan(self, num_uris):
+        # getPosts returns the posts in no particular order. The rkeys are fixed width so the substring match of the nested scan 
+        # finds the same posts
+        uri_chunk = [{"user_did": "did:plc:user", "user_post_uri": [f"like{i}"], "feed_type": ["like"], "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/{i:06d}"} for i in range(num_uris)]
+        records = {"posts": [{"uri": uris["poster_post_uri"], "record": {}} for uris in reversed(uri_chunk)]}
+
+        result = fetch_post_details._merge_uri_chunk_to_records(uri_chunk, records)
+        nested = [{**uris, **post} for uris in uri_chunk for post in records["posts"] if uris["poster_post_uri"] in post["uri"]]
+
+        assert [post["user_post_uri"] for post in result] == [uris["user_post_uri"] for uris in uri_chunk]
+        assert result == nested
+
+class TestPostDetailsCache:
+    @pytest.fixture
+    def temp_db(self, tmp_path):
+        database.create_db(tmp_path)
+        connect = lambda: sqlite3.connect(tmp_path / "mdfb.db")
+        with patch.object(fetch_post_details, "connect_db", side_effect=connect), \
+            patch.object(database, "connect_db", side_effect=connect):
+            yield connect
+        database.flush_writes()
+
+    @pytest.fixture
+    def mock_get_posts(self):
+        def get_posts(params):
+            posts = [_post_view(uri) for uri in params["uris"]]
+            mock_response = Mock()
+            mock_response.model_dump.return_value = {"posts": posts}
+            return mock_response
+
+        with patch("atproto_client.namespaces.sync_ns.AppBskyFeedNamespace.get_posts", side_effect=get_posts) as mock_api_response:
+            yield mock_api_response
+
+    def test_fetch_post_details_reads_cache(self, temp_db, mock_get_posts):
+        identifiers = [_identifier("did:plc:user", i) for i in range(3)]
+        fetched = fetch_post_details.fetch_post_details(identifiers)
+        database.flush_writes()
+
+        cached = fetch_post_details.fetch_post_details(identifiers, cache=True)
+
+        assert mock_get_posts.call_count == 1
+        assert cached == fetched
+        assert fetched[0]["images_cid"] == ["bafkreicid0"]
+
+    def test_fetch_post_details_cache_shared_between_accounts(self, temp_db, mock_get_posts):
+        fetch_post_details.fetch_post_details([_identifier("did:plc:user", 0)])
+        database.flush_writes()
+
+        other = _identifier("did:plc:other", 0)
+        result = fetch_post_details.fetch_post_details([other], cache=True)
+
+        assert mock_get_posts.call_count == 1
+        assert result[0]["user_did"] == "did:plc:other"
+        assert result[0]["response"]["user_post_uri"] == other["user_post_uri"]
+
+    def test_fetch_post_details_refreshes_stale(self, temp_db, mock_get_posts):
+        identifiers = [_identifier("did:plc:user", i) for i in range(2)]
+        fetch_post_details.fetch_post_details(identifiers)
+        database.flush_writes()
+        con = temp_db()
+        con.execute("UPDATE post_details SET fetched_at = fetched_at - 100 WHERE poster_post_uri = ?", (identifiers[0]["poster_post_uri"],))
+        con.commit()
+        con.close()
+
+        result = fetch_post_details.fetch_post_details(identifiers, cache=True, max_age=50)
+
+        assert mock_get_posts.call_count == 2
+        assert mock_get_posts.call_args.args[0]["uris"] == [identifiers[0]["poster_post_uri"]]
+        assert sorted(post["rkey"] for post in result) == ["post0", "post1"]
+
+    def test_fetch_post_details_restore_without_appview(self, temp_db, mock_get_posts):
+        identifiers = [_identifier("did:plc:user", i) for i in range(2000)]
+        fetch_post_details.fetch_post_details(identifiers)
+        database.flush_writes()
+        mock_get_posts.reset_mock()
+
+        result = fetch_post_details.fetch_post_details(identifiers, cache=True)
+
+        assert mock_get_posts.call_count == 0
+        assert len(result) == len(identifiers)
+
+    def test_fetch_post_details_spill_responses(self, temp_db, mock_get_posts, tmp_path):
+        identifiers = [_identifier("did:plc:user", i) for i in range(3)]
+        fetched = fetch_post_details.fetch_post_details(identifiers)
+        database.flush_writes()
+
+        with spill_responses(tmp_path):
+            records = fetch_post_details.fetch_post_details(identifiers)
+            cached = fetch_post_details.fetch_post_details(identifiers, cache=True)
+            assert all(isinstance(post, PostRecord) for post in records + cached)
+            assert [post["response"] for post in records] == [post["response"] for post in cached] == [post["response"] for post in fetched]
+            assert records[0]["images_cid"] == ("bafkreicid0",)
+            assert records[0]["did"] == fetched[0]["did"]
+
+    def test_dedupe_posts_spill_responses(self, temp_db, mock_get_posts, tmp_path):
+        # the same post liked and reposted by the account, hydrated separately for each post type as with --media-types
+        like = _identifier("did:plc:user", 1)
+        repost = {**like, "user_post_uri": ["at://did:plc:user/app.bsky.feed.repost/repost1"], "feed_type": ["repost"]}
+
+        with spill_responses(tmp_path):
+            posts = dedupe_posts(fetch_post_details.fetch_post_details([like]) + fetch_post_details.fetch_post_details([repost]))
+
+            assert len(posts) == 1
+            assert list(posts[0]["feed_type"]) == ["like", "repost"]
+            assert list(posts[0]["user_post_uri"]) == like["user_post_uri"] + repost["user_post_uri"]
+            assert posts[0]["response"]["feed_type"] == ["like", "repost"]
+            assert download_blobs._successful_download(posts[0], Mock()) == [
+                ("did:plc:user", like["user_post_uri"][0], "like", like["poster_post_uri"]),
+                ("did:plc:user", repost["user_post_uri"][0], "repost", like["poster_post_uri"])
+            ]
+
+def _identifier(user_did: str, index: int) -> dict:
+    return {
+        "user_did": user_did,
+        "user_post_uri": [f"at://{user_did}/app.bsky.feed.like/like{index}"],
+        "feed_type": ["like"],
+        "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/post{index}"
+    }
+
+def _post_view(uri: str) -> dict:
+    index = uri[-1]
+    return {
+        "uri": uri,
+        "author": {"did": "did:plc:author", "handle": "author.bsky.social", "display_name": "Author"},
+        "record": {
+            "text": f"post {index}",
+            "embed": {"images": [{"image": {"ref": {"link": f"bafkreicid{index}"}, "mime_type": "image/jpeg", "size": 1000}}]}
+        }
+    }
@@ -0,0 +1,82 @@
+import os
+import httpx
+import pytest
+from unittest.mock import patch
+from mdfb.core import fetch_repo
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "repo.car")
+DID = "did:plc:testuser"
+
+def _read_chunks(size: int):
+    with open(FIXTURE, "rb") as file:
+        while chunk := file.read(size):
+            yield chunk
+
+def _identifier(feed_type: str, rkey: str, poster_post_uri: str = None) -> dict:
+    record_uri = f"at://{DID}/app.bsky.feed.{feed_type}/{rkey}"
+    return {
+        "user_did": DID,
+        "user_post_uri": [record_uri],
+        "feed_type": [feed_type],
+        "poster_post_uri": poster_post_uri or record_uri
+    }
+
+EXPECTED = {
+    "post": [
+        _identifier("post", "3lcccccccccc2"),
+        _identifier("post", "3lcccccccccc1")
+    ],
+    "like": [
+        _identifier("like", "3lbbbbbbbbbb2", "at://did:plc:another/app.bsky.feed.post/3kaaaaaaaaaa2"),
+        _identifier("like", "3lbbbbbbbbbb1", "at://did:plc:other/app.bsky.feed.post/3kaaaaaaaaaa1")
+    ],
+    "repost": [
+        _identifier("repost", "3leeeeeeeeee1", "at://did:plc:other/app.bsky.feed.post/3kaaaaaaaaaa1")
+    ]
+}
+
+class TestParseRepo:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+    def test_parse_repo(self, chunk_size):
+        result = fetch_repo.parse_repo(_read_chunks(chunk_size), DID, ["post", "like", "repost"])
+        assert result == EXPECTED
+
+    def test_parse_repo_only_wanted_feed_types(self):
+        result = fetch_repo.parse_repo(_read_chunks(1024), DID, ["like"])
+        assert result == {"like": EXPECTED["like"]}
+
+    def test_parse_repo_truncated(self):
+        with open(FIXTURE, "rb") as file:
+            data = file.read()
+        with pytest.raises(ValueError):
+            fetch_repo.parse_repo([data[:-10]], DID, ["post"])
+
+    def test_parse_repo_empty(self):
+        with pytest.raises(ValueError):
+            fetch_repo.parse_repo([], DID, ["post"])
+
+    def test_iter_car_blocks(self):
+        blocks = list(fetch_repo.iter_car_blocks(_read_chunks(1024)))
+        assert len(blocks) == 10
+        assert all(cid[:2] == b"\x01\x71" and len(cid) == 36 for cid, _ in blocks)
+
+class TestFetchRepoIdentifiers:
+    @pytest.fixture(autouse=True)
+    def mock_resolve_pds(self):
+        with patch.object(fetch_repo, "resolve_pds", return_value="https://pds.example.com") as mock_resolve_pds:
+            yield mock_resolve_pds
+
+    def test_fetch_repo_identifiers(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            with open(FIXTURE, "rb") as file:
+                return httpx.Response(200, content=file.read())
+
+        with patch.object(fetch_repo, "get_http_client", return_value=httpx.Client(transport=httpx.MockTransport(handler))):
+            result = fetch_repo.fetch_repo_identifiers(DID, ["post", "repost"])
+
+        assert result == {"post": EXPECTED["post"], "repost": EXPECTED["repost"]}
+        assert len(requests) == 1
+        assert str(requests[0].url) == f"https://pds.example.com/xrpc/com.atproto.sync.getRepo?did={DID.replace(':', '%3A')}"
@@ -1,10 +1,13 @@
-import json
+import os
+import sqlite3
+import tempfile
 from unittest.mock import MagicMock, Mock, patch
 from tenacity import stop_after_attempt, retry, wait_fixed, RetryError
 import pytest
 import logging
 from atproto.exceptions import AtProtocolError
 from mdfb.core import get_post_identifiers
+from mdfb.utils import database
 
 class TestGetPostIdentifiers:
     @pytest.fixture(scope="class", autouse=True)
@@ -52,7 +55,7 @@ class TestGetPostIdentifiers:
         expected = [{'user_did': 'did:example:1234', 'user_post_uri': ['at://did:plc:z72i7hdynmk6r22z27h6tvur/app.bsky.feed.like/3ld7z46debo2g'], 'feed_type': ['like'], 'poster_post_uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a'}, {'user_did': 'did:example:1234', 'user_post_uri': ['at://did:plc:z72i7hdynmk6r22z27h6tvur/app.bsky.feed.like/3lbxh76jfuq2y'], 'feed_type': ['like'], 'poster_post_uri': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.feed.post/3lbxe3z66hk2e'}]
         with patch("atproto_client.namespaces.sync_ns.ComAtprotoRepoNamespace.list_records") as mock_api_response:
             mock_response = MagicMock()
-            mock_response.model_dump_json.return_value = json.dumps(mock_json_response)
+            mock_response.model_dump.return_value = mock_json_response
             mock_api_response.return_value = mock_response
             yield {
                 "mock_api_response": mock_api_response,
@@ -64,9 +67,10 @@ class TestGetPostIdentifiers:
         mock_fetch_post_response = [{'user_did': 'did:plc:u6iyyil77bqv5fknwauj3tfk', 'user_post_uri': ['at://did:plc:u6iyyil77bqv5fknwauj3tfk/app.bsky.feed.like/3lrjgrrwsdg2z'], 'feed_type': ['like'], 'poster_post_uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a', 'author': {'did': 'did:plc:xlqcxpk53spbhlypj6wmvvke', 'handle': 'popbase.tv', 'associated': {'chat': {'allow_incoming': 'all', 'py_type': 'app.bsky.actor.defs#profileAssociatedChat'}, 'feedgens': None, 'labeler': None, 'lists': None, 'starter_packs': None, 'py_type': 'app.bsky.actor.defs#profileAssociated'}, 'avatar': 'https://cdn.bsky.app/img/avatar/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreicieqzk3twxj6zeyd7gpm637zib277rkyciorvfu25whjhzn3542u@jpeg', 'created_at': '2024-09-03T22:04:10.910Z', 'display_name': 'Pop Base', 'labels': [], 'viewer': None, 'py_type': 'app.bsky.actor.defs#profileViewBasic'}, 'cid': 'bafyreifp4vomoqhxritmilksydl4iixlnqnmwhau4nnprs7dvl4xy6gmqi', 'indexed_at': '2024-12-13T07:44:21.553Z', 'record': {'created_at': '2024-12-13T07:44:19.946Z', 'text': 'Bluesky has passed a milestone of 25 MILLION users.', 'embed': {'images': [{'alt': 'Landscape image of the Bluesky logo.', 'image': {'mime_type': 'image/jpeg', 'size': 82140, 'ref': {'link': 'bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu'}, 'py_type': 'blob'}, 'aspect_ratio': {'height': 683, 'width': 1290, 'py_type': 'app.bsky.embed.defs#aspectRatio'}, 'py_type': 'app.bsky.embed.images#image'}], 'py_type': 'app.bsky.embed.images'}, 'entities': None, 'facets': None, 'labels': None, 'langs': ['en'], 'reply': None, 'tags': None, 'py_type': 'app.bsky.feed.post'}, 'uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a', 'embed': {'images': [{'alt': 'Landscape image of the Bluesky logo.', 'fullsize': 'https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu@jpeg', 'thumb': 'https://cdn.bsky.app/img/feed_thumbnail/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu@jpeg', 'aspect_ratio': {'height': 683, 'width': 1290, 'py_type': 'app.bsky.embed.defs#aspectRatio'}, 'py_type': 'app.bsky.embed.images#viewImage'}], 'py_type': 'app.bsky.embed.images#view'}, 'labels': [], 'like_count': 8577, 'quote_count': 109, 'reply_count': 128, 'repost_count': 677, 'threadgate': None, 'viewer': None, 'py_type': 'app.bsky.feed.defs#postView'}, {'user_did': 'did:plc:u6iyyil77bqv5fknwauj3tfk', 'user_post_uri': ['at://did:plc:u6iyyil77bqv5fknwauj3tfk/app.bsky.feed.like/3lrjgroyvx42x'], 'feed_type': ['like'], 'poster_post_uri': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.feed.post/3lbxe3z66hk2e', 'author': {'did': 'did:plc:vc7f4oafdgxsihk4cry2xpze', 'handle': 'jcsalterego.bsky.social', 'associated': {'chat': {'allow_incoming': 'following', 'py_type': 'app.bsky.actor.defs#profileAssociatedChat'}, 'feedgens': None, 'labeler': None, 'lists': None, 'starter_packs': None, 'py_type': 'app.bsky.actor.defs#profileAssociated'}, 'avatar': 'https://cdn.bsky.app/img/avatar/plain/did:plc:vc7f4oafdgxsihk4cry2xpze/bafkreicwxwecqiko2rwwln5y3fqqb2zx6wfg5rxf5r7lukakkq2slqy5hy@jpeg', 'created_at': '2023-04-23T20:11:04.375Z', 'display_name': 'Jerry Chen', 'labels': [{'cts': '1970-01-01T00:00:00.000Z', 'src': 'did:plc:vc7f4oafdgxsihk4cry2xpze', 'uri': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.actor.profile/self', 'val': '!no-unauthenticated', 'cid': 'bafyreidfiuv3c22vliyu2onazf23zrp35rr7i3upsqa2dsn5cqimmlgugm', 'exp': None, 'neg': None, 'sig': None, 'ver': None, 'py_type': 'com.atproto.label.defs#label'}], 'viewer': None, 'py_type': 'app.bsky.actor.defs#profileViewBasic'}, 'cid': 'bafyreiabo7kerzlewo33l4y6qqdwgmpjhrpi6yagf7fvzn2tepnstn2lie', 'indexed_at': '2024-11-27T20:07:29.966Z', 'record': {'created_at': '2024-11-27T20:07:29.775Z', 'text': 'no i will not pay $29.99/mo to know which one of my posts made it into the bsky slack. i will pay much, much more', 'embed': None, 'entities': None, 'facets': None, 'labels': None, 'langs': ['en'], 'reply': None, 'tags': None, 'py_type': 'app.bsky.feed.post'}, 'uri': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.feed.post/3lbxe3z66hk2e', 'embed': None, 'labels': [], 'like_count': 1211, 'quote_count': 4, 'reply_count': 29, 'repost_count': 45, 'threadgate': {'cid': 'bafyreigo3mzmgz665jqzngjjuxm3hxnmbvkkqs37lxvxt722ycfjv73dbq', 'lists': [], 'record': {'created_at': '2024-11-28T18:04:38.197Z', 'post': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.feed.post/3lbxe3z66hk2e', 'allow': None, 'hidden_replies': ['at://did:plc:3cbrfca7okiytbjbpdu3cmgz/app.bsky.feed.post/3lbznkdbosk2v'], 'py_type': 'app.bsky.feed.threadgate'}, 'uri': 'at://did:plc:vc7f4oafdgxsihk4cry2xpze/app.bsky.feed.threadgate/3lbxe3z66hk2e', 'py_type': 'app.bsky.feed.defs#threadgateView'}, 'viewer': None, 'py_type': 'app.bsky.feed.defs#postView'}]
         expected = [{'rkey': '3ld6bzuenjs2a', 'text': 'Bluesky has passed a milestone of 25 MILLION users.', 'response': {'user_did': 'did:plc:u6iyyil77bqv5fknwauj3tfk', 'user_post_uri': ['at://did:plc:u6iyyil77bqv5fknwauj3tfk/app.bsky.feed.like/3lrjgrrwsdg2z'], 'feed_type': ['like'], 'poster_post_uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a', 'author': {'did': 'did:plc:xlqcxpk53spbhlypj6wmvvke', 'handle': 'popbase.tv', 'associated': {'chat': {'allow_incoming': 'all', 'py_type': 'app.bsky.actor.defs#profileAssociatedChat'}, 'feedgens': None, 'labeler': None, 'lists': None, 'starter_packs': None, 'py_type': 'app.bsky.actor.defs#profileAssociated'}, 'avatar': 'https://cdn.bsky.app/img/avatar/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreicieqzk3twxj6zeyd7gpm637zib277rkyciorvfu25whjhzn3542u@jpeg', 'created_at': '2024-09-03T22:04:10.910Z', 'display_name': 'Pop Base', 'labels': [], 'viewer': None, 'py_type': 'app.bsky.actor.defs#profileViewBasic'}, 'cid': 'bafyreifp4vomoqhxritmilksydl4iixlnqnmwhau4nnprs7dvl4xy6gmqi', 'indexed_at': '2024-12-13T07:44:21.553Z', 'record': {'created_at': '2024-12-13T07:44:19.946Z', 'text': 'Bluesky has passed a milestone of 25 MILLION users.', 'embed': {'images': [{'alt': 'Landscape image of the Bluesky logo.', 'image': {'mime_type': 'image/jpeg', 'size': 82140, 'ref': {'link': 'bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu'}, 'py_type': 'blob'}, 'aspect_ratio': {'height': 683, 'width': 1290, 'py_type': 'app.bsky.embed.defs#aspectRatio'}, 'py_type': 'app.bsky.embed.images#image'}], 'py_type': 'app.bsky.embed.images'}, 'entities': None, 'facets': None, 'labels': None, 'langs': ['en'], 'reply': None, 'tags': None, 'py_type': 'app.bsky.feed.post'}, 'uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a', 'embed': {'images': [{'alt': 'Landscape image of the Bluesky logo.', 'fullsize': 'https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu@jpeg', 'thumb': 'https://cdn.bsky.app/img/feed_thumbnail/plain/did:plc:xlqcxpk53spbhlypj6wmvvke/bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu@jpeg', 'aspect_ratio': {'height': 683, 'width': 1290, 'py_type': 'app.bsky.embed.defs#aspectRatio'}, 'py_type': 'app.bsky.embed.images#viewImage'}], 'py_type': 'app.bsky.embed.images#view'}, 'labels': [], 'like_count': 8577, 'quote_count': 109, 'reply_count': 128, 'repost_count': 677, 'threadgate': None, 'viewer': None, 'py_type': 'app.bsky.feed.defs#postView'}, 'user_did': 'did:plc:u6iyyil77bqv5fknwauj3tfk', 'user_post_uri': ['at://did:plc:u6iyyil77bqv5fknwauj3tfk/app.bsky.feed.like/3lrjgrrwsdg2z'], 'poster_post_uri': 'at://did:plc:xlqcxpk53spbhlypj6wmvvke/app.bsky.feed.post/3ld6bzuenjs2a', 'feed_type': ['like'], 'did': 'did:plc:xlqcxpk53spbhlypj6wmvvke', 'handle': 'popbase.tv', 'display_name': 'Pop Base', 'media_type': ['image'], 'images_cid': ['bafkreifma6v5wt6ml4srjfzd3ayd743kg2kjwvu2rnursohhjffuypqhhu'], 'mime_type': 'image/jpeg'}]
         with patch("atproto_client.namespaces.sync_ns.AppBskyFeedNamespace.get_posts") as mock_api_response, \
-            patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged:
+            patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged, \
+            patch("mdfb.core.fetch_post_details.get_post_details", return_value={}):
             mock_response = Mock()
-            mock_response.model_dump_json.return_value = json.dumps(mock_fetch_post_response)
+            mock_response.model_dump.return_value = mock_fetch_post_response
             mock_merged.return_value = mock_fetch_post_response
             mock_api_response.return_value = mock_response
             yield {
@@ -79,9 +83,10 @@ class TestGetPostIdentifiers:
         mock_fetch_post_response = []
         expected = []
         with patch("atproto_client.namespaces.sync_ns.AppBskyFeedNamespace.get_posts") as mock_api_response, \
-            patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged:
+            patch("mdfb.core.fetch_post_details._merge_uri_chunk_to_records") as mock_merged, \
+            patch("mdfb.core.fetch_post_details.get_post_details", return_value={}):
             mock_response = Mock()
-            mock_response.model_dump_json.return_value = json.dumps(mock_fetch_post_response)
+            mock_response.model_dump.return_value = mock_fetch_post_response
             mock_merged.return_value = mock_fetch_post_response
             mock_api_response.return_value = mock_response
             yield {
@@ -105,7 +110,7 @@ class TestGetPostIdentifiers:
         with patch("atproto_client.namespaces.sync_ns.ComAtprotoRepoNamespace.list_records") as mock_api_response:
             success_data = ["success!"]
             mock_response = Mock()
-            mock_response.model_dump_json.return_value = json.dumps(success_data)
+            mock_response.model_dump.return_value = success_data
             mock_api_response.return_value = mock_response
             mock_api_response.side_effect = [
                 AtProtocolError(),
@@ -126,12 +131,59 @@ class TestGetPostIdentifiers:
             "records": []
         }
         mock_response = MagicMock()
-        mock_response.model_dump_json.return_value = json.dumps(mock_json_response)
+        mock_response.model_dump.return_value = mock_json_response
         with patch("atproto_client.namespaces.sync_ns.ComAtprotoRepoNamespace.list_records") as mock_api_response:
             mock_api_response.return_value = mock_response
             result = get_post_identifiers.get_post_identifiers("did:example:1234", "like", 2)
             assert result == []
 
+    @pytest.fixture
+    def temp_db(self):
+        temp_dir = tempfile.mkdtemp()
+        database.create_db(temp_dir)
+        connect = lambda: sqlite3.connect(os.path.join(temp_dir, "mdfb.db"))
+        with patch.object(get_post_identifiers, "connect_db", side_effect=connect), \
+            patch.object(database, "connect_db", side_effect=connect):
+            yield temp_dir
+
+        import shutil
+        shutil.rmtree(temp_dir)
+
+    def test_iter_post_identifiers_resume(self, temp_db):
+        first_page = {
+            "records": [
+                {"uri": "at://did:example:1234/app.bsky.feed.post/3ld7z46debo2g", "value": {}},
+                {"uri": "at://did:example:1234/app.bsky.feed.post/3lbxh76jfuq2y", "value": {}}
+            ]
+        }
+        second_page = {
+            "records": [
+                {"uri": "at://did:example:1234/app.bsky.feed.post/3laaaaaaaaaa2", "value": {}}
+            ]
+        }
+        responses = []
+        for page in [first_page, second_page, {"records": []}]:
+            mock_response = MagicMock()
+            mock_response.model_dump.return_value = page
+            responses.append(mock_response)
+
+        with patch("atproto_client.namespaces.sync_ns.ComAtprotoRepoNamespace.list_records", side_effect=responses) as mock_api_response:
+            pages = get_post_identifiers.iter_post_identifiers("did:example:1234", "post", archive=True)
+            next(pages)
+            # the run is killed after the first page was listed
+            pages.close()
+
+            result = get_post_identifiers.resume_post_identifiers("did:example:1234", "post")
+
+        assert [post["poster_post_uri"] for post in result] == [record["uri"] for record in first_page["records"] + second_page["records"]]
+        assert mock_api_response.call_args_list[1].args[0]["cursor"] == "3lbxh76jfuq2y"
+        con = sqlite3.connect(os.path.join(temp_db, "mdfb.db"))
+        assert database.get_run_state(con.cursor(), "did:example:1234", "post")["listed"] is True
+
+    def test_resume_post_identifiers_no_run(self, temp_db):
+        with pytest.raises(ValueError):
+            get_post_identifiers.resume_post_identifiers("did:example:1234", "post")
+
     def test_get_post_identifiers_media_types_video(self, successful_response_media_types):
         result = get_post_identifiers.get_post_identifiers_media_types("did:example:1234", "like", ["image"], limit=2)
 
@@ -1,5 +1,7 @@
+import time
 import pytest
-from mdfb.utils.helpers import split_list, get_chunk
+from concurrent.futures import ThreadPoolExecutor
+from mdfb.utils.helpers import split_list, get_chunk, work_queue, drain_queue, interleave
 
 def test_split_list():
     mock_posts = ["hello", "world", "!"]
@@ -29,4 +31,59 @@ def test_get_chunk_zero_posts():
     mock_posts = []
     mock_chunk_size = 1
     result = list(get_chunk(mock_posts, mock_chunk_size))
-    assert result == []
\ No newline at end of file
+    assert result == []
+
+def test_work_queue_drain_queue():
+    mock_posts = ["hello", "world", "!"]
+    shared_queue = work_queue(mock_posts)
+    assert list(drain_queue(shared_queue)) == mock_posts
+    assert list(drain_queue(shared_queue)) == []
+
+def test_drain_queue_shared_between_threads():
+    shared_queue = work_queue(range(1000))
+    results = [[] for _ in range(4)]
+
+    def worker(i: int):
+        for item in drain_queue(shared_queue):
+            results[i].append(item)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(worker, range(4)))
+    assert sorted(item for result in results for item in result) == list(range(1000))
+
+def test_work_queue_skewed_tail_completion():
+    # one slice holds all of the slow items, e.g. videos, while the other holds only fast text posts
+    num_threads = 2
+    workload = [0.05] * 6 + [0.0] * 6
+
+    def worker(items):
+        for duration in items:
+            time.sleep(duration)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        list(executor.map(worker, split_list(workload, num_threads)))
+    static_time = time.perf_counter() - start
+
+    shared_queue = work_queue(workload)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        list(executor.map(worker, [drain_queue(shared_queue) for _ in range(num_threads)]))
+    queue_time = time.perf_counter() - start
+
+    assert queue_time < static_time * 0.75
+
+def test_interleave():
+    assert list(interleave([[1, 2, 3], [], ["a"], iter(["x", "y"])])) == [1, "a", "x", 2, "y", 3]
+
+def test_interleave_is_lazy():
+    taken = []
+
+    def source(name):
+        for i in range(3):
+            taken.append(name)
+            yield f"{name}{i}"
+
+    items = interleave([source("a"), source("b")])
+    assert [next(items), next(items), next(items)] == ["a0", "b0", "a1"]
+    assert taken == ["a", "b", "a"]
@@ -0,0 +1,57 @@
+import glob
+import logging
+import os
+import tempfile
+import threading
+import pytest
+from mdfb.utils.logging import setup_logging, stop_logging
+
+class TestLogging:
+    @pytest.fixture
+    def temp_dir(self):
+        loggers = [logging.getLogger(name) for name in [None, "httpx", "httpcore"]]
+        levels = [logger.level for logger in loggers]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield temp_dir
+            stop_logging()
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+    def _read_log(self, directory: str) -> str:
+        stop_logging()
+        [path] = glob.glob(os.path.join(directory, "mdfb_*.log"))
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+
+    def test_setup_logging_from_threads(self, temp_dir):
+        setup_logging(temp_dir)
+        logger = logging.getLogger("mdfb.core.download_blobs")
+        threads = [threading.Thread(target=logger.info, args=("Downloaded from thread: %d", i)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        log = self._read_log(temp_dir)
+        assert sorted(line.split("] ")[1] for line in log.splitlines()) == sorted(f"Downloaded from thread: {i}" for i in range(10))
+
+    def test_setup_logging_level(self, temp_dir):
+        setup_logging(temp_dir, logging.INFO)
+        logger = logging.getLogger("mdfb.core.download_blobs")
+        logger.debug("Successful downloaded image: %s", "rkey.jpeg")
+        logger.info("Fetching details from %d URIs", 25)
+        logging.getLogger("httpx").info("HTTP Request: GET")
+
+        log = self._read_log(temp_dir)
+        assert "Fetching details from 25 URIs" in log
+        assert "Successful downloaded image" not in log
+        assert "HTTP Request" not in log
+
+    def test_setup_logging_debug(self, temp_dir):
+        setup_logging(temp_dir, logging.DEBUG)
+        logging.getLogger("mdfb.core.download_blobs").debug("Successful downloaded image: %s", "rkey.jpeg")
+        logging.getLogger("httpx").info("HTTP Request: GET")
+
+        log = self._read_log(temp_dir)
+        assert "Successful downloaded image: rkey.jpeg" in log
+        assert "HTTP Request: GET" in log
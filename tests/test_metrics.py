@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import httpx
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import retry, stop_after_attempt, wait_none
+from mdfb.utils import clients, metrics
+
+class TestMetrics:
+    @pytest.fixture
+    def registry(self):
+        return metrics.MetricsRegistry()
+
+    def test_counter_thread_safe(self, registry):
+        counter = registry.counter("test_total", "Test counter")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: counter.inc(endpoint="getPosts"), range(1000)))
+        assert counter.value(endpoint="getPosts") == 1000
+        assert registry.counter("test_total", "Test counter") is counter
+
+    def test_histogram(self, registry):
+        histogram = registry.histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, endpoint="getBlob")
+
+        samples = {(name, labels.get("le")): value for name, labels, value in histogram.samples()}
+        assert samples[("test_seconds_bucket", "0.1")] == 1
+        assert samples[("test_seconds_bucket", "1")] == 2
+        assert samples[("test_seconds_bucket", "+Inf")] == 3
+        assert samples[("test_seconds_sum", None)] == pytest.approx(5.55)
+        assert samples[("test_seconds_count", None)] == 3
+
+    def test_render(self, registry):
+        registry.counter("test_total", "Test counter").inc(2, endpoint="getPosts", status=200)
+        gauge = registry.gauge("test_depth", "Test gauge")
+        gauge.track(lambda: 7, queue="details")
+
+        assert registry.render() == (
+            "# HELP test_total Test counter\n"
+            "# TYPE test_total counter\n"
+            'test_total{endpoint="getPosts",status="200"} 2\n'
+            "# HELP test_depth Test gauge\n"
+            "# TYPE test_depth gauge\n"
+            'test_depth{queue="details"} 7\n'
+        )
+        gauge.untrack(queue="details")
+        assert 'queue="details"' not in registry.render()
+
+    def test_total_names_are_counters(self):
+        # Prometheus keeps the _total suffix for counters
+        assert all(metric.type == "counter" for metric in metrics.get_metrics()._metrics() if metric.name.endswith("_total"))
+
+    def test_record_retry(self):
+        attempts = []
+
+        @retry(wait=wait_none(), stop=stop_after_attempt(3), before_sleep=metrics.record_retry)
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ValueError
+            return True
+
+        before = metrics.RETRIES.value(call="flaky")
+        assert flaky()
+        assert metrics.RETRIES.value(call="flaky") - before == 2
+
+    def test_record_response(self):
+        request = httpx.Request("GET", "https://public.api.bsky.app/xrpc/app.bsky.feed.getPosts")
+        request.extensions["mdfb_sent_at"] = 0
+        before = metrics.REQUESTS.value(endpoint="app.bsky.feed.getPosts", status=429)
+        rate_limited = metrics.RATE_LIMITED.value(host="public.api.bsky.app")
+
+        clients._record_response(httpx.Response(429, request=request))
+
+        assert metrics.REQUESTS.value(endpoint="app.bsky.feed.getPosts", status=429) - before == 1
+        assert metrics.RATE_LIMITED.value(host="public.api.bsky.app") - rate_limited == 1
+
+    def test_metrics_server(self):
+        server = metrics.start_metrics_server(0)
+        try:
+            port = server.server_address[1]
+            res = httpx.get(f"http://127.0.0.1:{port}/metrics")
+            missing = httpx.get(f"http://127.0.0.1:{port}/")
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert res.status_code == 200
+        assert "# TYPE mdfb_requests_total counter" in res.text
+        assert "mdfb_process_resident_memory_bytes " in res.text
+        assert "# TYPE mdfb_process_cpu_seconds_total counter" in res.text
+        assert missing.status_code == 404
+
+    def test_metrics_snapshots(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "metrics.jsonl")
+            snapshots = metrics.MetricsSnapshots(path, interval=60).start()
+            snapshots.close()
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+
+        assert len(lines) == 1
+        assert "mdfb_posts_total" in lines[0]["metrics"]
@@ -0,0 +1,137 @@
+import logging
+import threading
+from concurrent.futures import Future
+import pytest
+from unittest.mock import patch
+from mdfb.core import pipeline
+
+def _identifier(i: int, feed_type: str = "like") -> dict:
+    return {
+        "user_did": "did:plc:user",
+        "user_post_uri": [f"at://did:plc:user/app.bsky.feed.{feed_type}/{feed_type}{i}"],
+        "feed_type": [feed_type],
+        "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/post{i}"
+    }
+
+def _details(batch: list[dict], cache: bool = False, max_age: float = None) -> list[dict]:
+    return [{**post, "media_type": ["image"] if int(post["poster_post_uri"][-1]) % 2 else ["text"]} for post in batch]
+
+class TestPipeline:
+    @pytest.fixture(autouse=True)
+    def fast_batching(self):
+        with patch.object(pipeline, "PIPELINE_BATCH_WAIT", 0.01):
+            yield
+
+    @pytest.fixture
+    def mock_stages(self):
+        downloaded = []
+        lock = threading.Lock()
+
+        def mock_download_blobs(posts, directory, progress_bar, *args, **kwargs):
+            with lock:
+                downloaded.extend(posts)
+
+        with patch.object(pipeline, "fetch_post_details", side_effect=_details) as mock_fetch, \
+            patch.object(pipeline, "download_blobs", side_effect=mock_download_blobs), \
+            patch.object(pipeline, "write_posts") as mock_write_posts:
+            yield {
+                "downloaded": downloaded,
+                "fetch": mock_fetch,
+                "write_posts": mock_write_posts
+            }
+
+    def test_run_pipeline_downloads_every_post(self, mock_stages):
+        pages = [[_identifier(i) for i in range(j, j + 10)] for j in range(0, 60, 10)]
+        result = pipeline.run_pipeline([pages], "directory", hydrate_threads=2, download_threads=3)
+
+        assert result == 60
+        assert sorted(post["poster_post_uri"] for post in mock_stages["downloaded"]) == sorted(post["poster_post_uri"] for page in pages for post in page)
+        assert all(len(call.args[0]) <= pipeline.POST_DETAILS_BATCH_SIZE for call in mock_stages["fetch"].call_args_list)
+
+    def test_run_pipeline_media_types(self, mock_stages):
+        pipeline.run_pipeline([[[_identifier(i) for i in range(10)]]], "directory", media_types=["image"])
+
+        assert len(mock_stages["downloaded"]) == 5
+        assert all("image" in post["media_type"] for post in mock_stages["downloaded"])
+
+    def test_run_pipeline_duplicates_recorded_not_downloaded(self, mock_stages):
+        likes = [[_identifier(i, "like") for i in range(3)]]
+        reposts = [[_identifier(i, "repost") for i in range(2)]]
+        result = pipeline.run_pipeline([likes, reposts], "directory")
+
+        assert result == 5
+        assert len(mock_stages["downloaded"]) == 3
+        # each duplicate is either merged into the downloaded post, or recorded once the post was already downloaded
+        recorded = [row for post in mock_stages["downloaded"] for row in pipeline._identifier_rows(post)]
+        recorded += [row for call in mock_stages["write_posts"].call_args_list for row in call.args[0]]
+        assert sorted(recorded) == sorted(row for page in likes + reposts for post in page for row in pipeline._identifier_rows(post))
+
+    def test_run_pipeline_duplicates_merged_before_download(self, mock_stages):
+        listed = threading.Event()
+
+        def reposts():
+            yield [_identifier(0, "repost")]
+            listed.set()
+
+        def slow_details(batch, cache=False, max_age=None):
+            # the repost is listed while the like is still being hydrated
+            listed.wait(5)
+            return _details(batch)
+
+        mock_stages["fetch"].side_effect = slow_details
+        pipeline.run_pipeline([[[_identifier(0, "like")]], reposts()], "directory")
+
+        [post] = mock_stages["downloaded"]
+        assert post["feed_type"] == ["like", "repost"]
+        assert post["user_post_uri"] == _identifier(0, "like")["user_post_uri"] + _identifier(0, "repost")["user_post_uri"]
+        mock_stages["write_posts"].assert_not_called()
+
+    def test_run_pipeline_duplicates_of_failed_post_not_recorded(self, mock_stages):
+        likes = [[_identifier(0, "like")]]
+        reposts = [[_identifier(0, "repost")]]
+        with patch.object(pipeline, "download_blobs", side_effect=ValueError("broken")):
+            pipeline.run_pipeline([likes, reposts], "directory")
+
+        mock_stages["write_posts"].assert_not_called()
+
+    def test_run_pipeline_overlaps_stages(self, mock_stages):
+        overlapped = []
+
+        def slow_source():
+            yield [_identifier(i) for i in range(5)]
+            # the first page must reach the download stage while listing is still running
+            for _ in range(500):
+                if mock_stages["downloaded"]:
+                    break
+                threading.Event().wait(0.01)
+            overlapped.append(bool(mock_stages["downloaded"]))
+            yield [_identifier(i) for i in range(5, 10)]
+
+        pipeline.run_pipeline([slow_source()], "directory")
+
+        assert overlapped == [True]
+        assert len(mock_stages["downloaded"]) == 10
+
+    def test_run_pipeline_no_posts(self, mock_stages):
+        result = pipeline.run_pipeline([iter([])], "directory")
+
+        assert result == 0
+        assert not mock_stages["downloaded"]
+        mock_stages["write_posts"].assert_not_called()
+
+    def test_run_pipeline_account_progress(self, mock_stages):
+        account_progress = {}
+        pages = [[{**_identifier(i), "user_did": f"did:plc:user{i % 3}"} for i in range(9)]]
+        pipeline.run_pipeline([pages], "directory", account_progress=account_progress)
+
+        assert account_progress == {"did:plc:user0": 3, "did:plc:user1": 3, "did:plc:user2": 3}
+
+    def test_wait_stage_error_above_progress_bar(self, caplog, capsys):
+        failed = Future()
+        failed.set_exception(ValueError("broken"))
+        with patch.object(pipeline.tqdm, "write") as mock_write:
+            pipeline._wait_stage([failed], logging.getLogger(pipeline.__name__))
+
+        mock_write.assert_called_once_with("Error in thread: broken")
+        assert capsys.readouterr().out == ""
+        assert "Error in thread: broken" in caplog.text
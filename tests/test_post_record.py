@@ -0,0 +1,94 @@
+import sys
+import tempfile
+import zlib
+from unittest.mock import patch
+import pytest
+from mdfb.core import download_blobs, post_record
+from mdfb.utils.serialization import dumps
+
+def _post_details(index: int) -> dict:
+    return {
+        "rkey": f"rkey{index}",
+        "text": f"post {index}",
+        "user_did": "did:plc:user",
+        "user_post_uri": [f"at://did:plc:user/app.bsky.feed.like/like{index}"],
+        "poster_post_uri": f"at://did:plc:author/app.bsky.feed.post/rkey{index}",
+        "feed_type": ["like"],
+        "did": "did:plc:author",
+        "handle": "author.bsky.social",
+        "display_name": None,
+        "media_type": ["image"],
+        "images_cid": [f"cid{index}"],
+        "mime_type": "image/jpeg"
+    }
+
+def _response(index: int) -> bytes:
+    return zlib.compress(dumps({"uri": f"at://did:plc:author/app.bsky.feed.post/rkey{index}", "record": {"text": f"post {index}"}}))
+
+class TestPostRecord:
+    @pytest.fixture
+    def spill(self):
+        with tempfile.TemporaryDirectory() as temp_dir, post_record.spill_responses(temp_dir) as spill:
+            yield spill
+
+    def test_post_record(self, spill):
+        record = post_record.PostRecord(_post_details(1), _response(1), spill)
+
+        assert record["rkey"] == "rkey1"
+        assert record["images_cid"] == ("cid1",)
+        assert record["display_name"] is None
+        assert "video_cid" not in record
+        assert record.get("video_cid") is None
+        with pytest.raises(KeyError):
+            record["video_cid"]
+        assert not hasattr(record, "__dict__")
+
+    def test_post_record_response(self, spill):
+        records = [post_record.PostRecord(_post_details(i), _response(i), spill) for i in range(3)]
+
+        assert records[2]["response"] == {
+            "user_did": "did:plc:user",
+            "user_post_uri": ["at://did:plc:user/app.bsky.feed.like/like2"],
+            "feed_type": ["like"],
+            "poster_post_uri": "at://did:plc:author/app.bsky.feed.post/rkey2",
+            "uri": "at://did:plc:author/app.bsky.feed.post/rkey2",
+            "record": {"text": "post 2"}
+        }
+        assert list(records[0]["response"]) == ["user_did", "user_post_uri", "feed_type", "poster_post_uri", "uri", "record"]
+        assert records[0].keys()[-1] == "response"
+
+    def test_post_record_interned(self, spill):
+        # built from strings that are equal but not the same object, as when parsed from separate responses
+        first = post_record.PostRecord({key: value[:] if isinstance(value, str) else value for key, value in _post_details(1).items()}, _response(1), spill)
+        second = post_record.PostRecord({**_post_details(2), "did": "".join(["did:plc:", "author"])}, _response(2), spill)
+
+        assert first["did"] is second["did"] is sys.intern("did:plc:author")
+        assert first["feed_type"][0] is second["feed_type"][0]
+
+    def test_post_record_merge_identifiers(self, spill):
+        record = post_record.PostRecord(_post_details(1), _response(1), spill)
+
+        record["feed_type"] = [*record["feed_type"], "repost"]
+        record["user_post_uri"] = [*record["user_post_uri"], "at://did:plc:user/app.bsky.feed.repost/repost1"]
+
+        assert record["feed_type"] == ("like", "repost")
+        assert record["response"]["user_post_uri"] == ["at://did:plc:user/app.bsky.feed.like/like1", "at://did:plc:user/app.bsky.feed.repost/repost1"]
+        with pytest.raises(KeyError):
+            record["rkey"] = "rkey2"
+
+    def test_post_record_blob_sizes(self, spill):
+        response = {"record": {"embed": {"images": [{"image": {"ref": {"link": "cid1"}, "size": 1000}}]}}}
+        record = post_record.PostRecord({**_post_details(1), "response": response}, _response(1), spill)
+
+        with patch.object(spill, "read") as mock_read:
+            assert download_blobs._get_blob_sizes(record) == {"cid1": 1000}
+        mock_read.assert_not_called()
+
+    def test_spill_responses(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with post_record.spill_responses(temp_dir) as spill:
+                assert post_record.get_spill() is spill
+                offset = spill.write(b"response")
+                assert spill.read(offset, 8) == b"response"
+            assert post_record.get_spill() is None
+            assert spill.file.closed
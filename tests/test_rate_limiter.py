@@ -0,0 +1,73 @@
+import time
+import asyncio
+import httpx
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from mdfb.utils import clients
+from mdfb.utils.constants import RATE_LIMIT_BACKOFF
+from mdfb.utils.rate_limiter import RateLimiter, TokenBucket
+
+class TestTokenBucket:
+    def test_reserve_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert bucket.reserve() == pytest.approx(1, abs=0.05)
+        assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+    def test_observe_remaining(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.observe(200, {"ratelimit-limit": "3000", "ratelimit-remaining": "600", "ratelimit-reset": str(time.time() + 20)})
+        assert bucket.rate == pytest.approx(30, rel=0.1)
+
+    def test_observe_remaining_exhausted(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.observe(200, {"ratelimit-remaining": "0", "ratelimit-reset": str(time.time() + 30)})
+        assert bucket.reserve() == pytest.approx(30, abs=1)
+
+    def test_observe_429_retry_after(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.observe(429, {"retry-after": "12"})
+        assert bucket.rate == 5
+        assert bucket.reserve() == pytest.approx(12, abs=0.1)
+
+    def test_observe_429_no_headers(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.observe(429, {})
+        assert bucket.reserve() == pytest.approx(RATE_LIMIT_BACKOFF, abs=0.1)
+
+    def test_observe_no_headers(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.observe(200, {})
+        assert bucket.rate == 10
+        assert bucket.reserve() == 0.0
+
+class TestRateLimiter:
+    def test_acquire_per_host(self):
+        limiter = RateLimiter(rate=1, burst=1)
+        assert limiter.acquire("a.example.com") == 0.0
+        assert limiter.acquire("b.example.com") == 0.0
+        assert limiter.bucket("a.example.com") is not limiter.bucket("b.example.com")
+
+    def test_acquire_shared_between_threads(self):
+        limiter = RateLimiter(rate=50, burst=5)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: limiter.acquire("example.com"), range(20)))
+        # 5 requests are sent in a burst and the other 15 are spread over 15 / 50 seconds
+        assert time.perf_counter() - start >= 0.25
+
+    def test_acquire_async(self):
+        limiter = RateLimiter(rate=1, burst=1)
+        async def run():
+            await limiter.acquire_async("example.com")
+            return limiter.bucket("example.com").reserve()
+        assert asyncio.run(run()) > 0
+
+    def test_http_client_hooks(self):
+        limiter = RateLimiter(rate=10, burst=10)
+        transport = httpx.MockTransport(lambda request: httpx.Response(429, headers={"retry-after": "30"}))
+        with patch.object(clients, "get_rate_limiter", return_value=limiter):
+            http_client = httpx.Client(transport=transport, event_hooks={"request": [clients._limit_request], "response": [clients._observe_response]})
+            http_client.get("https://example.com/xrpc/app.bsky.feed.getPosts")
+        assert limiter.bucket("example.com").reserve() == pytest.approx(30, abs=0.5)
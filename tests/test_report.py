@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import tempfile
+import pytest
+from mdfb.utils import report
+
+class TestReport:
+    @pytest.fixture
+    def run_report(self):
+        yield report.start_report()
+        report.start_report()
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        assert report._percentile(values, 50) == 50
+        assert report._percentile(values, 95) == 95
+        assert report._percentile(values, 99) == 99
+        assert report._percentile([3.0], 99) == 3
+
+    def test_slowest_items(self):
+        run_report = report.RunReport(slowest=3)
+        for i in range(10):
+            run_report.record_call("com.atproto.sync.getBlob", i / 10, True, f"cid{i}")
+
+        summary = run_report.summary()["calls"]["com.atproto.sync.getBlob"]
+        assert summary["attempts"] == 10
+        assert summary["max"] == 0.9
+        assert [slow["item"] for slow in summary["slowest"]] == ["cid9", "cid8", "cid7"]
+
+    def test_retries_and_failures(self):
+        run_report = report.RunReport()
+        for ok in [False, True, False, False, False]:
+            run_report.record_call("app.bsky.feed.getPosts", 0.1, ok)
+        run_report.record_failure("app.bsky.feed.getPosts")
+
+        summary = run_report.summary()["calls"]["app.bsky.feed.getPosts"]
+        assert summary["retries"] == 3
+        assert summary["failures"] == 1
+
+    def test_timed(self, run_report):
+        @report.timed("com.atproto.repo.listRecords", lambda did: did)
+        def list_records(did):
+            if did == "did:plc:bad":
+                raise ValueError()
+            return did
+
+        @report.timed("com.atproto.sync.getBlob")
+        async def get_blob():
+            return b"blob"
+
+        assert list_records("did:plc:good") == "did:plc:good"
+        with pytest.raises(ValueError):
+            list_records("did:plc:bad")
+        assert asyncio.run(get_blob()) == b"blob"
+
+        calls = run_report.summary()["calls"]
+        assert calls["com.atproto.repo.listRecords"]["attempts"] == 2
+        assert calls["com.atproto.repo.listRecords"]["retries"] == 1
+        assert {slow["item"] for slow in calls["com.atproto.repo.listRecords"]["slowest"]} == {"did:plc:good", "did:plc:bad"}
+        assert calls["com.atproto.sync.getBlob"]["attempts"] == 1
+
+    def test_write(self, run_report):
+        with run_report.phase("download"):
+            run_report.add_bytes("image", 100)
+        run_report.add_bytes("image", 50)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = run_report.write(temp_dir)
+            assert os.path.basename(path).startswith(report.REPORT_PREFIX)
+            with open(path) as file:
+                written = json.load(file)
+        assert list(written["phases"]) == ["download"]
+        assert written["bytes_by_media_type"] == {"image": 150}
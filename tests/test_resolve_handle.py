@@ -1,17 +1,133 @@
+import os
+import sqlite3
+import time
 import pytest
-from mdfb.core.resolve_handle import resolve_handle
+from unittest.mock import patch
+from mdfb import mdfb
+from mdfb.core import resolve_handle
+from mdfb.utils import database
+from mdfb.utils.logging import stop_logging
 from atproto_identity.exceptions import DidNotFoundError
 
+class TestResolveHandle:
+    @pytest.fixture(autouse=True)
+    def temp_db(self, tmp_path):
+        database.create_db(str(tmp_path))
+        with patch.object(database.platformdirs, "user_data_path", return_value=tmp_path):
+            resolve_handle.clear_handle_cache()
+            yield tmp_path
+            database.close_db()
+        resolve_handle.clear_handle_cache()
 
-def test_resolve_handle(mocker):
-    mocked_did = "did:plc:123abc"
-    mocked_handle = "example_handle"
-    mocker.patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve", return_value=mocked_did)
-    result = resolve_handle(mocked_handle)
-    assert result == mocked_did
+    @pytest.fixture
+    def mock_ensure_resolve(self):
+        with patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve", side_effect=lambda handle: f"did:plc:{handle.split('.')[0].lower()}") as mock_resolve:
+            yield mock_resolve
 
-def test_resolve_handle_not_found(mocker):
-    mocked_response = mocker.patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve")
-    mocked_response.side_effect = DidNotFoundError
-    with pytest.raises(DidNotFoundError):
-        resolve_handle("")
\ No newline at end of file
+    def test_resolve_handle(self, mocker):
+        mocked_did = "did:plc:123abc"
+        mocked_handle = "example_handle"
+        mocker.patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve", return_value=mocked_did)
+        result = resolve_handle.resolve_handle(mocked_handle)
+        assert result == mocked_did
+
+    def test_resolve_handle_not_found(self, mocker):
+        mocked_response = mocker.patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve")
+        mocked_response.side_effect = DidNotFoundError
+        with pytest.raises(DidNotFoundError):
+            resolve_handle.resolve_handle("")
+
+    def test_resolve_handle_memoised(self, mock_ensure_resolve):
+        resolve_handle.resolve_handle("alice.bsky.social")
+        assert resolve_handle.resolve_handle("Alice.bsky.social") == "did:plc:alice"
+        assert mock_ensure_resolve.call_count == 1
+
+    def test_resolve_handle_persisted(self, mock_ensure_resolve, temp_db):
+        resolve_handle.resolve_handle("alice.bsky.social")
+        database.flush_writes()
+        resolve_handle.clear_handle_cache()
+        assert resolve_handle.resolve_handle("alice.bsky.social") == "did:plc:alice"
+        assert mock_ensure_resolve.call_count == 1
+
+        con = sqlite3.connect(os.path.join(temp_db, "mdfb.db"))
+        assert database.get_handle_did(con.cursor(), "alice.bsky.social")[0] == "did:plc:alice"
+
+    def test_resolve_handle_expired(self, mock_ensure_resolve):
+        resolve_handle.resolve_handle("alice.bsky.social")
+        resolve_handle.resolve_handle("alice.bsky.social", ttl=0)
+        assert mock_ensure_resolve.call_count == 2
+
+    def test_resolve_handles(self, mock_ensure_resolve):
+        def ensure_resolve(handle):
+            if handle == "missing.bsky.social":
+                raise DidNotFoundError
+            return f"did:plc:{handle.split('.')[0]}"
+        mock_ensure_resolve.side_effect = ensure_resolve
+
+        dids = resolve_handle.resolve_handles(["alice.bsky.social", "bob.bsky.social", "missing.bsky.social", "alice.bsky.social"])
+
+        assert dids == {"alice.bsky.social": "did:plc:alice", "bob.bsky.social": "did:plc:bob"}
+        assert mock_ensure_resolve.call_count == 3
+
+    def test_resolve_handles_concurrently(self, mock_ensure_resolve):
+        def ensure_resolve(handle):
+            time.sleep(0.1)
+            return f"did:plc:{handle}"
+        mock_ensure_resolve.side_effect = ensure_resolve
+        handles = [f"user{i}" for i in range(8)]
+
+        start = time.perf_counter()
+        dids = resolve_handle.resolve_handles(handles, num_threads=8)
+        elapsed = time.perf_counter() - start
+
+        assert len(dids) == 8
+        assert elapsed < 0.5
+
+class TestResolveHandleDownload:
+    @pytest.fixture
+    def data_path(self, tmp_path):
+        # nothing in the data directory is patched away, so the database is created as on a fresh install
+        data_path = tmp_path / "data"
+
+        def user_data_dir(*args, **kwargs):
+            data_path.mkdir(exist_ok=True)
+            return str(data_path)
+
+        resolve_handle.clear_handle_cache()
+        with patch("platformdirs.user_data_path", return_value=data_path), \
+            patch("platformdirs.user_data_dir", side_effect=user_data_dir), \
+            patch("atproto_identity.handle.resolver.HandleResolver.ensure_resolve", return_value="did:plc:alice"):
+            yield data_path
+            database.close_db()
+            stop_logging()
+        resolve_handle.clear_handle_cache()
+
+    @pytest.fixture
+    def mock_handle_sequential(self):
+        with patch.object(mdfb, "handle_sequential") as mock_handle_sequential:
+            yield mock_handle_sequential
+
+    def _download(self, tmp_path):
+        parser = mdfb.make_parser()
+        args = parser.parse_args(["download", "--handle", "alice.bsky.social", "--like", "--limit", "1", str(tmp_path)])
+        mdfb.handle_download(args, parser)
+
+    def test_handle_download_fresh_install(self, data_path, mock_handle_sequential, tmp_path):
+        self._download(tmp_path)
+
+        assert mock_handle_sequential.call_args.args[1] == "did:plc:alice"
+        con = sqlite3.connect(os.path.join(data_path, "mdfb.db"))
+        assert database.get_handle_did(con.cursor(), "alice.bsky.social")[0] == "did:plc:alice"
+        con.close()
+
+    def test_handle_download_old_database(self, data_path, mock_handle_sequential, tmp_path):
+        # databases from before the handle cache have no handle_did table
+        data_path.mkdir()
+        con = sqlite3.connect(os.path.join(data_path, "mdfb.db"))
+        con.execute(database.MIGRATIONS[0][0])
+        con.commit()
+        con.close()
+
+        self._download(tmp_path)
+
+        assert mock_handle_sequential.call_args.args[1] == "did:plc:alice"
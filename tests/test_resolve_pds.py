@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import pytest
+from unittest.mock import Mock, patch
+from atproto_identity.exceptions import DidNotFoundError
+from mdfb.core import resolve_pds
+from mdfb.utils import database
+
+class TestResolvePds:
+    @pytest.fixture(autouse=True)
+    def temp_db(self, tmp_path):
+        database.create_db(str(tmp_path))
+        with patch.object(database.platformdirs, "user_data_path", return_value=tmp_path):
+            resolve_pds.clear_pds_cache()
+            yield tmp_path
+            database.close_db()
+        resolve_pds.clear_pds_cache()
+
+    @pytest.fixture
+    def mock_did_resolver(self):
+        did_doc = Mock()
+        did_doc.get_pds_endpoint.return_value = "https://pds.example.com"
+        with patch("atproto_identity.did.resolver.DidResolver.resolve", return_value=did_doc) as mock_resolve:
+            yield mock_resolve
+
+    def test_resolve_pds(self, mock_did_resolver):
+        assert resolve_pds.resolve_pds("did:plc:1234") == "https://pds.example.com"
+
+    def test_resolve_pds_memoised(self, mock_did_resolver):
+        resolve_pds.resolve_pds("did:plc:1234")
+        resolve_pds.resolve_pds("did:plc:1234")
+        assert mock_did_resolver.call_count == 1
+
+    def test_resolve_pds_persisted(self, mock_did_resolver, temp_db):
+        resolve_pds.resolve_pds("did:plc:1234")
+        database.flush_writes()
+        resolve_pds.clear_pds_cache()
+        assert resolve_pds.resolve_pds("did:plc:1234") == "https://pds.example.com"
+        assert mock_did_resolver.call_count == 1
+
+        con = sqlite3.connect(os.path.join(temp_db, "mdfb.db"))
+        assert database.get_pds(con.cursor(), "did:plc:1234")[0] == "https://pds.example.com"
+
+    def test_resolve_pds_expired(self, mock_did_resolver):
+        resolve_pds.resolve_pds("did:plc:1234")
+        resolve_pds.resolve_pds("did:plc:1234", ttl=0)
+        assert mock_did_resolver.call_count == 2
+
+    def test_resolve_pds_not_found(self):
+        with patch("atproto_identity.did.resolver.DidResolver.resolve", return_value=None):
+            with pytest.raises(DidNotFoundError):
+                resolve_pds.resolve_pds("did:plc:1234")
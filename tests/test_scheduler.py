@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mdfb.utils.scheduler import HostScheduler, host_of
+
+class TestHostScheduler:
+    @staticmethod
+    def max_in_flight(scheduler: HostScheduler, host: str, num_requests: int) -> int:
+        lock = threading.Lock()
+        state = {"in_flight": 0, "max": 0}
+
+        def request(_):
+            with scheduler.slot(host):
+                with lock:
+                    state["in_flight"] += 1
+                    state["max"] = max(state["max"], state["in_flight"])
+                time.sleep(0.01)
+                with lock:
+                    state["in_flight"] -= 1
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(request, range(num_requests)))
+        return state["max"]
+
+    def test_slot_bounds_host(self):
+        scheduler = HostScheduler(default_limit=3, limits={})
+        assert self.max_in_flight(scheduler, "cdn.example.com", 30) <= 3
+
+    def test_slot_host_specific_limit(self):
+        scheduler = HostScheduler(default_limit=8, limits={"public.api.bsky.app": 2})
+        assert self.max_in_flight(scheduler, "public.api.bsky.app", 20) <= 2
+
+    def test_slot_hosts_independent(self):
+        scheduler = HostScheduler(default_limit=1, limits={})
+        with scheduler.slot("pds.example.com"):
+            acquired = threading.Event()
+
+            def other_host():
+                with scheduler.slot("public.api.bsky.app"):
+                    acquired.set()
+            thread = threading.Thread(target=other_host)
+            thread.start()
+            thread.join(timeout=1)
+        assert acquired.is_set()
+
+    def test_set_limit(self):
+        scheduler = HostScheduler(default_limit=1, limits={})
+        scheduler.set_limit("pds.example.com", 4)
+        assert self.max_in_flight(scheduler, "pds.example.com", 20) > 1
+
+    def test_host_of(self):
+        assert host_of("https://public.api.bsky.app/") == "public.api.bsky.app"
@@ -0,0 +1,53 @@
+import json
+from unittest.mock import patch
+import pytest
+from atproto_client.models.app.bsky.feed.get_posts import Response
+from atproto_client.models.utils import get_or_create
+from mdfb.utils import serialization
+
+class TestSerialization:
+    @pytest.fixture(params=["orjson", "json"])
+    def backend(self, request):
+        if request.param == "orjson":
+            pytest.importorskip("orjson")
+            yield
+        else:
+            with patch.object(serialization, "orjson", None):
+                yield
+
+    @pytest.fixture
+    def get_posts_response(self):
+        raw = {"posts": [{
+            "uri": "at://did:plc:author/app.bsky.feed.post/3lqx7wzy7c227",
+            "cid": "bafyreia",
+            "author": {"did": "did:plc:author", "handle": "author.bsky.social", "displayName": "Åuthor", "associated": {"chat": {"allowIncoming": "none"}}, "labels": []},
+            "record": {
+                "$type": "app.bsky.feed.post",
+                "text": "héllo 😀",
+                "createdAt": "2024-01-01T00:00:00Z",
+                "embed": {"$type": "app.bsky.embed.images", "images": [{"alt": "", "image": {"$type": "blob", "ref": {"$link": "bafkreiabc"}, "mimeType": "image/jpeg", "size": 10}}]},
+                "facets": [{"index": {"byteStart": 0, "byteEnd": 2}, "features": [{"$type": "app.bsky.richtext.facet#link", "uri": "https://example.com"}]}]
+            },
+            "replyCount": 0,
+            "repostCount": 0,
+            "likeCount": 1,
+            "indexedAt": "2024-01-01T00:00:00Z",
+            "labels": []
+        }]}
+        return get_or_create(raw, Response, strict=False)
+
+    def test_dumps_loads(self, backend):
+        post = {"text": "héllo 😀", "images_cid": ["cid1", "cid2"], "display_name": None, "like_count": 1}
+        data = serialization.dumps(post)
+
+        assert isinstance(data, bytes)
+        assert serialization.loads(data) == post
+        assert json.loads(data) == post
+
+    def test_model_dump_matches_json_round_trip(self, get_posts_response):
+        # the dict dumped straight from the model is the one previously parsed back from model_dump_json()
+        records = get_posts_response.model_dump(mode="json")
+
+        assert records == json.loads(get_posts_response.model_dump_json())
+        assert serialization.dumps_post(records["posts"][0]) == json.dumps(json.loads(get_posts_response.model_dump_json())["posts"][0], indent=4)
+        assert records["posts"][0]["record"]["embed"]["images"][0]["image"]["ref"]["link"] == "bafkreiabc"
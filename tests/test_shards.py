@@ -0,0 +1,117 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import pytest
+import zstandard
+from unittest.mock import patch
+from mdfb.core import shards
+
+def _post(index: int) -> dict:
+    uri = f"at://did:plc:author/app.bsky.feed.post/rkey{index}"
+    return {
+        "rkey": f"rkey{index}",
+        "poster_post_uri": uri,
+        "response": {"uri": uri, "record": {"text": f"héllo {index}"}, "like_count": index}
+    }
+
+class TestShards:
+    @pytest.fixture
+    def temp_dir(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield temp_dir
+
+    @pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+    def test_write_and_read(self, temp_dir, compression):
+        posts = [_post(i) for i in range(10)]
+        with shards.ShardWriter(temp_dir, compression) as writer:
+            for post in posts:
+                writer.write(post)
+
+        assert set(os.listdir(temp_dir)) == {shards.INDEX_FILENAME, f"posts-00001{shards.EXTENSIONS[compression]}"}
+        assert list(shards.iter_shard_posts(temp_dir)) == [post["response"] for post in posts]
+        assert shards.read_post(temp_dir, "rkey7") == posts[7]["response"]
+        assert shards.read_post(temp_dir, "missing") is None
+
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    def test_compressed_shard_is_a_valid_file(self, temp_dir, compression):
+        posts = [_post(i) for i in range(3)]
+        with shards.ShardWriter(temp_dir, compression) as writer:
+            for post in posts:
+                writer.write(post)
+
+        path = os.path.join(temp_dir, f"posts-00001{shards.EXTENSIONS[compression]}")
+        if compression == "gzip":
+            with gzip.open(path, "rt") as file:
+                lines = file.read().splitlines()
+        else:
+            with open(path, "rb") as file:
+                reader = zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+                lines = io.TextIOWrapper(reader, encoding="utf-8").read().splitlines()
+        assert [json.loads(line) for line in lines] == [post["response"] for post in posts]
+
+    def test_rotate(self, temp_dir):
+        posts = [_post(i) for i in range(10)]
+        with shards.ShardWriter(temp_dir, shard_size=200) as writer:
+            for post in posts:
+                writer.write(post)
+
+        shard_names = sorted(name for name in os.listdir(temp_dir) if name != shards.INDEX_FILENAME)
+        assert len(shard_names) > 1
+        assert list(shards.iter_shard_posts(temp_dir)) == [post["response"] for post in posts]
+        assert all(shards.read_post(temp_dir, post["rkey"]) == post["response"] for post in posts)
+
+    def test_later_run_starts_new_shard(self, temp_dir):
+        with shards.ShardWriter(temp_dir) as writer:
+            writer.write(_post(1))
+        updated = _post(1)
+        updated["response"]["like_count"] = 100
+        with shards.ShardWriter(temp_dir, "gzip") as writer:
+            writer.write(updated)
+            writer.write(_post(2))
+
+        assert "posts-00002.jsonl.gz" in os.listdir(temp_dir)
+        assert shards.read_post(temp_dir, "rkey1")["like_count"] == 100
+        assert len(list(shards.iter_shard_posts(temp_dir))) == 3
+
+    def test_write_many_threads(self, temp_dir):
+        with shards.ShardWriter(temp_dir, "zstd", shard_size=4096) as writer:
+            threads = [threading.Thread(target=lambda start: [writer.write(_post(i)) for i in range(start, start + 100)], args=(start,)) for start in range(0, 800, 100)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        responses = list(shards.iter_shard_posts(temp_dir))
+        assert sorted(response["like_count"] for response in responses) == list(range(800))
+        assert all(shards.read_post(temp_dir, f"rkey{i}")["like_count"] == i for i in range(0, 800, 37))
+
+    def test_shard_reader_loads_index_once(self, temp_dir):
+        posts = [_post(i) for i in range(200)]
+        with shards.ShardWriter(temp_dir) as writer:
+            for post in posts:
+                writer.write(post)
+
+        reader = shards.ShardReader(temp_dir)
+        with patch.object(shards, "loads", wraps=shards.loads) as mock_loads:
+            assert all(reader.read(post["rkey"]) == post["response"] for post in posts)
+        # each index entry once, then each post
+        assert mock_loads.call_count == 2 * len(posts)
+        assert reader.read(posts[3]["poster_post_uri"]) == posts[3]["response"]
+
+    def test_shard_reader_refresh(self, temp_dir):
+        reader = shards.ShardReader(temp_dir)
+        assert reader.read("rkey1") is None
+        with shards.ShardWriter(temp_dir) as writer:
+            writer.write(_post(1))
+            writer.flush()
+            assert reader.read("rkey1") == _post(1)["response"]
+            writer.write(_post(2))
+        assert reader.read("rkey2") == _post(2)["response"]
+
+    def test_open_shards_files(self, temp_dir):
+        with shards.open_shards(temp_dir, "files") as writer:
+            assert writer is None
+        assert os.listdir(temp_dir) == []
@@ -127,6 +127,46 @@ class TestValidateThreads:
         with pytest.raises(ValueError):
             validation.validate_threads(mock_threads)
 
+class TestValidateStageThreads:
+    def test_validate_stage_threads_defaults(self):
+        args = argparse.Namespace(threads=None, list_threads=None, hydrate_threads=None, download_threads=None)
+        result = validation.validate_stage_threads(args)
+        assert result == {
+            "list": validation.DEFAULT_LIST_THREADS,
+            "hydrate": validation.DEFAULT_HYDRATE_THREADS,
+            "download": validation.DEFAULT_DOWNLOAD_THREADS
+        }
+
+    def test_validate_stage_threads_override(self):
+        args = argparse.Namespace(threads="2", list_threads=None, hydrate_threads=None, download_threads="32")
+        result = validation.validate_stage_threads(args)
+        assert result == {"list": 2, "hydrate": 2, "download": 32}
+
+    def test_validate_stage_threads_invalid(self):
+        args = argparse.Namespace(threads=None, list_threads=None, hydrate_threads="0", download_threads=None)
+        with pytest.raises(ValueError):
+            validation.validate_stage_threads(args)
+
+class TestValidateConcurrency:
+    def test_validate_concurrency(self):
+        result = validation.validate_concurrency("200")
+        assert result == 200
+
+    def test_validate_concurrency_invalid(self):
+        with pytest.raises(ValueError):
+            validation.validate_concurrency("a")
+
+    def test_validate_concurrency_too_big(self, monkeypatch):
+        max_concurrency = 50
+        monkeypatch.setattr("mdfb.utils.validation.MAX_CONCURRENCY", max_concurrency)
+
+        result = validation.validate_concurrency("100")
+        assert result == max_concurrency
+
+    def test_validate_concurrency_too_little(self):
+        with pytest.raises(ValueError):
+            validation.validate_concurrency("0")
+
 class TestValidateFormat:
     @pytest.mark.parametrize("input_val", [
         "{RKEY}_{DID}",
@@ -209,3 +249,52 @@ class TestValidateDownload:
         
         validation._validate_post_types(args, mock_parser)
         mock_parser.error.assert_called_once()
+
+class TestValidateBlobStore:
+    def test_validate_blob_store_not_used(self):
+        assert validation.validate_blob_store(None, "directory") is None
+
+    def test_validate_blob_store_download_directory(self):
+        assert validation.validate_blob_store(True, "directory") == "directory"
+
+    def test_validate_blob_store_directory(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            assert validation.validate_blob_store(temp_dir + "/", "directory") == temp_dir
+
+    def test_validate_blob_store_bad_path(self):
+        with pytest.raises(ValueError):
+            validation.validate_blob_store("bad_path", "directory")
+
+class TestValidateRefreshStale:
+    def test_validate_refresh_stale_days(self):
+        assert validation.validate_refresh_stale("1.5") == 1.5 * 24 * 60 * 60
+
+    @pytest.mark.parametrize("days", ["a week", "-1"])
+    def test_validate_refresh_stale_invalid(self, days):
+        with pytest.raises(ValueError):
+            validation.validate_refresh_stale(days)
+
+    def test_validate_metrics_port(self):
+        assert validation.validate_metrics_port("9464") == 9464
+
+    @pytest.mark.parametrize("port", ["http", "0", "70000"])
+    def test_validate_metrics_port_invalid(self, port):
+        with pytest.raises(ValueError):
+            validation.validate_metrics_port(port)
+
+class TestValidateAccountsFile:
+    def _args(self, **kwargs) -> Mock:
+        args = {"restore": None, "did": None, "handle": None, "accounts_file": "accounts.txt", "pipeline": False, "engine": "thread", "car": False, "archive": True, "compression": None, "output_format": "files", "like": True, "post": False, "repost": False}
+        args.update(kwargs)
+        return Mock(**args)
+
+    def test_validate_download_accounts_file(self):
+        mock_parser = Mock()
+        validation.validate_download(self._args(), mock_parser)
+        mock_parser.error.assert_not_called()
+
+    @pytest.mark.parametrize("kwargs", [{"handle": "bsky.app"}, {"did": "did:plc:z72i7hdynmk6r22z27h6tvur"}, {"engine": "async"}, {"restore": True}])
+    def test_validate_download_accounts_file_conflicts(self, kwargs):
+        mock_parser = Mock()
+        validation.validate_download(self._args(**kwargs), mock_parser)
+        mock_parser.error.assert_called()